@@ -2,14 +2,215 @@ from flask import Flask
 from flask_cors import CORS
 import os
 
-def create_app():
+from .backends import BackendPool
+from .budget import ContextBudget
+from .cache import TTLCache, invalidate_models
+from .cancellation import CancellationRegistry
+from .completion_cache import CompletionCache
+from .file_index import FileIndex
+from .file_serving import CompressedVariants
+from .images import ImageStore
+from .logging_setup import setup_logging
+from .metrics import register_app_metrics
+from .pulls import PullManager
+from .residency import ResidencyManager
+from .scheduler import Scheduler
+from .search import SearchIndex, ollama_embedder
+from .sessions import SessionStore
+from .storage import CodeStore
+from .validation import ValidationEngine
+
+def create_app(config=None):
     app = Flask(__name__)
     CORS(app)  # Enable CORS for all routes
+    if config:
+        app.config.update(config)
+    
+    # JSON-lines logging through a background writer; see logging_setup.py
+    app.config.setdefault('LOG_LEVEL', os.environ.get('LOG_LEVEL', 'INFO').upper())
+    app.config.setdefault('LOG_MAX_FIELD_LENGTH', int(os.environ.get('LOG_MAX_FIELD_LENGTH', 512)))
+    app.config.setdefault('LOG_DEBUG_SAMPLE_RATE', float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0)))
+    setup_logging(app)
     
     # Configure generated code directory
     app.config['GENERATED_CODE_DIR'] = os.path.join(os.path.dirname(app.root_path), 'generated_code')
     os.makedirs(app.config['GENERATED_CODE_DIR'], exist_ok=True)
     
+    # Saved code is kept by content hash, with per-file history; see storage.py
+    app.config.setdefault('CODE_STORE_DIR', os.environ.get('CODE_STORE_DIR', os.path.join(os.path.dirname(app.root_path), 'code_store')))
+    app.config.setdefault('CODE_STORE_LINK', os.environ.get('CODE_STORE_LINK', '0') == '1')
+    app.extensions['code_store'] = CodeStore(
+        app.config['GENERATED_CODE_DIR'],
+        app.config['CODE_STORE_DIR'],
+        link=app.config['CODE_STORE_LINK']
+    )
+    
+    # Configure the shared Ollama client; OLLAMA_API may list several comma-separated servers
+    app.config.setdefault('OLLAMA_API', os.environ.get('OLLAMA_API', 'http://localhost:11434'))
+    app.config.setdefault('OLLAMA_POOL_SIZE', int(os.environ.get('OLLAMA_POOL_SIZE', 32)))
+    app.config.setdefault('OLLAMA_RETRIES', int(os.environ.get('OLLAMA_RETRIES', 3)))
+    app.config.setdefault('OLLAMA_TIMEOUTS', {})
+    app.config.setdefault('OLLAMA_HEALTH_INTERVAL', float(os.environ.get('OLLAMA_HEALTH_INTERVAL', 10)))
+    backend_urls = [url.strip() for url in app.config['OLLAMA_API'].split(',') if url.strip()]
+    if not backend_urls:
+        raise ValueError("OLLAMA_API must name at least one Ollama server")
+    app.extensions['ollama'] = BackendPool(
+        backend_urls,
+        health_interval=app.config['OLLAMA_HEALTH_INTERVAL'],
+        pool_size=app.config['OLLAMA_POOL_SIZE'],
+        timeouts=app.config['OLLAMA_TIMEOUTS'],
+        retries=app.config['OLLAMA_RETRIES']
+    )
+    if len(backend_urls) > 1:
+        app.extensions['ollama'].start()
+    
+    # Cache model listings; pulls invalidate them explicitly
+    app.config.setdefault('MODEL_CACHE_TTL', float(os.environ.get('MODEL_CACHE_TTL', 30)))
+    app.config.setdefault('MODEL_CACHE_STALE_TTL', float(os.environ.get('MODEL_CACHE_STALE_TTL', 300)))
+    app.extensions['model_cache'] = TTLCache(
+        ttl=app.config['MODEL_CACHE_TTL'],
+        stale_ttl=app.config['MODEL_CACHE_STALE_TTL']
+    )
+    
+    # Model pulls run as background jobs; finished pulls refresh the model cache
+    app.config.setdefault('PULL_WORKERS', int(os.environ.get('PULL_WORKERS', 2)))
+    model_cache = app.extensions['model_cache']
+    app.extensions['pulls'] = PullManager(
+        app.extensions['ollama'],
+        max_workers=app.config['PULL_WORKERS'],
+        on_success=lambda model: invalidate_models(model_cache, model)
+    )
+    
+    # Admission control for generations sent to Ollama
+    app.config.setdefault('SCHEDULER_MAX_CONCURRENT', int(os.environ.get('SCHEDULER_MAX_CONCURRENT', 2)))
+    app.config.setdefault('SCHEDULER_MAX_PER_MODEL', int(os.environ.get('SCHEDULER_MAX_PER_MODEL', 2)))
+    app.config.setdefault('SCHEDULER_MAX_QUEUE', int(os.environ.get('SCHEDULER_MAX_QUEUE', 64)))
+    app.config.setdefault('SCHEDULER_QUEUE_TIMEOUT', float(os.environ.get('SCHEDULER_QUEUE_TIMEOUT', 300)))
+    app.extensions['scheduler'] = Scheduler(
+        max_concurrent=app.config['SCHEDULER_MAX_CONCURRENT'],
+        max_per_model=app.config['SCHEDULER_MAX_PER_MODEL'],
+        max_queue=app.config['SCHEDULER_MAX_QUEUE']
+    )
+    
+    # Server-side chat sessions for /chat_sessions
+    app.config.setdefault('SESSION_TOKEN_BUDGET', int(os.environ.get('SESSION_TOKEN_BUDGET', 3072)))
+    app.config.setdefault('SESSION_SUMMARIZE', os.environ.get('SESSION_SUMMARIZE', '0') == '1')
+    app.config.setdefault('SESSION_MAX', int(os.environ.get('SESSION_MAX', 1000)))
+    app.config.setdefault('SESSION_IDLE_TTL', float(os.environ.get('SESSION_IDLE_TTL', 3600)))
+    app.extensions['sessions'] = SessionStore(
+        max_sessions=app.config['SESSION_MAX'],
+        idle_ttl=app.config['SESSION_IDLE_TTL']
+    )
+    
+    # Bulk generation through /batch_generate
+    app.config.setdefault('BATCH_DIR', os.environ.get('BATCH_DIR', os.path.join(os.path.dirname(app.root_path), 'batches')))
+    app.config.setdefault('BATCH_CONCURRENCY', int(os.environ.get('BATCH_CONCURRENCY', 2)))
+    app.config.setdefault('BATCH_MAX_CONCURRENCY', int(os.environ.get('BATCH_MAX_CONCURRENCY', 16)))
+    
+    # One prompt fanned out to several models through /compare
+    app.config.setdefault('COMPARE_MAX_MODELS', int(os.environ.get('COMPARE_MAX_MODELS', 8)))
+    
+    # Opt-in cache for deterministic completions (temperature 0 or fixed seed)
+    app.config.setdefault('COMPLETION_CACHE_ENABLED', os.environ.get('COMPLETION_CACHE_ENABLED', '0') == '1')
+    app.config.setdefault('COMPLETION_CACHE_MAX_BYTES', int(os.environ.get('COMPLETION_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+    app.config.setdefault('COMPLETION_CACHE_PATH', os.environ.get('COMPLETION_CACHE_PATH'))
+    app.config.setdefault('COMPLETION_CACHE_DISK_MAX_BYTES', int(os.environ.get('COMPLETION_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024)))
+    if app.config['COMPLETION_CACHE_ENABLED']:
+        app.extensions['completion_cache'] = CompletionCache(
+            max_bytes=app.config['COMPLETION_CACHE_MAX_BYTES'],
+            path=app.config['COMPLETION_CACHE_PATH'],
+            max_disk_bytes=app.config['COMPLETION_CACHE_DISK_MAX_BYTES']
+        )
+    
+    # Uploaded images, processed once and referenced by id afterwards
+    app.config.setdefault('IMAGE_MAX_BYTES', int(os.environ.get('IMAGE_MAX_BYTES', 20 * 1024 * 1024)))
+    app.config.setdefault('IMAGE_MAX_SIDE', int(os.environ.get('IMAGE_MAX_SIDE', 1344)))
+    app.config.setdefault('IMAGE_CACHE_MAX_BYTES', int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 128 * 1024 * 1024)))
+    app.extensions['images'] = ImageStore(
+        max_bytes=app.config['IMAGE_CACHE_MAX_BYTES'],
+        max_upload_bytes=app.config['IMAGE_MAX_BYTES'],
+        max_side=app.config['IMAGE_MAX_SIDE']
+    )
+    
+    # Indexed listings of generated_code for /list_files and /list_generated_files
+    app.config.setdefault('FILE_INDEX_PATH', os.environ.get('FILE_INDEX_PATH'))
+    app.config.setdefault('FILE_INDEX_REFRESH_INTERVAL', float(os.environ.get('FILE_INDEX_REFRESH_INTERVAL', 2)))
+    app.config.setdefault('FILE_LIST_DEFAULT_LIMIT', int(os.environ.get('FILE_LIST_DEFAULT_LIMIT', 0)))
+    app.config.setdefault('FILE_LIST_MAX_LIMIT', int(os.environ.get('FILE_LIST_MAX_LIMIT', 1000)))
+    app.extensions['file_index'] = FileIndex(
+        app.config['GENERATED_CODE_DIR'],
+        refresh_interval=app.config['FILE_INDEX_REFRESH_INTERVAL'],
+        db_path=app.config['FILE_INDEX_PATH']
+    )
+    app.extensions['upload_index'] = FileIndex(
+        os.path.join(app.root_path, 'generated_code'),
+        refresh_interval=app.config['FILE_INDEX_REFRESH_INTERVAL'],
+        db_path=app.config['FILE_INDEX_PATH']
+    )
+    
+    # Compressed copies of served text files, made once per file version
+    app.config.setdefault('FILE_COMPRESSION_CACHE_DIR', os.environ.get('FILE_COMPRESSION_CACHE_DIR'))
+    app.extensions['compressed_files'] = CompressedVariants(app.config['FILE_COMPRESSION_CACHE_DIR'])
+    
+    # Keyword search over saved code, plus embedding search when a model is configured
+    app.config.setdefault('SEARCH_EMBED_MODEL', os.environ.get('SEARCH_EMBED_MODEL'))
+    app.config.setdefault('SEARCH_MAX_FILE_BYTES', int(os.environ.get('SEARCH_MAX_FILE_BYTES', 1024 * 1024)))
+    embed = None
+    if app.config['SEARCH_EMBED_MODEL']:
+        embed = ollama_embedder(app.extensions['ollama'], app.config['SEARCH_EMBED_MODEL'])
+    app.extensions['search'] = SearchIndex(
+        app.extensions['file_index'],
+        embed=embed,
+        max_file_bytes=app.config['SEARCH_MAX_FILE_BYTES']
+    )
+    
+    # Syntax checks for /check_files
+    app.config.setdefault('VALIDATION_WORKERS', int(os.environ.get('VALIDATION_WORKERS', 2)))
+    app.config.setdefault('VALIDATION_TIMEOUT', float(os.environ.get('VALIDATION_TIMEOUT', 5)))
+    app.extensions['validation'] = ValidationEngine(
+        workers=app.config['VALIDATION_WORKERS'],
+        timeout=app.config['VALIDATION_TIMEOUT']
+    )
+    
+    # Keep chosen models loaded in Ollama and unload idle ones over the memory budget
+    app.config.setdefault('RESIDENCY_HOT_MODELS', os.environ.get('RESIDENCY_HOT_MODELS', ''))
+    app.config.setdefault('RESIDENCY_KEEP_ALIVE', os.environ.get('RESIDENCY_KEEP_ALIVE', '5m'))
+    app.config.setdefault('RESIDENCY_HOT_KEEP_ALIVE', os.environ.get('RESIDENCY_HOT_KEEP_ALIVE', '-1'))
+    app.config.setdefault('RESIDENCY_MEMORY_BUDGET', int(os.environ.get('RESIDENCY_MEMORY_BUDGET', 0)))
+    app.config.setdefault('RESIDENCY_CHECK_INTERVAL', float(os.environ.get('RESIDENCY_CHECK_INTERVAL', 30)))
+    hot_models = [name.strip() for name in app.config['RESIDENCY_HOT_MODELS'].split(',') if name.strip()]
+    scheduler = app.extensions['scheduler']
+    app.extensions['residency'] = ResidencyManager(
+        app.extensions['ollama'],
+        hot_models=hot_models,
+        keep_alive=app.config['RESIDENCY_KEEP_ALIVE'],
+        hot_keep_alive=app.config['RESIDENCY_HOT_KEEP_ALIVE'],
+        memory_budget=app.config['RESIDENCY_MEMORY_BUDGET'] or None,
+        check_interval=app.config['RESIDENCY_CHECK_INTERVAL'],
+        busy=lambda model: scheduler.stats()['running_by_model'].get(model, 0) > 0
+    )
+    if hot_models or app.config['RESIDENCY_MEMORY_BUDGET']:
+        app.extensions['residency'].start()
+    
+    # Generations in flight, so they can be stopped by request id or when the client hangs up
+    app.extensions['cancellation'] = CancellationRegistry()
+    
+    # Size num_ctx to each prompt and trim or reject prompts the model cannot take; see budget.py
+    app.config.setdefault('BUDGET_ENABLED', os.environ.get('BUDGET_ENABLED', '1') == '1')
+    app.config.setdefault('BUDGET_MAX_NUM_CTX', int(os.environ.get('BUDGET_MAX_NUM_CTX', 8192)))
+    app.config.setdefault('BUDGET_RESERVE_TOKENS', int(os.environ.get('BUDGET_RESERVE_TOKENS', 1024)))
+    app.config.setdefault('BUDGET_IMAGE_TOKENS', int(os.environ.get('BUDGET_IMAGE_TOKENS', 768)))
+    app.config.setdefault('BUDGET_OVERFLOW', os.environ.get('BUDGET_OVERFLOW', 'trim'))
+    if app.config['BUDGET_ENABLED']:
+        app.extensions['budget'] = ContextBudget(
+            max_num_ctx=app.config['BUDGET_MAX_NUM_CTX'],
+            reserve_tokens=app.config['BUDGET_RESERVE_TOKENS'],
+            image_tokens=app.config['BUDGET_IMAGE_TOKENS'],
+            overflow=app.config['BUDGET_OVERFLOW']
+        )
+    
+    register_app_metrics(app)
+    
     # Register routes
     from . import routes
     app.register_blueprint(routes.bp)
@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+
+import requests
+
+from .ollama_client import OllamaClient
+from .residency import parse_keep_alive
+
+logger = logging.getLogger(__name__)
+
+
+class Backend:
+    """One Ollama server in the pool and what we last learned about it."""
+
+    def __init__(self, client):
+        self.client = client
+        self.url = client.base_url
+        self.healthy = True
+        self.outstanding = 0
+        self.available_models = set()
+        self.loaded_models = set()
+        self.last_check = None
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "available_models": sorted(self.available_models),
+            "loaded_models": sorted(self.loaded_models),
+            "last_error": self.last_error
+        }
+
+
+def request_model(kwargs):
+    """Find the model a request is about, if any, from its JSON body or query."""
+    body = kwargs.get('json') or {}
+    params = kwargs.get('params') or {}
+    return body.get('model') or body.get('name') or params.get('name')
+
+
+class BackendPool:
+    """Routes Ollama calls across several servers.
+
+    Exposes the same get/post interface as OllamaClient. Requests for a model
+    go to a healthy backend that already has it loaded (per /api/ps), then
+    to one that has it installed (per /api/tags), then to whichever has the
+    fewest outstanding requests. Connection failures mark the backend
+    unhealthy and fail over to the next candidate; a background thread
+    probes every backend so recovered servers rejoin the pool.
+    """
+
+    def __init__(self, urls, health_interval=10, **client_options):
+        self.backends = [Backend(OllamaClient(url, **client_options)) for url in urls]
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return self.backends[0].url
+
+    def probe(self, backend):
+        """Health-check a backend the same way /check_ollama does, and refresh its model sets."""
+        try:
+            response = backend.client.get("/api/tags", timeout=5)
+            if response.status_code != 200:
+                raise requests.exceptions.RequestException("Ollama is not responding correctly")
+            available = {m.get('name') for m in response.json().get('models', [])}
+
+            loaded = set()
+            ps_response = backend.client.get("/api/ps", timeout=5)
+            if ps_response.status_code == 200:
+                loaded = {m.get('name') for m in ps_response.json().get('models', [])}
+
+            with self._lock:
+                backend.healthy = True
+                backend.available_models = available
+                backend.loaded_models = loaded
+                backend.last_error = None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._lock:
+                backend.healthy = False
+                backend.last_error = str(e)
+        finally:
+            backend.last_check = time.time()
+        return backend.healthy
+
+    def check_all(self):
+        for backend in self.backends:
+            self.probe(backend)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_all()
+
+    def start(self):
+        """Probe every backend now and keep probing in the background."""
+        self.check_all()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._health_loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def candidates(self, model=None):
+        """Backends in the order a request for `model` should try them."""
+        with self._lock:
+            healthy = [b for b in self.backends if b.healthy]
+            # If every backend looks down, try them anyway rather than fail outright
+            pool = healthy or list(self.backends)
+
+            def rank(backend):
+                return (
+                    model not in backend.loaded_models,
+                    model not in backend.available_models,
+                    backend.outstanding
+                )
+            return sorted(pool, key=rank) if model else sorted(pool, key=lambda b: b.outstanding)
+
+    def backend_for(self, url):
+        """The healthy backend at `url`, or None if it is unknown or down."""
+        with self._lock:
+            for backend in self.backends:
+                if backend.url == url and backend.healthy:
+                    return backend
+        return None
+
+    def _release(self, backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def request(self, method, path, backend=None, **kwargs):
+        """Send a request to the best backend, failing over on connection errors.
+
+        Passing `backend` pins the request to that server. For streamed
+        responses the backend counts as busy until the response is closed.
+        """
+        candidates = [backend] if backend else self.candidates(request_model(kwargs))
+        last_error = None
+        for candidate in candidates:
+            with self._lock:
+                candidate.outstanding += 1
+            try:
+                response = candidate.client.request(method, path, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                self._release(candidate)
+                with self._lock:
+                    candidate.healthy = False
+                    candidate.last_error = str(e)
+                logger.warning("Backend %s unreachable, failing over: %s", candidate.url, e)
+                last_error = e
+                continue
+            except Exception:
+                self._release(candidate)
+                raise
+
+            response.backend = candidate
+            if not kwargs.get('stream'):
+                self._release(candidate)
+            else:
+                close = response.close
+                released = []
+
+                def close_and_release():
+                    if not released:
+                        released.append(True)
+                        self._release(candidate)
+                    close()
+                response.close = close_and_release
+
+            if method == 'POST' and response.status_code == 200:
+                # Later requests for this model should prefer this backend
+                model = request_model(kwargs)
+                with self._lock:
+                    # keep_alive 0 asks Ollama to unload the model
+                    if path in ('/api/generate', '/api/chat') and parse_keep_alive((kwargs.get('json') or {}).get('keep_alive')) != 0:
+                        candidate.loaded_models.add(model)
+                        candidate.available_models.add(model)
+                    elif path == '/api/pull':
+                        candidate.available_models.add(model)
+            return response
+
+        if last_error is None:
+            raise requests.exceptions.ConnectionError("no Ollama backend available")
+        raise last_error
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def broadcast(self, method, path, **kwargs):
+        """Send the same request to every healthy backend.
+
+        Returns the responses from the backends that could be reached and
+        raises ConnectionError only when none of them could.
+        """
+        responses = []
+        last_error = None
+        for backend in self.candidates():
+            try:
+                responses.append(self.request(method, path, backend=backend, **kwargs))
+            except requests.exceptions.ConnectionError as e:
+                last_error = e
+        if not responses and last_error is not None:
+            raise last_error
+        return responses
+
+    def status(self):
+        with self._lock:
+            return [backend.to_dict() for backend in self.backends]
+
+    def close(self):
+        self.stop()
+        for backend in self.backends:
+            backend.client.close()
+
@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+BATCH_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+def new_batch_id():
+    return uuid.uuid4().hex
+
+
+def parse_batch_items(lines):
+    """Yield batch items from JSONL lines, giving each one an id.
+
+    A line may be a JSON object with a "prompt" (plus optional "id", "model",
+    "type", "options" and "truncate") or a bare JSON string used as the prompt. Lines that
+    cannot be parsed are yielded with an "error" so they show up in results.
+    """
+    for index, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"id": str(index), "error": f"Invalid JSON: {str(e)}"}
+            continue
+        if isinstance(item, str):
+            item = {"prompt": item}
+        if not isinstance(item, dict) or not item.get('prompt'):
+            yield {"id": str(index), "error": "Each line needs a prompt"}
+            continue
+        item["id"] = str(item.get("id", index))
+        yield item
+
+
+class BatchJournal:
+    """Append-only record of a batch's results, used to resume after interruption."""
+
+    def __init__(self, directory, batch_id):
+        if not BATCH_ID_PATTERN.match(batch_id):
+            raise ValueError("Invalid batch id")
+        os.makedirs(directory, exist_ok=True)
+        self.batch_id = batch_id
+        self.path = os.path.join(directory, f"{batch_id}.jsonl")
+        self._lock = threading.Lock()
+
+    def completed_ids(self):
+        """Ids of items that already finished without an error."""
+        completed = set()
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn last line from an interrupted run
+                if 'error' not in result:
+                    completed.add(result.get('id'))
+        return completed
+
+    def record(self, result):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + "\n")
+
+
+def run_batch(items, worker, concurrency):
+    """Run `worker(item)` over `items` with at most `concurrency` in flight.
+
+    Results are yielded in completion order. Items are pulled from the
+    iterator only as slots free up, so arbitrarily large inputs are never
+    held in memory at once. Closing the generator cancels pending work.
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    pending = set()
+    items = iter(items)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < concurrency * 2:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(worker, item))
+
+            if not pending:
+                return
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class BatchStats:
+    """Aggregate throughput for a batch run."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.eval_count = 0
+        self.eval_duration = 0
+
+    def add(self, result):
+        if 'error' in result:
+            self.failed += 1
+            return
+        self.completed += 1
+        stats = result.get('stats', {})
+        self.eval_count += stats.get('eval_count', 0)
+        self.eval_duration += stats.get('eval_duration', 0)
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_seconds": elapsed,
+            "tokens_generated": self.eval_count,
+            "tokens_per_second": self.eval_count / elapsed if elapsed else 0.0,
+            "prompts_per_second": self.completed / elapsed if elapsed else 0.0,
+            # Per-stream decode speed, as opposed to aggregate wall-clock throughput
+            "model_tokens_per_second": self.eval_count / (self.eval_duration / 1e9) if self.eval_duration else 0.0
+        }
@@ -0,0 +1,238 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Ollama's context size when neither the Modelfile nor the request sets num_ctx
+DEFAULT_NUM_CTX = 2048
+# Tokens per message for the chat template's role markers
+MESSAGE_OVERHEAD = 4
+TRIM_MARKER = "\n\n[... {count} tokens trimmed ...]\n\n"
+
+# ASCII punctuation becomes a separator, so splitting leaves runs of letters and digits
+_SEPARATORS = str.maketrans({chr(c): ' ' for c in range(128) if not chr(c).isalnum()})
+
+
+def estimate_tokens(text):
+    """Approximate a BPE token count without a tokenizer.
+
+    Each run of letters and digits costs a token per six characters (at
+    least one), each ASCII symbol a token, and each non-ASCII character a
+    token, as CJK text roughly does. Whitespace is folded into the tokens
+    around it. Everything is done with C-level string methods, so a 100 KB
+    prompt takes a few milliseconds. The estimate errs high for plain prose
+    rather than low, since underestimating is what overflows the context.
+    """
+    if not text:
+        return 0
+    runs = text.translate(_SEPARATORS).split()
+    run_chars = 0
+    tokens = 0
+    for run in runs:
+        run_chars += len(run)
+        tokens += 1 + (len(run) - 1) // 6
+    whitespace = len(text) - len(''.join(text.split()))
+    tokens += len(text) - run_chars - whitespace
+    if not text.isascii():
+        non_ascii = len(text) - len(text.encode('ascii', 'ignore'))
+        # Non-ASCII characters were counted inside runs at a sixth of a token each
+        tokens += non_ascii - non_ascii // 6
+    return tokens
+
+
+def trim_middle(text, max_tokens):
+    """Cut the middle out of `text` until it fits in `max_tokens`; returns (text, tokens removed).
+
+    The start (instructions) and the end (the latest content) are what a
+    prompt usually cannot do without, so both are kept.
+    """
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text, 0
+    marker_tokens = estimate_tokens(TRIM_MARKER.format(count=tokens))
+    keep = int(len(text) * max(max_tokens - marker_tokens, 0) / tokens)
+    while True:
+        head_chars = keep // 2
+        tail_chars = keep - head_chars
+        head = text[:head_chars]
+        tail = text[len(text) - tail_chars:] if tail_chars else ''
+        kept = estimate_tokens(head) + estimate_tokens(tail)
+        trimmed = head + TRIM_MARKER.format(count=tokens - kept) + tail
+        if estimate_tokens(trimmed) <= max_tokens or keep == 0:
+            return trimmed, tokens - kept
+        keep = int(keep * 0.9)
+
+
+class ContextOverflow(Exception):
+    """A request that cannot fit the model's context window."""
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = 413
+        self.details = details
+
+
+class ModelLimits:
+    """What a model can take, read from Ollama's /api/show."""
+
+    __slots__ = ('context_length', 'num_ctx', 'vision')
+
+    def __init__(self, context_length=None, num_ctx=None, vision=False):
+        self.context_length = context_length
+        self.num_ctx = num_ctx
+        self.vision = vision
+
+    @classmethod
+    def from_show(cls, data):
+        context_length = None
+        for key, value in (data.get('model_info') or {}).items():
+            if key.endswith('.context_length') and isinstance(value, int):
+                context_length = value
+                break
+        num_ctx = None
+        # "parameters" is the Modelfile's PARAMETER lines, e.g. "num_ctx    8192\nstop ..."
+        for line in (data.get('parameters') or '').splitlines():
+            name, _, value = line.strip().partition(' ')
+            if name == 'num_ctx' and value.strip().isdigit():
+                num_ctx = int(value.strip())
+        families = (data.get('details') or {}).get('families') or []
+        vision = bool(data.get('projector_info')) or 'clip' in families or 'vision' in (data.get('capabilities') or [])
+        return cls(context_length, num_ctx, vision)
+
+    def to_dict(self):
+        return {"context_length": self.context_length, "num_ctx": self.num_ctx, "vision": self.vision}
+
+
+class BudgetPlan:
+    def __init__(self, num_ctx, input_tokens, image_tokens, reserve_tokens, limit, trimmed_tokens=0):
+        self.num_ctx = num_ctx
+        self.input_tokens = input_tokens
+        self.image_tokens = image_tokens
+        self.reserve_tokens = reserve_tokens
+        self.limit = limit
+        self.trimmed_tokens = trimmed_tokens
+
+    def to_dict(self):
+        return {
+            "num_ctx": self.num_ctx,
+            "estimated_tokens": self.input_tokens + self.image_tokens,
+            "reserved_for_output": self.reserve_tokens,
+            "limit": self.limit,
+            "trimmed_tokens": self.trimmed_tokens
+        }
+
+
+class ContextBudget:
+    """Fits each generation request to its model's context window.
+
+    The input's size is estimated with estimate_tokens(), plus a fixed cost
+    per image and room for the output (`num_predict`, or `reserve_tokens`).
+    If that exceeds the model's default context, num_ctx is raised to the
+    next power of two, but never past the model's trained context length or
+    `max_num_ctx`, which bounds prompt-eval time and KV cache memory.
+    Ollama reloads a model whenever num_ctx changes, so sticking to a few
+    sizes keeps the reloads rare. Inputs that still do not fit are trimmed
+    (`overflow='trim'`) or rejected with ContextOverflow.
+    """
+
+    def __init__(self, max_num_ctx=8192, reserve_tokens=1024, image_tokens=768, overflow='trim'):
+        self.max_num_ctx = max_num_ctx
+        self.reserve_tokens = reserve_tokens
+        self.image_tokens = image_tokens
+        self.overflow = overflow
+        self.planned = 0
+        self.trimmed = 0
+        self.rejected = 0
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def limits(self, digest, load_show):
+        """ModelLimits for a model digest; `load_show()` returns its /api/show data on a miss.
+
+        A digest names one exact build of a model, so its limits never change.
+        """
+        with self._lock:
+            limits = self._limits.get(digest)
+        if limits is None:
+            limits = ModelLimits.from_show(load_show())
+            with self._lock:
+                self._limits[digest] = limits
+        return limits
+
+    def _reserve(self, options):
+        num_predict = options.get('num_predict')
+        if isinstance(num_predict, int) and num_predict > 0:
+            return num_predict
+        return self.reserve_tokens
+
+    def _window(self, limits, options):
+        """(default num_ctx, largest num_ctx) for a request."""
+        requested = options.get('num_ctx')
+        if isinstance(requested, int) and requested > 0:
+            return requested, requested
+        default = limits.num_ctx or DEFAULT_NUM_CTX
+        ceiling = min(limits.context_length or default, self.max_num_ctx)
+        return default, max(ceiling, default)
+
+    def fit(self, request_data, limits, truncate=None):
+        """Set num_ctx on an Ollama request and make its input fit; returns the BudgetPlan.
+
+        Handles /api/generate requests (a `prompt`, which may be trimmed) and
+        /api/chat requests (`messages`, which are left to the session's own
+        trimming and rejected if they do not fit). `truncate` overrides the
+        overflow policy for this request.
+        """
+        options = request_data.get('options') or {}
+        default, ceiling = self._window(limits, options)
+        reserve = self._reserve(options)
+        images = len(request_data.get('images') or []) + sum(
+            len(m.get('images') or []) for m in request_data.get('messages') or [])
+        image_tokens = images * self.image_tokens
+        if 'messages' in request_data:
+            input_tokens = sum(estimate_tokens(m.get('content', '')) + MESSAGE_OVERHEAD
+                               for m in request_data['messages'])
+        else:
+            input_tokens = estimate_tokens(request_data.get('prompt', ''))
+
+        trimmed = 0
+        needed = input_tokens + image_tokens + reserve
+        if needed > ceiling:
+            available = ceiling - image_tokens - reserve
+            can_trim = 'prompt' in request_data and available > 0
+            if truncate is None:
+                truncate = self.overflow == 'trim'
+            if not (truncate and can_trim):
+                self.rejected += 1
+                raise ContextOverflow(
+                    f"Input is about {input_tokens + image_tokens} tokens, but the model can take "
+                    f"{max(ceiling - reserve, 0)} here with {reserve} kept for the reply",
+                    details={"estimated_tokens": input_tokens + image_tokens, "limit": ceiling,
+                             "reserved_for_output": reserve}
+                )
+            request_data['prompt'], trimmed = trim_middle(request_data['prompt'], available)
+            input_tokens = estimate_tokens(request_data['prompt'])
+            needed = input_tokens + image_tokens + reserve
+            self.trimmed += 1
+            logger.info("Trimmed prompt to fit the context window",
+                        extra={"model": request_data.get('model'), "trimmed_tokens": trimmed, "limit": ceiling})
+
+        num_ctx = None
+        if needed > default and 'num_ctx' not in options:
+            num_ctx = 1 << (needed - 1).bit_length()
+            num_ctx = max(min(num_ctx, ceiling), default)
+            request_data['options'] = {**options, "num_ctx": num_ctx}
+        self.planned += 1
+        return BudgetPlan(num_ctx or options.get('num_ctx') or default, input_tokens, image_tokens, reserve,
+                          ceiling, trimmed)
+
+    def stats(self):
+        return {
+            "planned": self.planned,
+            "trimmed": self.trimmed,
+            "rejected": self.rejected,
+            "max_num_ctx": self.max_num_ctx,
+            "reserve_tokens": self.reserve_tokens,
+            "image_tokens": self.image_tokens,
+            "overflow": self.overflow
+        }
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+# Cache key for the formatted /api/tags model list
+MODELS_CACHE_KEY = 'tags'
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """A cached JSON value along with its serialized body and ETag."""
+
+    def __init__(self, value):
+        self.value = value
+        self.body = json.dumps(value).encode('utf-8')
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.created = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.created
+
+
+class TTLCache:
+    """In-process cache with a TTL and stale-while-revalidate refresh.
+
+    Entries younger than `ttl` are served as-is. Entries older than `ttl` but
+    younger than `ttl + stale_ttl` are still served, while a background thread
+    reloads them. Anything older is reloaded synchronously. Concurrent misses
+    on the same key share a single load.
+    """
+
+    def __init__(self, ttl=30, stale_ttl=300):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _load(self, key, loader):
+        entry = CacheEntry(loader())
+        with self._lock:
+            self._entries[key] = entry
+        return entry
+
+    def _refresh(self, key, loader):
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            # Keep serving the stale entry; the next miss will retry
+            logger.warning("Background refresh of %s failed: %s", key, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key, loader):
+        """Return the CacheEntry for `key`, calling `loader()` to fill it if needed.
+
+        `loader` may be called from a background thread, so it must not depend
+        on the Flask request or application context.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None:
+            age = entry.age()
+            if age < self.ttl:
+                self.hits += 1
+                return entry
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                    start_refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                if start_refresh:
+                    thread = threading.Thread(target=self._refresh, args=(key, loader))
+                    thread.daemon = True
+                    thread.start()
+                return entry
+
+        with self._key_lock(key):
+            # Another request may have filled the entry while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and entry.age() < self.ttl:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return self._load(key, loader)
+
+    def invalidate(self, key=None):
+        """Drop `key`, or every entry when no key is given."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+def invalidate_models(cache, model=None):
+    """Drop cached model data after the set of installed models changes."""
+    cache.invalidate(MODELS_CACHE_KEY)
+    if model:
+        cache.invalidate(('show', model))
@@ -0,0 +1,282 @@
+import hmac
+import logging
+import selectors
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .metrics import GENERATIONS_CANCELLED
+
+logger = logging.getLogger(__name__)
+
+# Under gevent this is greenlet-local, which is what each request needs
+_local = threading.local()
+
+
+class Cancelled(Exception):
+    """A generation stopped before it finished; 499 is nginx's "client closed request"."""
+
+    def __init__(self, reason):
+        super().__init__(f"Generation cancelled ({reason})")
+        self.reason = reason
+        self.message = "Generation cancelled"
+        self.status_code = 499
+
+
+def shutdown_socket(sock):
+    """Wake any thread blocked reading `sock`; close() alone would leave it waiting."""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class CancelToken:
+    """One generation that can be stopped from another thread.
+
+    Ollama connections opened while the token is active (see `active()`) are
+    attached to it. `cancel()` shuts their sockets down, so a read blocked on
+    Ollama fails at once and Ollama, seeing the connection go, stops
+    generating. `owner` is the secret a client must present to cancel the
+    generation or see it listed.
+    """
+
+    def __init__(self, request_id, endpoint, model=None, client_socket=None, owner=None):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.model = model
+        self.client_socket = client_socket
+        self.owner = owner
+        self.started = time.time()
+        self.reason = None
+        self.finished = False
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def owned_by(self, owner):
+        return self.owner is not None and owner is not None and hmac.compare_digest(self.owner, owner)
+
+    def raise_if_cancelled(self):
+        if self.reason is not None:
+            raise Cancelled(self.reason)
+
+    def attach(self, connection, sock=None):
+        with self._lock:
+            self._connections[connection] = sock
+
+    def _shutdown(self, connections):
+        for connection, sock in connections:
+            # A pooled connection may since have been handed to another request
+            if getattr(connection, 'cancel_token', None) is not self:
+                continue
+            # For a response delimited by connection close, the connection has already
+            # dropped the socket the response is still reading from
+            sock = connection.sock or sock
+            if sock is not None:
+                shutdown_socket(sock)
+
+    def cancel(self, reason='client'):
+        """Stop the generation; False if it already finished or was cancelled."""
+        with self._lock:
+            if self.finished or self.reason is not None:
+                return False
+            self.reason = reason
+            connections = list(self._connections.items())
+        self._shutdown(connections)
+        GENERATIONS_CANCELLED.inc(endpoint=self.endpoint, reason=reason)
+        logger.info("Generation cancelled", extra={"cancelled_request_id": self.request_id, "reason": reason})
+        return True
+
+    def finish(self):
+        with self._lock:
+            self.finished = True
+            self._connections.clear()
+
+    def to_dict(self):
+        return {
+            "request_id": self.request_id,
+            "endpoint": self.endpoint,
+            "model": self.model,
+            "started": self.started,
+            "cancelled": self.cancelled,
+            "reason": self.reason
+        }
+
+
+@contextmanager
+def active(token):
+    """Attach Ollama connections used inside the block to `token`."""
+    previous = getattr(_local, 'token', None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+class CancellableConnectionMixin:
+    cancel_token = None
+
+    def request(self, *args, **kwargs):
+        token = self.cancel_token = getattr(_local, 'token', None)
+        if token is not None:
+            token.attach(self)
+        result = super().request(*args, **kwargs)
+        if token is not None:
+            token.attach(self, self.sock)
+            # A cancel that arrived while the socket was still connecting found nothing to shut down
+            if token.cancelled and self.sock is not None:
+                shutdown_socket(self.sock)
+        return result
+
+
+class CancellableHTTPConnection(CancellableConnectionMixin, HTTPConnection):
+    pass
+
+
+class CancellableHTTPSConnection(CancellableConnectionMixin, HTTPSConnection):
+    pass
+
+
+class CancellableHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = CancellableHTTPConnection
+
+
+class CancellableHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = CancellableHTTPSConnection
+
+
+class CancellableAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections a CancelToken can shut down."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CancellableHTTPConnectionPool,
+            'https': CancellableHTTPSConnectionPool
+        }
+
+
+def client_socket(environ):
+    """The client's socket from a WSGI environ, where the server exposes it."""
+    return environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+
+
+class CancellationRegistry:
+    """Generations in flight, by request id.
+
+    `register()` returns the CancelToken a route passes to the Ollama client,
+    and `cancel(request_id, owner)` stops it from another request that
+    presents the same owner secret; request ids alone are chosen by clients
+    and are not proof of anything. Given the
+    client's socket, a monitor thread also cancels the generation as soon as
+    the client hangs up, whether or not anything has been written to it yet.
+    """
+
+    def __init__(self, poll_interval=0.5):
+        self.poll_interval = poll_interval
+        self._tokens = {}
+        self._changes = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, request_id, endpoint, model=None, client_socket=None, owner=None):
+        token = CancelToken(request_id, endpoint, model, client_socket, owner)
+        with self._lock:
+            # A client reusing a running generation's id must not take it over
+            if request_id in self._tokens:
+                logger.warning("Request id already has a generation running; this one cannot be cancelled by id",
+                               extra={"cancelled_request_id": request_id})
+            else:
+                self._tokens[request_id] = token
+            if client_socket is not None:
+                self._changes.append((True, token))
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._monitor, daemon=True)
+                    self._thread.start()
+        self._wake.set()
+        return token
+
+    def finish(self, token):
+        token.finish()
+        with self._lock:
+            if self._tokens.get(token.request_id) is token:
+                del self._tokens[token.request_id]
+            if token.client_socket is not None:
+                self._changes.append((False, token))
+
+    def cancel(self, request_id, owner, reason='client'):
+        """Cancel `owner`'s generation by request id; returns its token, or None if `owner` has none running."""
+        with self._lock:
+            token = self._tokens.get(request_id)
+        if token is None or not token.owned_by(owner):
+            return None
+        token.cancel(reason)
+        return token
+
+    def active(self, owner=None):
+        """Generations in flight, or only those of `owner`."""
+        with self._lock:
+            tokens = list(self._tokens.values())
+        return [token.to_dict() for token in tokens if owner is None or token.owned_by(owner)]
+
+    def _apply_changes(self, selector):
+        with self._lock:
+            changes, self._changes = self._changes, []
+        for add, token in changes:
+            try:
+                if add:
+                    selector.register(token.client_socket, selectors.EVENT_READ, token)
+                else:
+                    selector.unregister(token.client_socket)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _monitor(self):
+        # Only this thread touches the selector; other threads queue changes
+        selector = selectors.DefaultSelector()
+        while not self._stop.is_set():
+            self._wake.clear()
+            self._apply_changes(selector)
+            if not selector.get_map():
+                self._wake.wait()
+                continue
+            try:
+                ready = selector.select(self.poll_interval)
+            except (OSError, ValueError):
+                # A socket was closed under us; drop it and carry on
+                for key in list(selector.get_map().values()):
+                    if key.fileobj.fileno() < 0:
+                        selector.unregister(key.fileobj)
+                continue
+            for key, _ in ready:
+                sock, token = key.fileobj, key.data
+                try:
+                    hung_up = sock.recv(1, socket.MSG_PEEK) == b''
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except ValueError:
+                    # TLS sockets cannot be peeked
+                    hung_up = False
+                except OSError:
+                    hung_up = True
+                # Either the client is gone or it sent its next request; stop watching both ways
+                selector.unregister(sock)
+                if hung_up:
+                    token.cancel('disconnect')
+        selector.close()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
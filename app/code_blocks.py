@@ -0,0 +1,170 @@
+import os
+import posixpath
+import re
+
+from .languages import canonical_language, detect_language, extension_for, language_for_filename
+
+# An opening fence: up to three spaces, then ``` or ~~~ and an info string
+FENCE_OPEN = re.compile(r'^ {0,3}(`{3,}|~{3,})[ \t]*([^`\n]*?)[ \t]*$')
+FILENAME = r'[\w][\w./-]*\.[A-Za-z][A-Za-z0-9]{0,9}'
+FILENAME_PATTERN = re.compile(f'^{FILENAME}$')
+INFO_FILENAME_KEYS = ('title', 'filename', 'file', 'path', 'name')
+# "Create `app.py`:", "**src/main.rs**", "### index.html": a name ending the line before a fence
+PROSE_FILENAME = re.compile(rf'({FILENAME})[`*"]*[ \t]*:?[ \t]*$')
+# "# app.py", "// filename: src/index.js", "<!-- index.html -->" as a block's first line
+COMMENT_FILENAME = re.compile(
+    rf'^[ \t]*(?:#|//|--|/\*|<!--|;)[ \t]*(?:(?:file(?:name)?|path)[ \t]*:[ \t]*)?({FILENAME})[ \t]*(?:\*/|-->)?[ \t]*$',
+    re.IGNORECASE
+)
+
+
+def safe_relative_path(name):
+    """Normalise a model-suggested file name to a relative path, or None if it escapes."""
+    name = posixpath.normpath(name.replace('\\', '/').strip().lstrip('/'))
+    if name in ('', '.') or name == '..' or name.startswith('../'):
+        return None
+    return name
+
+
+def parse_info_string(info):
+    """Split a fence info string into (language, filename).
+
+    Understands "python", "python app.py", "python:app.py", "app.py" and
+    "python title=app.py" (also filename=, file=, path=, name=).
+    """
+    language = filename = None
+    for word in info.split():
+        key, sep, value = word.partition('=')
+        if sep and key.lower() in INFO_FILENAME_KEYS:
+            filename = value.strip('\'"')
+            continue
+        if language is None and filename is None and ':' in word:
+            word, _, name = word.partition(':')
+            if FILENAME_PATTERN.match(name):
+                filename = name
+        if FILENAME_PATTERN.match(word):
+            filename = filename or word
+        elif language is None:
+            language = word
+    return language, filename
+
+
+class CodeBlock:
+    def __init__(self, index, info_language=None, filename=None):
+        self.index = index
+        self.info_language = info_language
+        self.filename = filename
+        self.named = filename is not None
+        self.language = canonical_language(info_language) or (language_for_filename(filename) if filename else None)
+        self.lines = []
+        self.complete = False
+
+    @property
+    def content(self):
+        return '\n'.join(self.lines) + '\n' if self.lines else ''
+
+    def finish(self, complete, taken):
+        """Settle the language and a file name not in `taken` once the block has ended."""
+        self.complete = complete
+        if self.filename is None and self.lines:
+            match = COMMENT_FILENAME.match(self.lines[0])
+            if match:
+                self.filename = match.group(1)
+        if self.filename is not None:
+            self.filename = safe_relative_path(self.filename)
+            self.named = self.filename is not None
+        if self.language is None:
+            by_name = language_for_filename(self.filename) if self.filename else None
+            self.language = by_name or detect_language(self.content, hint=self.info_language).language
+        if self.filename is None:
+            self.filename = f"block_{self.index + 1}{extension_for(self.language)}"
+
+        base, extension = os.path.splitext(self.filename)
+        candidate, n = self.filename, 2
+        while candidate in taken:
+            candidate, n = f"{base}_{n}{extension}", n + 1
+        self.filename = candidate
+        taken.add(candidate)
+
+    def header(self):
+        return {"index": self.index, "language": self.language, "filename": self.filename}
+
+    def to_dict(self):
+        return {**self.header(), "named": self.named, "complete": self.complete, "content": self.content}
+
+
+class CodeBlockParser:
+    """Splits model output into fenced code blocks as it arrives.
+
+    `feed()` takes text in chunks of any size and returns (event, block)
+    pairs: ('start', block) once an opening fence line is complete and
+    ('end', block) once its closing fence is. `close()` ends the output,
+    finishing a block the model never closed (with `complete` False).
+    Each line is looked at once, so a whole response costs one pass.
+    """
+
+    def __init__(self):
+        self.blocks = []
+        self._buffer = ''
+        self._block = None
+        self._fence = None
+        self._previous_line = ''
+        self._names = set()
+
+    def feed(self, text):
+        self._buffer += text
+        if '\n' not in self._buffer:
+            return []
+        *lines, self._buffer = self._buffer.split('\n')
+        events = []
+        for line in lines:
+            self._line(line.rstrip('\r'), events)
+        return events
+
+    def close(self):
+        events = []
+        if self._buffer:
+            self._line(self._buffer.rstrip('\r'), events)
+            self._buffer = ''
+        if self._block is not None:
+            self._end(False, events)
+        return events
+
+    def _line(self, line, events):
+        if self._block is None:
+            match = FENCE_OPEN.match(line)
+            if not match:
+                if line.strip():
+                    self._previous_line = line
+                return
+            language, filename = parse_info_string(match.group(2))
+            if filename is None:
+                hint = PROSE_FILENAME.search(self._previous_line)
+                filename = hint.group(1) if hint else None
+            self._fence = match.group(1)
+            self._block = CodeBlock(len(self.blocks), language, filename)
+            self._previous_line = ''
+            events.append(('start', self._block))
+            return
+
+        stripped = line.strip()
+        if (len(line) - len(line.lstrip(' ')) <= 3 and stripped.startswith(self._fence)
+                and stripped == stripped[0] * len(stripped)):
+            self._end(True, events)
+        else:
+            self._block.lines.append(line)
+
+    def _end(self, complete, events):
+        block, self._block = self._block, None
+        block.finish(complete, self._names)
+        self.blocks.append(block)
+        events.append(('end', block))
+
+
+def split_code_blocks(text):
+    """All fenced code blocks in a complete model response."""
+    parser = CodeBlockParser()
+    parser.feed(text)
+    parser.close()
+    return parser.blocks
+
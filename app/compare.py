@@ -0,0 +1,106 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_FINISHED = object()
+
+
+def multiplex(sources):
+    """Drain several frame iterators at once, yielding frames in arrival order.
+
+    `sources` maps a channel name to a zero-argument callable returning an
+    iterable of frames. Each source runs on its own thread, so a slow model
+    never holds back a fast one. A source that raises is logged and ends its
+    channel; the others carry on.
+    """
+    frames = queue.Queue()
+
+    def drain(name, source):
+        try:
+            for frame in source():
+                frames.put(frame)
+        except Exception:
+            logger.exception("Comparison channel %s failed", name)
+        finally:
+            frames.put(_FINISHED)
+
+    for name, source in sources.items():
+        threading.Thread(target=drain, args=(name, source), daemon=True, name=f'compare-{name}').start()
+
+    remaining = len(sources)
+    while remaining:
+        frame = frames.get()
+        if frame is _FINISHED:
+            remaining -= 1
+        else:
+            yield frame
+
+
+def span(start, end):
+    return end - start if start is not None and end is not None else None
+
+
+class ModelRun:
+    """One model's answer in a comparison, with its timings.
+
+    Times are monotonic: `submitted` when the prompt entered the queue,
+    `admitted` when the scheduler gave it a slot, `sent` when the request
+    went to Ollama, then the first token and the end of the generation.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.submitted = time.monotonic()
+        self.admitted = None
+        self.sent = None
+        self.first_token = None
+        self.finished = None
+        self.response = ''
+        self.stats = {}
+        self.blocks = []
+        self.error = None
+
+    def done(self, text, stats):
+        self.finished = time.monotonic()
+        self.response = text
+        self.stats = stats
+
+    def metrics(self):
+        load_duration = self.stats.get('load_duration')
+        return {
+            "model": self.model,
+            "ok": self.error is None and self.finished is not None,
+            "error": self.error,
+            "queue_seconds": span(self.submitted, self.admitted),
+            "ttft_seconds": span(self.sent, self.first_token),
+            "generation_seconds": span(self.sent, self.finished),
+            "latency_seconds": span(self.submitted, self.finished),
+            "load_seconds": load_duration / 1e9 if load_duration is not None else None,
+            "eval_count": self.stats.get('eval_count'),
+            "tokens_per_second": self.stats.get('tokens_per_second')
+        }
+
+    def to_dict(self):
+        return {**self.metrics(), "response": self.response, "stats": self.stats}
+
+
+def rank(runs):
+    """The best model by each measure, among the runs that finished."""
+    finished = [run.metrics() for run in runs]
+    finished = [m for m in finished if m["ok"]]
+
+    def best(key, reverse=False):
+        values = [m for m in finished if m[key] is not None]
+        if not values:
+            return None
+        pick = max if reverse else min
+        return pick(values, key=lambda m: m[key])["model"]
+
+    return {
+        "ttft": best("ttft_seconds"),
+        "latency": best("latency_seconds"),
+        "tokens_per_second": best("tokens_per_second", reverse=True)
+    }
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def is_deterministic(options):
+    """Whether Ollama will return the same completion for the same input."""
+    options = options or {}
+    return options.get('temperature') == 0 or options.get('seed') is not None
+
+
+def completion_key(model_digest, prompt, images=None, options=None):
+    """Hash everything that influences a completion into a cache key."""
+    h = hashlib.sha256()
+    h.update(model_digest.encode('utf-8'))
+    h.update(b'\0')
+    h.update(prompt.encode('utf-8'))
+    for image in images or []:
+        h.update(b'\0')
+        h.update(hashlib.sha256(image.encode('utf-8')).digest())
+    h.update(b'\0')
+    h.update(json.dumps(options or {}, sort_keys=True).encode('utf-8'))
+    return h.hexdigest()
+
+
+class CompletionCache:
+    """LRU cache of completions, bounded by the total size of stored bodies.
+
+    When `path` is given, entries are also written to a SQLite file so they
+    survive restarts; memory misses fall through to disk and are promoted.
+    The file is capped at `max_disk_bytes` of stored bodies, deleting the
+    oldest rows first when an insert goes over.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, path=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_size = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions "
+                "(key TEXT PRIMARY KEY, body BLOB NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_created ON completions (created)")
+            self._db.commit()
+            self._disk_size = self._db.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM completions").fetchone()[0]
+
+    def _remember(self, key, body):
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._entries[key] = body
+        self._size += len(body)
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def _trim_disk(self):
+        excess = self._disk_size - self.max_disk_bytes
+        if excess <= 0:
+            return
+        doomed = []
+        rows = self._db.execute("SELECT key, LENGTH(body) FROM completions ORDER BY created")
+        for key, size in rows:
+            doomed.append((key,))
+            excess -= size
+            self._disk_size -= size
+            if excess <= 0:
+                break
+        rows.close()
+        self._db.executemany("DELETE FROM completions WHERE key = ?", doomed)
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT body FROM completions WHERE key = ?", (key,)).fetchone()
+                if row:
+                    body = bytes(row[0])
+                    self._remember(key, body)
+
+            if body is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(body)
+
+    def put(self, key, value):
+        body = json.dumps(value).encode('utf-8')
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._remember(key, body)
+            if self._db is not None:
+                row = self._db.execute("SELECT LENGTH(body) FROM completions WHERE key = ?", (key,)).fetchone()
+                if row:
+                    self._disk_size -= row[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO completions (key, body, created) VALUES (?, ?, ?)",
+                    (key, body, time.time())
+                )
+                self._disk_size += len(body)
+                self._trim_disk()
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "disk_bytes": self._disk_size,
+                "max_disk_bytes": self.max_disk_bytes,
+                "persistent": self._db is not None
+            }
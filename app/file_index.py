@@ -0,0 +1,266 @@
+import os
+import sqlite3
+import threading
+import time
+
+SORT_FIELDS = ('path', 'name', 'type', 'size', 'modified')
+
+
+class FileEntry:
+    __slots__ = ('path', 'dir', 'name', 'type', 'size', 'modified')
+
+    def __init__(self, path, size, modified):
+        self.path = path
+        self.dir, self.name = os.path.split(path)
+        self.type = os.path.splitext(self.name)[1][1:] or 'txt'
+        self.size = size
+        self.modified = modified
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'type': self.type,
+            'size': self.size,
+            'modified': self.modified
+        }
+
+
+class FileIndex:
+    """In-memory catalogue of the files under `root`, kept current by mtime checks.
+
+    A refresh stats every directory but only lists the ones whose mtime
+    changed, since creating, deleting or renaming a file bumps its parent
+    directory's mtime. The app's own writes are recorded with `touch()`
+    instead, which updates their entries and the directory's mtime directly;
+    it also covers files rewritten in place, which leave the mtime alone.
+    An outside change to a directory just before the app writes to it is
+    then only seen by a forced refresh. Refreshes run at most once per
+    `refresh_interval` seconds. When `db_path` is given the index is also
+    kept in SQLite, so a restart only rescans the directories that changed
+    while the app was down.
+    """
+
+    def __init__(self, root, refresh_interval=2.0, db_path=None):
+        self.root = os.path.abspath(root)
+        self.refresh_interval = refresh_interval
+        self.version = 0
+        self._files = {}
+        self._dir_files = {}
+        self._dir_mtimes = {}
+        self._subdirs = {}
+        self._sorted = {}
+        self._checked = None
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS indexed_dirs "
+                "(root TEXT NOT NULL, path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, PRIMARY KEY (root, path))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS indexed_files "
+                "(root TEXT NOT NULL, path TEXT NOT NULL, dir TEXT NOT NULL, size INTEGER NOT NULL, "
+                "modified REAL NOT NULL, PRIMARY KEY (root, path))"
+            )
+            self._db.commit()
+            self._load()
+
+    def _load(self):
+        for path, mtime_ns in self._db.execute(
+                "SELECT path, mtime_ns FROM indexed_dirs WHERE root = ?", (self.root,)):
+            self._dir_mtimes[path] = mtime_ns
+            self._dir_files.setdefault(path, set())
+            if path:
+                self._subdirs.setdefault(os.path.dirname(path), set()).add(path)
+        for path, directory, size, modified in self._db.execute(
+                "SELECT path, dir, size, modified FROM indexed_files WHERE root = ?", (self.root,)):
+            self._files[path] = FileEntry(path, size, modified)
+            self._dir_files.setdefault(directory, set()).add(path)
+
+    def _forget_dir(self, rel_dir):
+        for path in self._dir_files.pop(rel_dir, ()):
+            self._files.pop(path, None)
+        self._dir_mtimes.pop(rel_dir, None)
+        for subdir in self._subdirs.pop(rel_dir, ()):
+            self._forget_dir(subdir)
+        if self._db is not None:
+            self._db.execute("DELETE FROM indexed_files WHERE root = ? AND dir = ?", (self.root, rel_dir))
+            self._db.execute("DELETE FROM indexed_dirs WHERE root = ? AND path = ?", (self.root, rel_dir))
+
+    def _list_dir(self, rel_dir, mtime_ns):
+        files = {}
+        subdirs = set()
+        with os.scandir(os.path.join(self.root, rel_dir)) as it:
+            for entry in it:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(rel_path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        files[rel_path] = FileEntry(rel_path, stat.st_size, stat.st_mtime)
+                except FileNotFoundError:
+                    continue  # Removed while we were listing
+
+        for path in self._dir_files.get(rel_dir, set()) - set(files):
+            self._files.pop(path, None)
+        for subdir in self._subdirs.get(rel_dir, set()) - subdirs:
+            self._forget_dir(subdir)
+        self._files.update(files)
+        self._dir_files[rel_dir] = set(files)
+        self._subdirs[rel_dir] = subdirs
+        self._dir_mtimes[rel_dir] = mtime_ns
+
+        if self._db is not None:
+            self._db.execute("DELETE FROM indexed_files WHERE root = ? AND dir = ?", (self.root, rel_dir))
+            self._db.executemany(
+                "INSERT INTO indexed_files (root, path, dir, size, modified) VALUES (?, ?, ?, ?, ?)",
+                [(self.root, f.path, rel_dir, f.size, f.modified) for f in files.values()]
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO indexed_dirs (root, path, mtime_ns) VALUES (?, ?, ?)",
+                (self.root, rel_dir, mtime_ns)
+            )
+
+    def _scan(self):
+        changed = False
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            try:
+                mtime_ns = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+            except FileNotFoundError:
+                if rel_dir in self._dir_mtimes:
+                    self._forget_dir(rel_dir)
+                    changed = True
+                continue
+            if self._dir_mtimes.get(rel_dir) != mtime_ns:
+                try:
+                    self._list_dir(rel_dir, mtime_ns)
+                except FileNotFoundError:
+                    self._forget_dir(rel_dir)
+                changed = True
+            pending.extend(self._subdirs.get(rel_dir, ()))
+        return changed
+
+    def refresh(self, force=False):
+        """Bring the index up to date; `force` re-lists every directory."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._checked is not None and now - self._checked < self.refresh_interval:
+                return
+            if force:
+                self._dir_mtimes.clear()
+            changed = self._scan()
+            self._checked = now
+            if changed:
+                self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._sorted.clear()
+        if self._db is not None:
+            self._db.commit()
+
+    def touch(self, *paths):
+        """Record files the app has just written, without re-listing their directories.
+
+        Each file is stat'ed and added or updated directly, and its
+        directory's new mtime is recorded, so the next refresh does not take
+        the app's own write for an outside change and re-list the directory.
+        A file in a directory the index has not listed yet is left to the
+        next refresh. Returns the index version before and after, so a
+        caller that was in step with the index can stay in step.
+        """
+        with self._lock:
+            before = self.version
+            touched = False
+            for path in paths:
+                rel_path = os.path.relpath(os.path.abspath(path), self.root)
+                if rel_path.startswith(os.pardir):
+                    continue
+                rel_dir = os.path.dirname(rel_path)
+                if rel_dir not in self._dir_mtimes:
+                    self._checked = None
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root, rel_path))
+                    dir_mtime_ns = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+                except FileNotFoundError:
+                    self._checked = None
+                    continue
+                entry = self._files[rel_path] = FileEntry(rel_path, stat.st_size, stat.st_mtime)
+                self._dir_files.setdefault(rel_dir, set()).add(rel_path)
+                self._dir_mtimes[rel_dir] = dir_mtime_ns
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO indexed_files (root, path, dir, size, modified) VALUES (?, ?, ?, ?, ?)",
+                        (self.root, rel_path, rel_dir, entry.size, entry.modified)
+                    )
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO indexed_dirs (root, path, mtime_ns) VALUES (?, ?, ?)",
+                        (self.root, rel_dir, dir_mtime_ns)
+                    )
+                touched = True
+            if touched:
+                self._changed()
+            return before, self.version
+
+    def get(self, path):
+        """The entry for a path relative to the root, or None."""
+        with self._lock:
+            return self._files.get(path)
+
+    def _sorted_entries(self, sort, descending):
+        key = (sort, descending)
+        entries = self._sorted.get(key)
+        if entries is None:
+            entries = sorted(
+                self._files.values(),
+                key=lambda entry: (getattr(entry, sort), entry.path),
+                reverse=descending
+            )
+            self._sorted[key] = entries
+        return entries
+
+    def query(self, file_type=None, name=None, min_size=None, max_size=None,
+              modified_after=None, modified_before=None,
+              sort='path', descending=False, offset=0, limit=None):
+        """Return one page of matching entries and the total number of matches."""
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort by {sort}; use one of {', '.join(SORT_FIELDS)}")
+        self.refresh()
+        with self._lock:
+            entries = self._sorted_entries(sort, descending)
+
+        filters = []
+        if file_type:
+            types = {t.strip().lstrip('.').lower() for t in file_type.split(',')}
+            filters.append(lambda e: e.type.lower() in types)
+        if name:
+            needle = name.lower()
+            filters.append(lambda e: needle in e.name.lower())
+        if min_size is not None:
+            filters.append(lambda e: e.size >= min_size)
+        if max_size is not None:
+            filters.append(lambda e: e.size <= max_size)
+        if modified_after is not None:
+            filters.append(lambda e: e.modified >= modified_after)
+        if modified_before is not None:
+            filters.append(lambda e: e.modified <= modified_before)
+        if filters:
+            entries = [e for e in entries if all(f(e) for f in filters)]
+
+        end = None if limit is None else offset + limit
+        return entries[offset:end], len(entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "root": self.root,
+                "files": len(self._files),
+                "directories": len(self._dir_mtimes),
+                "version": self.version
+            }
@@ -0,0 +1,176 @@
+import glob
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+try:
+    import brotli
+except ImportError:  # Text is served with gzip only
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+# Compressing tiny files costs more than it saves
+MIN_COMPRESS_BYTES = 1024
+# How long a superseded variant stays on disk for requests that already picked it
+STALE_VARIANT_GRACE = 60
+TEXT_MIMETYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+
+# Mimetypes for the extensions generated code is saved with
+mimetypes.add_type('text/x-python', '.py')
+mimetypes.add_type('text/markdown', '.md')
+
+
+def guess_mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def is_text(mimetype):
+    return mimetype.startswith('text/') or mimetype in TEXT_MIMETYPES
+
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encodings):
+    """Pick the best content-coding the client accepts, or None for identity.
+
+    `accept_encodings` is werkzeug's parsed Accept-Encoding header.
+    """
+    best = None
+    best_quality = 0
+    for encoding in supported_encodings():
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressedVariants:
+    """On-disk cache of gzip/brotli copies of served files.
+
+    Each file is compressed once per encoding and version; afterwards the
+    compressed copy is served with send_file like any other file, so it gets
+    the same sendfile, ETag and Range handling. Writing a new variant
+    retires the one it replaces, which is deleted by a later write once
+    STALE_VARIANT_GRACE has passed, so a request that chose the old path just
+    before it was superseded can still open it.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'ollama-interface-compressed')
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Superseded variant path -> when it was superseded
+        self._retired = {}
+
+    def _variant_prefix(self, path):
+        return hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+
+    def get(self, path, encoding, version):
+        """Return the path of `path` compressed with `encoding`, creating it if needed.
+
+        `version` is the file's ETag version; a variant made for any other
+        version is stale and is retired when this one is written.
+        """
+        prefix = self._variant_prefix(path)
+        tag = hashlib.sha1(version.encode('utf-8')).hexdigest()[:16]
+        variant = os.path.join(self.directory, f"{prefix}-{tag}.{encoding}")
+        if os.path.exists(variant) and variant not in self._retired:
+            return variant
+        with self._lock:
+            if os.path.exists(variant):
+                # A version that comes back is current again
+                self._retired.pop(variant, None)
+                return variant
+            # Write under a temporary name so a half-written variant is never served
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+            try:
+                with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                    if encoding == 'br':
+                        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=9)
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dst.write(compressor.process(chunk))
+                        dst.write(compressor.finish())
+                    else:
+                        with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=6, mtime=0) as gz:
+                            while True:
+                                chunk = src.read(CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                gz.write(chunk)
+                os.replace(tmp_path, variant)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._retire(prefix, encoding, variant)
+        return variant
+
+    def _retire(self, prefix, encoding, current):
+        now = time.monotonic()
+        self._retired.pop(current, None)
+        for stale in glob.glob(os.path.join(self.directory, f"{prefix}-*.{encoding}")):
+            if stale != current:
+                self._retired.setdefault(stale, now)
+        for stale, since in list(self._retired.items()):
+            if now - since >= STALE_VARIANT_GRACE:
+                del self._retired[stale]
+                # Another worker may have removed it already
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+
+
+class StreamSink(io.RawIOBase):
+    """Write-only buffer that zipfile writes into and stream_zip drains."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files):
+    """Yield a zip archive of `files` ((archive name, path) pairs) as it is built.
+
+    Only one chunk of one file is held in memory at a time; the archive is
+    never assembled in full on the server.
+    """
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        for arcname, path in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as src, archive.open(info, 'w') as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
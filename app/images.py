@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import io
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:  # Without Pillow images are forwarded at their original size
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+# Uploads larger than this are spooled to disk instead of memory
+SPOOL_MEMORY_LIMIT = 1024 * 1024
+# Refuse to decode anything bigger, whatever its file size (decompression bombs)
+MAX_PIXELS = 64 * 1024 * 1024
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+
+class ImageRejected(Exception):
+    """An upload that is too large, not an image, or otherwise unusable."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def sniff_format(head):
+    """Identify an image format from its first bytes, or None."""
+    for signature, name in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return name
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def strip_data_url(image_data):
+    """Drop a `data:image/...;base64,` prefix from a base64 image string."""
+    if image_data and image_data.startswith('data:'):
+        return image_data.partition('base64,')[2]
+    return image_data
+
+
+def spool_stream(stream, max_bytes):
+    """Copy `stream` into a spooled temp file, hashing it on the way.
+
+    Reading stops as soon as `max_bytes` is exceeded, so oversized uploads
+    are never held in full. Returns the rewound file, its sha256 and size.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_LIMIT)
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            raise ImageRejected(f"Image is larger than {max_bytes} bytes", 413)
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def encode_base64(fileobj):
+    # Read in multiples of 3 bytes so the chunks can be encoded independently
+    parts = []
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE * 3)
+        if not chunk:
+            break
+        parts.append(base64.b64encode(chunk).decode('ascii'))
+    return ''.join(parts)
+
+
+class ProcessedImage:
+    """An uploaded image, ready to send to Ollama as base64."""
+
+    def __init__(self, digest, data, size, image_format, width=None, height=None, resized=False):
+        self.id = digest
+        self.data = data
+        self.size = size
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.resized = resized
+
+    def to_dict(self):
+        return {
+            "image_id": self.id,
+            "bytes": self.size,
+            "encoded_bytes": len(self.data),
+            "format": self.format,
+            "width": self.width,
+            "height": self.height,
+            "resized": self.resized
+        }
+
+
+def process_image_file(spool, digest, size, max_side):
+    """Validate an uploaded image and shrink it to `max_side` if it is larger."""
+    image_format = sniff_format(spool.read(16))
+    spool.seek(0)
+    if image_format is None:
+        raise ImageRejected("Unsupported image format; send PNG, JPEG, GIF, WebP or BMP", 415)
+
+    if Image is None:
+        return ProcessedImage(digest, encode_base64(spool), size, image_format)
+
+    try:
+        with Image.open(spool) as img:
+            width, height = img.size
+            if width * height > MAX_PIXELS:
+                raise ImageRejected(f"Image has too many pixels ({width}x{height})", 413)
+            if not max_side or max(width, height) <= max_side:
+                spool.seek(0)
+                return ProcessedImage(digest, encode_base64(spool), size, image_format, width, height)
+
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            # Keep transparency as PNG; everything else is re-encoded as JPEG
+            out_format = 'PNG' if img.mode in ('RGBA', 'LA', 'P') else 'JPEG'
+            if out_format == 'JPEG' and img.mode != 'RGB':
+                img = img.convert('RGB')
+            out = io.BytesIO()
+            img.save(out, out_format, quality=90)
+            out.seek(0)
+            return ProcessedImage(
+                digest, encode_base64(out), size, out_format.lower(), img.width, img.height, resized=True)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageRejected(f"Could not decode image: {str(e)}", 400)
+
+
+class ImageStore:
+    """Processed uploads keyed by the sha256 of the original bytes.
+
+    Uploading the same image again returns the stored copy without decoding
+    or re-encoding it, and requests can refer to a stored image by id instead
+    of sending it inline. Least recently used images are evicted once the
+    encoded data exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024, max_upload_bytes=20 * 1024 * 1024, max_side=1344):
+        self.max_bytes = max_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self.max_side = max_side
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, image_id):
+        with self._lock:
+            image = self._images.get(image_id)
+            if image is not None:
+                self._images.move_to_end(image_id)
+            return image
+
+    def add(self, stream):
+        """Store an image read from `stream`; returns (ProcessedImage, created)."""
+        spool, digest, size = spool_stream(stream, self.max_upload_bytes)
+        with spool:
+            existing = self.get(digest)
+            if existing is not None:
+                self.hits += 1
+                return existing, False
+            if size == 0:
+                raise ImageRejected("Empty image upload")
+            self.misses += 1
+            image = process_image_file(spool, digest, size, self.max_side)
+
+        with self._lock:
+            if digest not in self._images:
+                self._images[digest] = image
+                self._size += len(image.data)
+            while self._size > self.max_bytes and len(self._images) > 1:
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted.data)
+        return image, True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "images": len(self._images),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,297 @@
+import json
+import math
+import os
+import re
+
+# Only the start of a file is scanned; enough to classify, bounded in cost
+SCAN_CHARS = 1024
+# A single feature stops adding to the score after this many matches
+MAX_FEATURE_COUNT = 5
+# Scores below this are not enough evidence to name a language
+MIN_SCORE = 2.0
+
+# Canonical language -> (file extension, fenced-code info strings that mean it)
+LANGUAGES = {
+    'python': ('.py', ('python', 'py', 'python3', 'py3')),
+    'javascript': ('.js', ('javascript', 'js', 'node', 'jsx', 'mjs')),
+    'typescript': ('.ts', ('typescript', 'ts', 'tsx')),
+    'html': ('.html', ('html', 'htm', 'xhtml')),
+    'css': ('.css', ('css',)),
+    'json': ('.json', ('json', 'jsonc')),
+    'markdown': ('.md', ('markdown', 'md')),
+    'bash': ('.sh', ('bash', 'sh', 'shell', 'zsh', 'console')),
+    'java': ('.java', ('java',)),
+    'c': ('.c', ('c', 'h')),
+    'cpp': ('.cpp', ('cpp', 'c++', 'cc', 'cxx', 'hpp')),
+    'go': ('.go', ('go', 'golang')),
+    'rust': ('.rs', ('rust', 'rs')),
+    'sql': ('.sql', ('sql', 'mysql', 'postgresql', 'sqlite')),
+    'yaml': ('.yaml', ('yaml', 'yml')),
+    'plaintext': ('.txt', ('text', 'txt', 'plaintext', 'plain')),
+}
+
+FENCE_ALIASES = {alias: language for language, (_, aliases) in LANGUAGES.items() for alias in aliases}
+EXTENSION_LANGUAGES = {
+    **{extension: language for language, (extension, _) in LANGUAGES.items()},
+    '.jsx': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript', '.tsx': 'typescript', '.htm': 'html',
+    '.markdown': 'markdown', '.bash': 'bash', '.h': 'c', '.hpp': 'cpp', '.cc': 'cpp', '.cxx': 'cpp',
+    '.yml': 'yaml', '.text': 'plaintext',
+}
+
+SHEBANGS = (
+    (re.compile(r'python'), 'python'),
+    (re.compile(r'\b(?:node|deno|bun)\b'), 'javascript'),
+    (re.compile(r'\b(?:ba|z|k)?sh\b'), 'bash'),
+)
+
+# Weighted features per language. Keys are tokens (see TOKEN_PATTERN) or
+# (previous token, token) pairs; both are found in a single pass.
+TOKEN_FEATURES = {
+    'python': {
+        'def': 2.0, 'elif': 3.0, 'self': 1.5, 'None': 1.0, 'True': 0.5, 'False': 0.5, 'lambda': 1.5,
+        '__name__': 3.0, '__init__': 3.0, 'pass': 1.0, 'yield': 1.0, 'range': 1.0, 'print': 0.5,
+        ('self', '.'): 1.0, ('except', ':'): 2.0, ('else', ':'): 1.5, ('try', ':'): 2.0,
+    },
+    'javascript': {
+        'const': 1.5, 'let': 1.5, 'var': 1.0, 'function': 2.0, 'console': 2.0, 'require': 2.0,
+        'undefined': 2.0, 'null': 0.5, 'document': 2.0, 'window': 1.5, '=>': 1.5, '===': 2.0, '!==': 2.0,
+        'this': 0.5, 'await': 0.5, ('console', '.'): 1.0, ('export', 'default'): 2.0,
+    },
+    'typescript': {
+        'interface': 2.0, 'readonly': 2.0, 'private': 0.5, ('as', 'const'): 2.0,
+        (':', 'string'): 2.5, (':', 'number'): 2.5, (':', 'boolean'): 2.5, (':', 'void'): 2.5,
+        (':', 'any'): 2.5, (')', ':'): 0.5,
+    },
+    'html': {
+        ('<!', 'DOCTYPE'): 10.0, ('<!', 'doctype'): 10.0, ('<', 'html'): 6.0,
+        **{('<', tag): 1.5 for tag in ('div', 'span', 'body', 'head', 'script', 'meta', 'link', 'button',
+                                       'input', 'form', 'p', 'a', 'ul', 'li', 'table', 'h1', 'h2', 'title')},
+        **{('</', tag): 2.0 for tag in ('div', 'span', 'body', 'head', 'html', 'p', 'a', 'ul', 'li', 'table',
+                                        'form', 'section', 'title', 'button', 'h1', 'h2', 'script')},
+    },
+    'css': {
+        ('@', 'media'): 3.0, ('@', 'keyframes'): 3.0, ('@', 'import'): 1.0, ('@', 'font'): 2.0,
+        'px': 1.0, 'rem': 1.0, 'rgba': 1.5, 'hover': 1.0, '!important': 2.0,
+    },
+    'bash': {
+        'echo': 2.0, 'fi': 3.0, 'esac': 3.0, 'sudo': 2.0, 'then': 1.5, 'done': 1.0, 'chmod': 2.0,
+        'mkdir': 1.5, 'apt': 2.0, 'export': 0.5, ('$', '{'): 1.5, ('$', '('): 1.5, ('apt', '-'): 1.0,
+    },
+    'java': {
+        'public': 1.5, 'private': 1.0, 'static': 1.0, 'void': 1.0, 'System': 3.0, 'String': 1.0,
+        'extends': 1.0, 'implements': 1.0, 'final': 1.0, ('@', 'Override'): 3.0, ('System', '.'): 1.0,
+    },
+    'c': {
+        'printf': 2.0, 'malloc': 3.0, 'free': 1.0, 'sizeof': 2.0, 'NULL': 1.5, ('#', 'include'): 2.0,
+        ('.', 'h'): 1.5,
+    },
+    'cpp': {
+        'std': 2.0, 'cout': 4.0, 'cin': 3.0, 'endl': 4.0, 'template': 2.0, 'vector': 1.5, ('#', 'include'): 2.0,
+        ('std', '::'): 2.0, ('using', 'namespace'): 4.0, ('<', 'iostream'): 4.0, ('const', 'std'): 1.0,
+    },
+    'go': {
+        'func': 3.0, 'fmt': 3.0, ':=': 1.5, 'chan': 3.0, 'defer': 3.0, 'nil': 2.0, ('fmt', '.'): 1.0,
+    },
+    'rust': {
+        'fn': 3.0, 'mut': 3.0, 'impl': 3.0, 'u32': 2.0, 'i32': 2.0, 'usize': 2.0, 'Vec': 1.5, 'Some': 1.0,
+        ('println', '!'): 3.0, ('let', 'mut'): 2.0, ('use', 'std'): 3.0, ('&', 'self'): 2.0,
+    },
+    'sql': {
+        'SELECT': 3.0, 'FROM': 1.5, 'WHERE': 1.5, 'INSERT': 2.0, 'INTO': 1.5, 'CREATE': 2.0, 'TABLE': 2.0,
+        'JOIN': 2.0, 'VALUES': 1.5, 'PRIMARY': 2.0, ('GROUP', 'BY'): 1.0, ('ORDER', 'BY'): 1.0,
+        ('create', 'table'): 4.0, ('insert', 'into'): 4.0, ('group', 'by'): 2.0, ('order', 'by'): 1.0,
+        ('primary', 'key'): 3.0,
+    },
+    'markdown': {
+        (']', '('): 2.0, '**': 0.5,
+    },
+}
+
+# Features that only make sense at the start of a line, matched by one
+# MULTILINE pattern. Patterns must not use capturing groups: the matching
+# feature is read from `lastindex`.
+LINE_FEATURES = {
+    'python': (
+        (r'[ \t]*(?:def|class|if|elif|for|while|with)\b[^\n]*:[ \t]*$', 2.0),
+        (r'[ \t]*from [\w.]+ import ', 3.0),
+        (r'[ \t]*import [\w.]+(?: as \w+)?[ \t]*$', 2.0),
+    ),
+    'javascript': (
+        (r'[ \t]*import .+ from [\'"]', 3.0),
+    ),
+    'css': (
+        (r'[ \t]*[.#:]?[\w-][\w.#:>+~, \t-]*\{[ \t]*$', 1.5),
+        (r'[ \t]*[\w-]+[ \t]*:[ \t]*[^;{}\n]+;[ \t]*$', 1.5),
+    ),
+    'bash': (
+        (r'[ \t]*(?:fi|then|done|esac|do)[ \t]*$', 2.0),
+        (r'[ \t]*if \[', 3.0),
+        (r'[ \t]*(?:pip|npm|yarn|git|docker|curl|wget|cd) \S', 2.0),
+    ),
+    'java': (
+        (r'[ \t]*package [\w.]+;', 4.0),
+        (r'[ \t]*import java\.', 5.0),
+    ),
+    'go': (
+        (r'package \w+[ \t]*$', 4.0),
+        (r'import \($', 3.0),
+    ),
+    'yaml': (
+        (r'[\w-]+:[ \t]*$', 1.5),
+        (r'[ \t]+[\w-]+: [^{};,\n]+$', 1.0),
+        (r'[ \t]*- [\w-]+: ', 1.5),
+        (r'---[ \t]*$', 2.0),
+    ),
+    'markdown': (
+        (r'#{1,6} \S', 2.0),
+        (r'```', 2.0),
+    ),
+}
+
+# Words first: they are most of the input
+TOKEN_PATTERN = re.compile(r'\w+|<!|</|===|!==|=>|:=|::|\*\*|!important|[^\w\s]')
+
+
+def compile_features(token_features, line_features):
+    """Build {feature key: ((language, weight), ...)} and the combined line pattern.
+
+    Line features are keyed by their group index, so they share the table
+    with token features.
+    """
+    weights = {}
+    for language, features in token_features.items():
+        for key, weight in features.items():
+            weights[key] = weights.get(key, ()) + ((language, weight),)
+
+    alternatives = []
+    for language, features in line_features.items():
+        for pattern, weight in features:
+            if re.compile(pattern).groups:
+                raise ValueError(f"Line feature for {language} has a capturing group: {pattern}")
+            alternatives.append(f'({pattern})')
+            weights[len(alternatives)] = ((language, weight),)
+    return weights, re.compile('^(?:' + '|'.join(alternatives) + ')', re.MULTILINE)
+
+
+FEATURE_WEIGHTS, LINE_PATTERN = compile_features(TOKEN_FEATURES, LINE_FEATURES)
+FENCE_PATTERN = re.compile(r'```[ \t]*([\w+#.-]+)')
+JSON_TOKEN_PATTERN = re.compile(r'\s*(?:"(?:[^"\\\n]|\\.)*"|-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null|[{}\[\]:,])')
+# What may be left where the scan cut a token short
+JSON_PARTIAL_PATTERN = re.compile(r'\s*(?:"(?:[^"\\\n]|\\.)*\\?|-?[\d.eE+-]*|t(?:r(?:u)?)?|f(?:a(?:l(?:s)?)?)?|n(?:u(?:l)?)?)')
+
+
+class Detection:
+    """The detected language of some content and how sure we are of it."""
+
+    def __init__(self, language, confidence, source, scores=None):
+        self.language = language
+        self.confidence = confidence
+        self.source = source  # fence, extension, shebang, json, or features
+        self.scores = scores or {}
+
+    @property
+    def extension(self):
+        return extension_for(self.language)
+
+    def to_dict(self):
+        return {"language": self.language, "confidence": round(self.confidence, 3), "source": self.source}
+
+
+def canonical_language(name):
+    """Map a fenced-code info string or language name to a canonical language, or None."""
+    if not name:
+        return None
+    return FENCE_ALIASES.get(name.strip().lower())
+
+
+def language_for_filename(name):
+    """The canonical language of a file name's extension, or None."""
+    return EXTENSION_LANGUAGES.get(os.path.splitext(name)[1].lower())
+
+
+def extension_for(language):
+    return LANGUAGES.get(language, LANGUAGES['plaintext'])[0]
+
+
+def score_features(text):
+    counts = {}
+    previous = None
+    for token in TOKEN_PATTERN.findall(text):
+        if token in FEATURE_WEIGHTS:
+            counts[token] = counts.get(token, 0) + 1
+        pair = (previous, token)
+        if pair in FEATURE_WEIGHTS:
+            counts[pair] = counts.get(pair, 0) + 1
+        previous = token
+    for match in LINE_PATTERN.finditer(text):
+        counts[match.lastindex] = counts.get(match.lastindex, 0) + 1
+
+    scores = {}
+    for key, count in counts.items():
+        for language, weight in FEATURE_WEIGHTS[key]:
+            scores[language] = scores.get(language, 0.0) + weight * min(count, MAX_FEATURE_COUNT)
+    return scores
+
+
+def json_prefix(text):
+    """Whether `text`, the scanned start of a longer document, is made only of JSON tokens."""
+    position = 0
+    while position < len(text):
+        match = JSON_TOKEN_PATTERN.match(text, position)
+        if not match:
+            return JSON_PARTIAL_PATTERN.fullmatch(text, position) is not None
+        position = match.end()
+    return True
+
+
+def detect_language(content, hint=None):
+    """Detect the language of `content`.
+
+    `hint` is a fenced-code info string or language name from the model's
+    output; when it names a known language it wins outright. Otherwise an
+    opening fence, shebang or JSON check decides, and failing those,
+    weighted token and line features found in the first SCAN_CHARS
+    characters.
+    """
+    language = canonical_language(hint)
+    # An untagged fence arrives as 'text'; that says nothing about the content
+    if language and language != 'plaintext':
+        return Detection(language, 1.0, 'fence')
+
+    text = content[:SCAN_CHARS]
+    stripped = text.lstrip()
+    # Content that is itself a fenced block; a fence further down is markdown
+    fence = FENCE_PATTERN.match(stripped)
+    language = canonical_language(fence.group(1)) if fence else None
+    if language and language != 'plaintext':
+        return Detection(language, 0.95, 'fence')
+
+    if stripped.startswith('#!'):
+        first_line = stripped.split('\n', 1)[0]
+        for pattern, language in SHEBANGS:
+            if pattern.search(first_line):
+                return Detection(language, 0.99, 'shebang')
+
+    # Parse short content outright; past SCAN_CHARS only the scanned prefix is checked
+    if stripped[:1] in ('{', '['):
+        if len(content) <= SCAN_CHARS:
+            try:
+                json.loads(content)
+                return Detection('json', 0.99, 'json')
+            except ValueError:
+                pass
+        elif json_prefix(stripped):
+            return Detection('json', 0.95, 'json')
+
+    scores = score_features(text)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if not ranked or ranked[0][1] < MIN_SCORE:
+        return Detection('plaintext', 0.5, 'features', scores)
+    best, top = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    # TypeScript is a superset of JavaScript, so JavaScript features count towards it
+    if best == 'javascript' and scores.get('typescript', 0) >= MIN_SCORE:
+        best, top = 'typescript', top + scores['typescript']
+    # Share of the evidence, damped while the evidence is thin
+    confidence = top / (top + runner_up) * (1 - math.exp(-top / 4))
+    return Detection(best, confidence, 'features', scores)
@@ -0,0 +1,95 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def truncate(value, limit):
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}...(+{len(value) - limit} chars)"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, long strings truncated."""
+
+    def __init__(self, max_field_length=512):
+        super().__init__()
+        self.max_field_length = max_field_length
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": truncate(record.getMessage(), self.max_field_length * 4),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = truncate(value, self.max_field_length)
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request id and samples debug records.
+
+    Runs on the request thread before the record is queued, while the Flask
+    request context is still available.
+    """
+
+    def __init__(self, debug_sample_rate=1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+        if has_request_context():
+            record.request_id = g.get('request_id', '-')
+            record.path = request.path
+        return True
+
+
+def setup_logging(app):
+    """Route the app's loggers through a queue to a background JSON writer.
+
+    Request threads only pay for putting a record on an in-memory queue; the
+    formatting and the write to stdout happen on the QueueListener thread.
+    """
+    global _listener
+    logger = logging.getLogger('app')
+    logger.setLevel(app.config['LOG_LEVEL'])
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(app.config['LOG_DEBUG_SAMPLE_RATE']))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter(app.config['LOG_MAX_FIELD_LENGTH']))
+
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def assign_request_id():
+    """Use the caller's X-Request-ID if given, otherwise mint one."""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
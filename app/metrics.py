@@ -0,0 +1,252 @@
+import bisect
+import threading
+
+# Latency buckets in seconds, from warm cache hits up to long generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 60, 80, 120, 160, 250)
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, format_labels(self.labels, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        # Counts are stored per bucket and made cumulative only when rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', format_labels(self.labels, key, [('le', format_value(bound))]), cumulative
+            yield self.name + '_sum', format_labels(self.labels, key), total
+            yield self.name + '_count', format_labels(self.labels, key), count
+
+
+class CallbackMetric:
+    """A metric whose values are read from `callback()` at scrape time.
+
+    The callback returns a number, or a dict mapping label-value tuples to
+    numbers. Nothing is recorded on the request path.
+    """
+
+    def __init__(self, name, documentation, callback, labels=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            yield self.name, format_labels(self.labels, key), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        # Re-registering a name replaces it, so create_app() can run more than once
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name, documentation, callback, labels=(), kind='gauge'):
+        return self.register(CallbackMetric(name, documentation, callback, labels, kind))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests handled, by route and status.', ('route', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time until a route returned its response.', ('route',))
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'ollama_upstream_seconds',
+    'Ollama call latency by phase: headers (connect and first byte), ttft (first token) and total.',
+    ('endpoint', 'phase'))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    'ollama_upstream_errors_total', 'Ollama calls that failed before a response arrived.', ('endpoint',))
+GENERATED_TOKENS = REGISTRY.counter(
+    'ollama_generated_tokens_total', 'Tokens generated, from Ollama eval_count.', ('model',))
+EVAL_SECONDS = REGISTRY.counter(
+    'ollama_eval_seconds_total', 'Time Ollama spent generating tokens, from eval_duration.', ('model',))
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    'ollama_tokens_per_second', 'Decode speed of each generation.', ('model',), TOKEN_RATE_BUCKETS)
+PULL_BYTES = REGISTRY.counter(
+    'ollama_pull_bytes_total', 'Bytes downloaded by model pulls.')
+PULL_JOBS = REGISTRY.counter(
+    'ollama_pull_jobs_total', 'Finished model pull jobs, by final state.', ('state',))
+GENERATIONS_CANCELLED = REGISTRY.counter(
+    'generations_cancelled_total',
+    'Generations stopped before they finished, by route and reason (client cancel or disconnect).',
+    ('endpoint', 'reason'))
+
+
+def observe_generation(model, stats):
+    """Record Ollama's token counters from a finished generation."""
+    eval_count = stats.get('eval_count')
+    eval_duration = stats.get('eval_duration')
+    if eval_count is None or not eval_duration:
+        return
+    seconds = eval_duration / 1e9
+    GENERATED_TOKENS.inc(eval_count, model=model)
+    EVAL_SECONDS.inc(seconds, model=model)
+    TOKENS_PER_SECOND.observe(eval_count / seconds, model=model)
+
+
+def register_app_metrics(app):
+    """Expose the state of the app's queue, caches, pulls and backends at scrape time."""
+    extensions = app.extensions
+    scheduler = extensions['scheduler']
+    model_cache = extensions['model_cache']
+    pulls = extensions['pulls']
+    backends = extensions['ollama']
+
+    REGISTRY.callback(
+        'scheduler_queue_depth', 'Generations waiting for a slot.',
+        lambda: scheduler.stats()['queued'])
+    REGISTRY.callback(
+        'scheduler_running', 'Generations running, by model.',
+        lambda: {(model,): count for model, count in scheduler.stats()['running_by_model'].items()},
+        labels=('model',))
+    REGISTRY.callback(
+        'model_cache_requests_total', 'Model list and model info cache lookups, by result.',
+        lambda: {('hit',): model_cache.hits, ('stale',): model_cache.stale_hits, ('miss',): model_cache.misses},
+        labels=('result',), kind='counter')
+    REGISTRY.callback(
+        'ollama_pull_bytes_per_second', 'Combined download rate of running model pulls.',
+        pulls.throughput)
+    REGISTRY.callback(
+        'ollama_backend_healthy', 'Whether each Ollama backend passed its last health check.',
+        lambda: {(b['url'],): int(b['healthy']) for b in backends.status()},
+        labels=('backend',))
+    REGISTRY.callback(
+        'ollama_backend_outstanding', 'Requests in flight to each Ollama backend.',
+        lambda: {(b['url'],): b['outstanding'] for b in backends.status()},
+        labels=('backend',))
+
+    images = extensions['images']
+    REGISTRY.callback(
+        'image_store_requests_total', 'Image uploads, by whether the image was already stored.',
+        lambda: {('hit',): images.hits, ('miss',): images.misses},
+        labels=('result',), kind='counter')
+    REGISTRY.callback(
+        'image_store_bytes', 'Base64 bytes held by the uploaded image store.',
+        lambda: images.stats()['bytes'])
+
+    residency = extensions['residency']
+    REGISTRY.callback(
+        'model_resident_bytes', 'Memory used by the models Ollama has loaded, per /api/ps.',
+        lambda: residency.stats()['resident_bytes'])
+    REGISTRY.callback(
+        'model_loads_total', 'Models loaded ahead of use by warm-up.',
+        lambda: residency.loads, kind='counter')
+    REGISTRY.callback(
+        'model_evictions_total', 'Models unloaded to stay within the memory budget.',
+        lambda: residency.evictions, kind='counter')
+
+    cancellation = extensions['cancellation']
+    REGISTRY.callback(
+        'generations_in_flight', 'Generations that can currently be cancelled.',
+        lambda: len(cancellation.active()))
+
+    budget = extensions.get('budget')
+    if budget is not None:
+        REGISTRY.callback(
+            'prompt_budget_total', 'Generation requests sized to the context window, by outcome.',
+            lambda: {('fit',): budget.planned - budget.trimmed, ('trimmed',): budget.trimmed,
+                     ('rejected',): budget.rejected},
+            labels=('action',), kind='counter')
+
+    completion_cache = extensions.get('completion_cache')
+    if completion_cache is not None:
+        REGISTRY.callback(
+            'completion_cache_requests_total', 'Completion cache lookups, by result.',
+            lambda: {('hit',): completion_cache.hits, ('miss',): completion_cache.misses},
+            labels=('result',), kind='counter')
+        REGISTRY.callback(
+            'completion_cache_bytes', 'Bytes held by the in-memory completion cache.',
+            lambda: completion_cache.stats()['bytes'])
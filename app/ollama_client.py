@@ -0,0 +1,97 @@
+import time
+
+import requests
+from urllib3.util.retry import Retry
+
+from .cancellation import CancellableAdapter, Cancelled, active
+from .metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY
+
+# (connect, read) timeouts in seconds per Ollama endpoint. A read timeout of
+# None waits indefinitely, which is what multi-GB pulls need.
+DEFAULT_TIMEOUTS = {
+    '/api/tags': (3.05, 10),
+    '/api/show': (3.05, 10),
+    '/api/generate': (3.05, 300),
+    '/api/pull': (3.05, None),
+}
+DEFAULT_TIMEOUT = (3.05, 30)
+
+
+class OllamaClient:
+    """Shared HTTP client for all calls to the Ollama API.
+
+    Wraps a single requests.Session so connections are kept alive and reused
+    across requests instead of paying a TCP handshake per call. Connect errors
+    are retried with exponential backoff; read errors are not, since the
+    request may already have reached Ollama. Passing a CancelToken as
+    `cancel` lets another thread abort the call, raising Cancelled.
+    """
+
+    def __init__(self, base_url, pool_size=10, timeouts=None, retries=3, backoff_factor=0.5):
+        self.base_url = base_url.rstrip('/')
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=0,
+            backoff_factor=backoff_factor,
+            allowed_methods=None,  # Connect errors are safe to retry for any verb
+            raise_on_status=False
+        )
+        adapter = CancellableAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def timeout_for(self, path):
+        return self.timeouts.get(path, DEFAULT_TIMEOUT)
+
+    def request(self, method, path, cancel=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout_for(path))
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        started = time.perf_counter()
+        try:
+            with active(cancel):
+                response = self.session.request(method, self.url(path), **kwargs)
+        except requests.exceptions.RequestException:
+            if cancel is not None and cancel.cancelled:
+                raise Cancelled(cancel.reason) from None
+            UPSTREAM_ERRORS.inc(endpoint=path)
+            raise
+        UPSTREAM_LATENCY.observe(response.elapsed.total_seconds(), endpoint=path, phase='headers')
+        if not kwargs.get('stream'):
+            UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint=path, phase='total')
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class OllamaError(Exception):
+    """An Ollama call that failed, with the HTTP status the route should return."""
+
+    def __init__(self, message, status_code=500, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+    def to_dict(self):
+        payload = {"error": self.message}
+        if self.details:
+            payload["details"] = self.details
+        return payload
@@ -0,0 +1,240 @@
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .metrics import PULL_BYTES, PULL_JOBS
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+class LayerProgress:
+    """Download progress of one layer (blob digest) of a model."""
+
+    def __init__(self, digest):
+        self.digest = digest
+        self.total = 0
+        self.completed = 0
+        self.rate = 0.0
+        self._last = None
+
+    def update(self, total, completed):
+        now = time.monotonic()
+        if self._last is not None:
+            last_time, last_completed = self._last
+            elapsed = now - last_time
+            if elapsed > 0 and completed >= last_completed:
+                instant = (completed - last_completed) / elapsed
+                # Smooth out bursty progress reports
+                self.rate = instant if not self.rate else 0.7 * self.rate + 0.3 * instant
+        if completed > self.completed:
+            PULL_BYTES.inc(completed - self.completed)
+        self._last = (now, completed)
+        self.total = total or self.total
+        self.completed = completed
+
+    def to_dict(self):
+        remaining = max(self.total - self.completed, 0)
+        return {
+            "digest": self.digest,
+            "total": self.total,
+            "completed": self.completed,
+            "bytes_per_second": self.rate,
+            "eta_seconds": remaining / self.rate if self.rate else None
+        }
+
+
+class PullJob:
+    def __init__(self, job_id, model):
+        self.id = job_id
+        self.model = model
+        self.state = 'queued'
+        self.status = None  # Latest status line reported by Ollama
+        self.error = None
+        self.layers = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.version = 0
+        self.cancel_event = threading.Event()
+
+    @property
+    def active(self):
+        return self.state in ACTIVE_STATES
+
+    def progress(self):
+        total = sum(layer.total for layer in self.layers.values())
+        completed = sum(layer.completed for layer in self.layers.values())
+        rate = sum(layer.rate for layer in self.layers.values() if layer.completed < layer.total)
+        if self.state == 'success':
+            percent = 100
+        else:
+            percent = int(completed * 100 / total) if total else 0
+        return {
+            "total": total,
+            "completed": completed,
+            "percent": percent,
+            "bytes_per_second": rate,
+            "eta_seconds": (total - completed) / rate if rate else None
+        }
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "model": self.model,
+            "state": self.state,
+            "status": self.status,
+            "error": self.error,
+            "progress": self.progress(),
+            "layers": [layer.to_dict() for layer in self.layers.values()],
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished
+        }
+
+
+class PullManager:
+    """Runs model pulls on a bounded worker pool.
+
+    Each pull is a PullJob with its own id and per-layer progress. Pulling
+    a model that is already being pulled returns the existing job instead of
+    starting a second download. Watchers block in `wait_for_update` and wake
+    whenever a job's progress changes.
+    """
+
+    def __init__(self, client, max_workers=2, on_success=None, history=50):
+        self.client = client
+        self.on_success = on_success
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._ids = itertools.count(1)
+        self._jobs = {}
+        self._cond = threading.Condition()
+
+    def submit(self, model):
+        with self._cond:
+            for job in self._jobs.values():
+                if job.model == model and job.active:
+                    return job
+            job = PullJob(str(next(self._ids)), model)
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        return job
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if not job.active]
+        for job in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs.values())
+
+    def throughput(self):
+        """Combined download rate of all running pulls, in bytes per second."""
+        with self._cond:
+            return sum(job.progress()["bytes_per_second"] for job in self._jobs.values() if job.active)
+
+    def latest(self):
+        with self._cond:
+            return max(self._jobs.values(), key=lambda job: job.created, default=None)
+
+    def describe(self, job):
+        """A consistent snapshot of the job for JSON responses."""
+        with self._cond:
+            return job.to_dict()
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.active:
+                job.cancel_event.set()
+                if job.state == 'queued':
+                    self._finish(job, 'cancelled')
+            return job
+
+    def _changed(self, job):
+        job.version += 1
+        self._cond.notify_all()
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished = time.time()
+        PULL_JOBS.inc(state=state)
+        self._changed(job)
+
+    def wait_for_update(self, job, version, timeout=None):
+        """Block until the job's version moves past `version`; returns the new version."""
+        with self._cond:
+            self._cond.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.version
+
+    def _run(self, job):
+        with self._cond:
+            if job.state != 'queued':
+                return
+            job.state = 'running'
+            job.started = time.time()
+            self._changed(job)
+
+        try:
+            with self.client.post("/api/pull", json={"name": job.model}, stream=True) as response:
+                if response.status_code != 200:
+                    try:
+                        error_msg = response.json().get('error', response.text)
+                    except ValueError:
+                        error_msg = response.text
+                    with self._cond:
+                        self._finish(job, 'error', error_msg)
+                    return
+
+                for line in response.iter_lines():
+                    if job.cancel_event.is_set():
+                        # Closing the stream makes Ollama abandon the pull
+                        with self._cond:
+                            self._finish(job, 'cancelled')
+                        return
+                    if not line:
+                        continue
+                    try:
+                        update = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+                    with self._cond:
+                        if 'error' in update:
+                            self._finish(job, 'error', update['error'])
+                            return
+                        job.status = update.get('status', job.status)
+                        digest = update.get('digest')
+                        if digest and 'completed' in update:
+                            layer = job.layers.setdefault(digest, LayerProgress(digest))
+                            layer.update(update.get('total', 0), update['completed'])
+                        self._changed(job)
+
+            if job.status != 'success':
+                with self._cond:
+                    self._finish(job, 'error', "Pull ended before Ollama reported success")
+                return
+            # Run the callback first so watchers woken by the final update see fresh state
+            if self.on_success:
+                self.on_success(job.model)
+            with self._cond:
+                self._finish(job, 'success')
+        except requests.exceptions.RequestException as e:
+            with self._cond:
+                self._finish(job, 'error', str(e))
+        except Exception as e:
+            with self._cond:
+                self._finish(job, 'error', f"Error pulling model: {str(e)}")
@@ -0,0 +1,259 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Loading a large model from disk can take minutes
+LOAD_TIMEOUT = (5, 600)
+# Seconds a read of /api/ps is trusted by status() and warm() before it is read again
+REFRESH_MAX_AGE = 2
+
+
+def parse_keep_alive(value):
+    """Ollama takes keep_alive as a duration ("30m") or seconds (-1 keeps the model loaded)."""
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    return value
+
+
+class ModelState:
+    __slots__ = ('name', 'loaded', 'loading', 'size', 'size_vram', 'expires_at', 'last_used', 'last_load_seconds',
+                 'last_error')
+
+    def __init__(self, name):
+        self.name = name
+        self.loaded = False
+        self.loading = False
+        self.size = None
+        self.size_vram = None
+        self.expires_at = None
+        self.last_used = None
+        self.last_load_seconds = None
+        self.last_error = None
+
+    @property
+    def memory(self):
+        return self.size_vram or self.size or 0
+
+    def to_dict(self):
+        return {
+            "model": self.name,
+            "state": 'loading' if self.loading else 'loaded' if self.loaded else 'unloaded',
+            "size": self.size,
+            "size_vram": self.size_vram,
+            "expires_at": self.expires_at,
+            "last_used": self.last_used,
+            "last_load_seconds": self.last_load_seconds,
+            "last_error": self.last_error
+        }
+
+
+class ResidencyManager:
+    """Keeps chosen models loaded in Ollama so prompts do not wait for a cold load.
+
+    `hot_models` are loaded when the manager starts and loaded again whenever
+    a check finds them gone; requests for them ask Ollama to keep them with
+    `hot_keep_alive`, and for any other model with `keep_alive`. `warm()`
+    loads a model in the background before its first prompt. Every
+    `check_interval` seconds /api/ps is read, and while loaded models use
+    more than `memory_budget` bytes, idle models other than the hot ones are
+    unloaded, least recently used first. `busy(model)` says whether a model
+    has generations running, which keeps it loaded. Whether a model is loaded
+    only ever comes from /api/ps or a finished load, and `status()`,
+    `warm()` and `stats()` re-read /api/ps when their view is older than
+    REFRESH_MAX_AGE, so they stay right without the check loop.
+    """
+
+    def __init__(self, client, hot_models=(), keep_alive='5m', hot_keep_alive=-1, memory_budget=None,
+                 check_interval=30, busy=None):
+        self.client = client
+        self.hot_models = tuple(hot_models)
+        self.keep_alive = parse_keep_alive(keep_alive)
+        self.hot_keep_alive = parse_keep_alive(hot_keep_alive)
+        self.memory_budget = memory_budget
+        self.check_interval = check_interval
+        self.busy = busy or (lambda model: False)
+        self.loads = 0
+        self.evictions = 0
+        self._models = {}
+        self._warming = {}
+        self._refreshed = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='model-warm')
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = ModelState(model)
+        return state
+
+    def keep_alive_for(self, model):
+        return self.hot_keep_alive if model in self.hot_models else self.keep_alive
+
+    def apply(self, request_data):
+        """Add keep_alive to an Ollama generation request and record the model as used."""
+        model = request_data.get('model')
+        request_data.setdefault('keep_alive', self.keep_alive_for(model))
+        with self._lock:
+            # Models first seen in /api/ps get their last use from there
+            state = self._models.get(model)
+            if state is not None:
+                state.last_used = time.time()
+        return request_data
+
+    def _refresh_if_stale(self):
+        if self._refreshed is not None and time.monotonic() - self._refreshed < REFRESH_MAX_AGE:
+            return
+        try:
+            self.refresh()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # Keep the old view for a while rather than asking a failing server on every call
+            self._refreshed = time.monotonic()
+            logger.warning("Could not read loaded models: %s", e)
+
+    def warm(self, model):
+        """Start loading `model` in the background unless it is loaded or loading; returns its status."""
+        self._refresh_if_stale()
+        with self._lock:
+            state = self._state(model)
+            # Warming means the model is about to be used; keep it off the eviction list
+            state.last_used = time.time()
+            if not state.loaded and model not in self._warming:
+                state.loading = True
+                self._warming[model] = self._executor.submit(self._load, model)
+            return state.to_dict()
+
+    def _load(self, model):
+        started = time.monotonic()
+        try:
+            # A generate request without a prompt only loads the model
+            response = self.client.post("/api/generate", json={
+                "model": model, "stream": False, "keep_alive": self.keep_alive_for(model)
+            }, timeout=LOAD_TIMEOUT)
+            if response.status_code != 200:
+                raise requests.exceptions.RequestException(f"Ollama API error: {response.text}")
+            seconds = time.monotonic() - started
+            with self._lock:
+                state = self._state(model)
+                state.loaded = True
+                state.last_load_seconds = seconds
+                state.last_error = None
+                self.loads += 1
+            logger.info("Loaded model %s", model, extra={"model": model, "seconds": round(seconds, 2)})
+        except requests.exceptions.RequestException as e:
+            with self._lock:
+                self._state(model).last_error = str(e)
+            logger.warning("Could not load model %s: %s", model, e)
+        finally:
+            with self._lock:
+                self._state(model).loading = False
+                self._warming.pop(model, None)
+        self.check(rewarm=False)
+
+    def unload(self, model):
+        response = self.client.post("/api/generate", json={"model": model, "keep_alive": 0, "stream": False})
+        if response.status_code == 200:
+            with self._lock:
+                self._state(model).loaded = False
+                self.evictions += 1
+            logger.info("Unloaded model %s", model, extra={"model": model})
+
+    def refresh(self):
+        """Update every model's state from /api/ps on each backend."""
+        loaded = {}
+        for response in self.client.broadcast("GET", "/api/ps", timeout=5):
+            if response.status_code == 200:
+                for info in response.json().get('models') or []:
+                    loaded[info.get('name')] = info
+        with self._lock:
+            for name, state in self._models.items():
+                if name not in loaded:
+                    state.loaded = False
+                    state.size = state.size_vram = state.expires_at = None
+            for name, info in loaded.items():
+                state = self._state(name)
+                if not state.loaded and state.last_used is None:
+                    # Loaded since the last look, so used about now
+                    state.last_used = time.time()
+                state.loaded = True
+                state.size = info.get('size')
+                state.size_vram = info.get('size_vram')
+                state.expires_at = info.get('expires_at')
+            self._refreshed = time.monotonic()
+
+    def _victims(self):
+        if not self.memory_budget:
+            return []
+        with self._lock:
+            loaded = [state for state in self._models.values() if state.loaded]
+            total = sum(state.memory for state in loaded)
+            idle = sorted(
+                (state for state in loaded if state.name not in self.hot_models and not state.loading),
+                key=lambda state: state.last_used or 0
+            )
+        victims = []
+        for state in idle:
+            if total <= self.memory_budget:
+                break
+            if self.busy(state.name):
+                continue
+            victims.append(state.name)
+            total -= state.memory
+        if total > self.memory_budget:
+            logger.warning("Loaded models exceed the memory budget", extra={"bytes": total, "budget": self.memory_budget})
+        return victims
+
+    def check(self, rewarm=True):
+        """Refresh from /api/ps, unload models over the memory budget and reload missing hot models."""
+        try:
+            self.refresh()
+            for model in self._victims():
+                self.unload(model)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Could not check loaded models: %s", e)
+            return
+        if rewarm:
+            for model in self.hot_models:
+                self.warm(model)
+
+    def _check_loop(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def start(self):
+        """Load the hot models in the background and keep checking on them."""
+        for model in self.hot_models:
+            self.warm(model)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._check_loop, daemon=True)
+            self._thread.start()
+
+    def status(self, model):
+        self._refresh_if_stale()
+        with self._lock:
+            # Looking a model up must not start tracking it
+            state = self._models.get(model) or ModelState(model)
+            return {**state.to_dict(), "hot": model in self.hot_models, "keep_alive": self.keep_alive_for(model)}
+
+    def stats(self):
+        self._refresh_if_stale()
+        with self._lock:
+            models = [state.to_dict() for state in self._models.values()]
+        return {
+            "models": models,
+            "hot_models": list(self.hot_models),
+            "memory_budget": self.memory_budget,
+            "resident_bytes": sum(m["size_vram"] or m["size"] or 0 for m in models if m["state"] == 'loaded'),
+            "loads": self.loads,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
@@ -1,17 +1,39 @@
-from flask import Blueprint, request, jsonify, render_template, Response, current_app
+from flask import Blueprint, request, jsonify, render_template, Response, current_app, stream_with_context, send_file, g
 import os
 import json
+import logging
 import requests
 import base64
+import hashlib
 from pathlib import Path
 import re
-import subprocess
-import threading
+import secrets
+import shutil
 import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlparse
 
-bp = Blueprint('main', __name__)
+from werkzeug.security import safe_join
+
+from .batch import BatchJournal, BatchStats, new_batch_id, parse_batch_items, run_batch
+from .budget import ContextOverflow, ModelLimits
+from .cache import MODELS_CACHE_KEY
+from .cancellation import Cancelled, client_socket
+from .code_blocks import CodeBlockParser, safe_relative_path, split_code_blocks
+from .compare import ModelRun, multiplex, rank
+from .completion_cache import completion_key, is_deterministic
+from .file_serving import MIN_COMPRESS_BYTES, guess_mimetype, is_text, negotiate_encoding, stream_zip
+from .images import ImageRejected, strip_data_url
+from .languages import Detection, detect_language, language_for_filename
+from .logging_setup import assign_request_id
+from .metrics import HTTP_LATENCY, HTTP_REQUESTS, REGISTRY, UPSTREAM_LATENCY, observe_generation
+from .ollama_client import OllamaError
+from .scheduler import QueueFull
 
-OLLAMA_API = "http://localhost:11434"  # Remove /api from base URL
+bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 # Global variables
 CURRENT_DIR = os.path.abspath(os.getcwd())
@@ -19,114 +41,467 @@ CURRENT_DIR = os.path.abspath(os.getcwd())
 # Set the generated code directory
 GENERATED_CODE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'generated_code')
 
-download_progress = {"progress": 0, "error": None}
-download_lock = threading.Lock()
+# Seconds between cancellation checks while a non-streaming request waits in the queue
+CANCEL_CHECK_INTERVAL = 0.5
 
-def update_download_progress(progress):
-    global download_progress
-    with download_lock:
-        download_progress["progress"] = progress
+# Secret that lets a client list and cancel its own generations; made up per generation if not sent
+CANCEL_KEY_HEADER = 'X-Cancel-Key'
+
+CODE_PROMPT_TEMPLATE = "Generate code for the following request: {prompt}\nPlease provide only the code without explanations."
+
+def ollama_client():
+    return current_app.extensions['ollama']
 
 def get_language_from_content(content):
     """Detect language from code content."""
-    # Common language indicators
-    indicators = {
-        'import ': 'python',
-        'def ': 'python',
-        'class ': 'python',
-        'function ': 'javascript',
-        'var ': 'javascript',
-        'let ': 'javascript',
-        'const ': 'javascript',
-        '<html': 'html',
-        '<!DOCTYPE': 'html',
-        '<style': 'css',
-        '{': 'json'  # This is a weak indicator, should be used last
-    }
-    
-    content_lower = content.lower()
-    for indicator, lang in indicators.items():
-        if indicator in content_lower:
-            return lang
-    return 'plaintext'
+    return detect_language(content).language
+
+# Timing fields Ollama attaches to the final chunk of a generation
+GENERATION_STATS_FIELDS = (
+    'total_duration',
+    'load_duration',
+    'prompt_eval_count',
+    'prompt_eval_duration',
+    'eval_count',
+    'eval_duration',
+)
+
+def generation_stats(chunk):
+    """Pull Ollama's timing counters out of a final generation chunk."""
+    stats = {key: chunk[key] for key in GENERATION_STATS_FIELDS if key in chunk}
+    if stats.get('eval_duration'):
+        stats['tokens_per_second'] = stats.get('eval_count', 0) / (stats['eval_duration'] / 1e9)
+    return stats
+
+def block_frame(event, block):
+    """The frame for a CodeBlockParser event."""
+    if event == 'start':
+        return {"block_start": block.header()}
+    return {"block": block.to_dict()}
+
+def block_frames(events):
+    """NDJSON lines for CodeBlockParser events."""
+    for event, block in events:
+        yield json.dumps(block_frame(event, block)) + "\n"
+
+def generation_frames(response, on_done=None, on_first_token=None, blocks=None, cancel=None):
+    """Turn Ollama's incremental /api/generate or /api/chat chunks into frames.
+
+    Each token becomes {"token": ...}; the last frame is {"done": true, "stats": {...}}
+    carrying Ollama's timing counters, or {"error": ...} if the upstream stream fails
+    or ends without a final chunk.
+    `on_done(text, stats)` is called with the full completion once it finishes,
+    and `on_first_token()` as soon as the first token arrives. With a
+    CodeBlockParser as `blocks`, {"block_start": ...} and {"block": ...} frames
+    report fenced code blocks as they open and close. If the CancelToken
+    `cancel` stops the stream, Cancelled is raised.
+    """
+    tokens = []
+    try:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError:
+                logger.debug("Could not parse generation chunk", extra={"chunk": line.decode('utf-8', 'replace')})
+                continue
+
+            if 'error' in chunk:
+                yield {"error": chunk['error']}
+                return
+
+            text = chunk.get('response') or chunk.get('message', {}).get('content')
+            if text:
+                if not tokens and on_first_token:
+                    on_first_token()
+                tokens.append(text)
+                yield {"token": text}
+                if blocks is not None:
+                    for event, block in blocks.feed(text):
+                        yield block_frame(event, block)
+
+            if chunk.get('done'):
+                if blocks is not None:
+                    for event, block in blocks.close():
+                        yield block_frame(event, block)
+                stats = generation_stats(chunk)
+                if on_done:
+                    on_done(''.join(tokens), stats)
+                yield {"done": True, "stats": stats}
+                return
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        # Ollama closed the stream without a final chunk; end it so clients stop waiting
+        logger.warning("Stream from Ollama ended before it was done")
+        yield {"error": "Stream ended before the generation finished"}
+    except requests.exceptions.RequestException as e:
+        if cancel is not None and cancel.cancelled:
+            raise Cancelled(cancel.reason) from None
+        logger.warning("Stream from Ollama interrupted: %s", e)
+        yield {"error": f"Stream interrupted: {str(e)}"}
+    finally:
+        response.close()
+
+def relay_generation(response, on_done=None, on_first_token=None, blocks=None, cancel=None, **extra):
+    """Relay a streaming Ollama response as NDJSON lines; see generation_frames().
+
+    `extra` fields are added to the final {"done": true} line.
+    """
+    frames = generation_frames(response, on_done, on_first_token, blocks, cancel)
+    try:
+        for frame in frames:
+            if frame.get('done'):
+                frame.update(extra)
+            yield json.dumps(frame) + "\n"
+    finally:
+        frames.close()
+
+def ndjson_response(frames):
+    return Response(
+        stream_with_context(frames),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def scheduler():
+    return current_app.extensions['scheduler']
+
+def queue_full_response(error):
+    response = jsonify({
+        "error": "Too many generations queued, please retry later",
+        "retry_after": error.retry_after
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def scheduled_generation(ticket, send, on_done=None, on_finish=None, cancel=None, **extra):
+    """Stream a generation once the scheduler admits `ticket`.
+
+    While the job waits, {"queued": position, "ticket": id} frames report its
+    place in the queue. `send()` makes the streaming Ollama request, and
+    `on_finish()` runs once the stream ends for any reason. When the
+    CancelToken `cancel` is cancelled, or the client stops reading, the
+    Ollama request is aborted and the slot freed.
+    """
+    sched = scheduler()
+    registry = cancellation()
+    queue_timeout = current_app.config['SCHEDULER_QUEUE_TIMEOUT']
+    finished = []
+
+    def finish():
+        # Runs from the stream's finally and from the response's close, whichever comes first
+        if finished:
+            return
+        finished.append(True)
+        sched.release(ticket)
+        if cancel is not None:
+            registry.finish(cancel)
+        if on_finish:
+            on_finish()
+
+    def run():
+        try:
+            deadline = time.monotonic() + queue_timeout
+            while not ticket.admitted:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                yield json.dumps({"queued": sched.position(ticket), "ticket": ticket.id}) + "\n"
+                if time.monotonic() > deadline:
+                    yield json.dumps({"error": "Timed out waiting in the generation queue"}) + "\n"
+                    return
+                sched.wait(ticket, timeout=1)
+
+            started = time.perf_counter()
+            endpoint = None
+
+            def first_token():
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, phase='ttft')
+
+            def done(text, stats):
+                UPSTREAM_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, phase='total')
+                observe_generation(ticket.model, stats)
+                if on_done:
+                    on_done(text, stats)
+
+            response = send()
+            try:
+                endpoint = urlparse(response.url).path
+                if response.status_code != 200:
+                    error_msg = f"Ollama API error: {response.text}"
+                    logger.error("Ollama generation failed", extra={"status": response.status_code, "body": response.text})
+                    yield json.dumps({"error": error_msg}) + "\n"
+                    return
+                yield from relay_generation(response, done, first_token, cancel=cancel, **extra)
+            finally:
+                # Streamed responses hold their backend's outstanding count until closed
+                response.close()
+        except Cancelled as e:
+            yield json.dumps({"error": e.message, "cancelled": True, "reason": e.reason}) + "\n"
+        except GeneratorExit:
+            # The server closes the stream when the client has gone away
+            if cancel is not None:
+                cancel.cancel('disconnect')
+            raise
+        except requests.exceptions.RequestException as e:
+            logger.error("Could not reach Ollama: %s", e)
+            yield json.dumps({"error": f"Could not reach Ollama: {str(e)}"}) + "\n"
+        finally:
+            finish()
+
+    try:
+        response = ndjson_response(run())
+    except BaseException:
+        finish()
+        raise
+    # A stream the client drops before the first byte is closed without ever
+    # starting run(), so its finally never releases the slot
+    response.call_on_close(finish)
+    return response
+
+def wait_for_slot(ticket, cancel=None):
+    """Block a non-streaming request until admitted; False if the queue timed out.
+
+    With a CancelToken, raises Cancelled if it is cancelled while waiting.
+    """
+    sched = scheduler()
+    deadline = time.monotonic() + current_app.config['SCHEDULER_QUEUE_TIMEOUT']
+    while True:
+        remaining = deadline - time.monotonic()
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+            remaining = min(remaining, CANCEL_CHECK_INTERVAL)
+        if sched.wait(ticket, timeout=max(remaining, 0)):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+
+def cancellation():
+    return current_app.extensions['cancellation']
+
+def track_generation(model):
+    """Register this request's generation so its owner can cancel it by request id, or it stops on disconnect."""
+    g.cancel_key = request.headers.get(CANCEL_KEY_HEADER) or secrets.token_urlsafe(16)
+    return cancellation().register(
+        g.request_id, request.url_rule.rule, model, client_socket(request.environ), owner=g.cancel_key
+    )
+
+def cancelled_response(error):
+    return jsonify({"error": error.message, "cancelled": True, "reason": error.reason}), error.status_code
+
+def completion_cache():
+    return current_app.extensions.get('completion_cache')
+
+def residency():
+    return current_app.extensions['residency']
+
+def model_digest(model):
+    """Resolve a model name to its digest so cached completions follow model updates."""
+    client = ollama_client()
+    try:
+        entry = model_cache().get(MODELS_CACHE_KEY, lambda: fetch_models(client))
+    except OllamaError:
+        return model
+    for info in entry.value.get('models', []):
+        if info.get('name') == model and info.get('digest'):
+            return info['digest']
+    return model
+
+def cached_generation_stream(cached, blocks=None):
+    """Replay a cached completion in the same NDJSON framing as a live stream."""
+    def replay():
+        yield json.dumps({"token": cached['response']}) + "\n"
+        if blocks is not None:
+            yield from block_frames(blocks.feed(cached['response']) + blocks.close())
+        yield json.dumps({"done": True, "stats": cached.get('stats', {}), "cached": True}) + "\n"
+    return ndjson_response(replay())
 
 @bp.route('/')
 def index():
     return render_template('index.html')
 
-@bp.route('/list_models')
-def list_models():
+def fetch_models(client):
+    """Fetch and format the model list from Ollama's /api/tags."""
     try:
-        print("\n=== Fetching Models ===")
-        try:
-            response = requests.get(f"{OLLAMA_API}/api/tags", timeout=10)  # Increased timeout
-            print(f"Response status: {response.status_code}")
-            print(f"Response content: {response.text}")  # Added response content logging
-        except requests.exceptions.ConnectionError:
-            print("Connection error - Ollama not running")
-            return jsonify({
-                "error": "Could not connect to Ollama. Please ensure Ollama is running (ollama serve)",
-                "details": "Connection refused"
-            }), 503
-        except requests.exceptions.Timeout:
-            print("Connection timeout")
-            return jsonify({
-                "error": "Connection to Ollama timed out. The server might be busy or unresponsive",
-                "details": "Request timed out after 10 seconds"
-            }), 504
-            
-        if response.status_code != 200:
-            error_msg = f"Failed to fetch models: {response.text}"
-            print(f"Error: {error_msg}")
-            return jsonify({"error": error_msg}), response.status_code
+        # Every backend in the pool is asked; models are merged by name
+        responses = client.broadcast("GET", "/api/tags")
+        for response in responses:
+            logger.debug("Fetched model list", extra={"backend": response.backend.url, "status": response.status_code, "bytes": len(response.content)})
+    except requests.exceptions.ConnectionError:
+        logger.error("Could not connect to Ollama to list models")
+        raise OllamaError(
+            "Could not connect to Ollama. Please ensure Ollama is running (ollama serve)",
+            503,
+            details="Connection refused"
+        )
+    except requests.exceptions.Timeout:
+        logger.error("Timed out listing models from Ollama")
+        raise OllamaError(
+            "Connection to Ollama timed out. The server might be busy or unresponsive",
+            504,
+            details="Request timed out after 10 seconds"
+        )
         
+    ok_responses = [r for r in responses if r.status_code == 200]
+    if not ok_responses:
+        response = responses[0]
+        error_msg = f"Failed to fetch models: {response.text}"
+        logger.error("Failed to fetch models", extra={"status": response.status_code, "body": response.text})
+        raise OllamaError(error_msg, response.status_code)
+    
+    models = []
+    seen = set()
+    for response in ok_responses:
         try:
             data = response.json()
         except json.JSONDecodeError:
-            print("Invalid JSON response from Ollama")
-            return jsonify({"error": "Invalid response from Ollama API"}), 500
+            logger.error("Invalid JSON in model list from Ollama", extra={"body": response.text})
+            raise OllamaError("Invalid response from Ollama API", 500)
             
-        print(f"Raw Ollama response: {data}")
-        
         if not isinstance(data, dict) or 'models' not in data:
-            print("Invalid response structure")
-            return jsonify({"error": "Invalid response structure from Ollama"}), 500
+            logger.error("Unexpected model list structure from Ollama", extra={"body": response.text})
+            raise OllamaError("Invalid response structure from Ollama", 500)
             
-        models = data.get('models', [])
-        if not models:
-            print("No models found")
-            return jsonify({"models": []})
-            
-        formatted_models = []
-        for model in models:
-            try:
-                details = model.get('details', {})
-                model_info = {
-                    "name": model.get('name', ''),
-                    "tag": model.get('name', ''),
-                    "size": model.get('size', 0),
-                    "modified_at": model.get('modified_at', ''),
-                    "parameter_size": details.get('parameter_size', ''),
-                    "family": details.get('family', ''),
-                    "families": details.get('families', []),
-                    "format": details.get('format', ''),
-                    "quantization": details.get('quantization_level', '')
-                }
-                formatted_models.append(model_info)
-                print(f"Added model: {model_info}")
-            except Exception as e:
-                print(f"Error processing model {model}: {str(e)}")
-                continue
+        for model in data.get('models') or []:
+            if model.get('name') not in seen:
+                seen.add(model.get('name'))
+                models.append(model)
+    
+    if not models:
+        logger.info("No models installed in Ollama")
+        return {"models": []}
         
-        result = {"models": formatted_models}
-        print(f"Final response: {result}")
-        return jsonify(result)
+    formatted_models = []
+    for model in models:
+        try:
+            details = model.get('details', {})
+            model_info = {
+                "name": model.get('name', ''),
+                "tag": model.get('name', ''),
+                "digest": model.get('digest', ''),
+                "size": model.get('size', 0),
+                "modified_at": model.get('modified_at', ''),
+                "parameter_size": details.get('parameter_size', ''),
+                "family": details.get('family', ''),
+                "families": details.get('families', []),
+                "format": details.get('format', ''),
+                "quantization": details.get('quantization_level', '')
+            }
+            formatted_models.append(model_info)
+        except Exception as e:
+            logger.warning("Skipping malformed model entry: %s", e, extra={"entry": json.dumps(model, default=str)})
+            continue
+    
+    logger.debug("Formatted model list", extra={"count": len(formatted_models)})
+    return {"models": formatted_models}
+
+def fetch_model_info(client, model):
+    """Fetch a model's details from Ollama's /api/show."""
+    response = client.get("/api/show", params={"name": model})
+    try:
+        data = response.json()
+    except json.JSONDecodeError:
+        raise OllamaError("Invalid response from Ollama API", 500)
+    if response.status_code != 200:
+        raise OllamaError(data.get('error', f"Failed to fetch model info: {response.text}"), response.status_code)
+    return data
+
+def model_cache():
+    return current_app.extensions['model_cache']
+
+def context_budget():
+    return current_app.extensions.get('budget')
+
+def model_limits(model):
+    """A model's context limits from /api/show, kept per digest; None if Ollama cannot say."""
+    client = ollama_client()
+    load_show = lambda: model_cache().get(('show', model), lambda: fetch_model_info(client, model)).value
+    try:
+        digest = model_digest(model)
+        if digest == model:
+            # No digest to key on, so nothing says the limits still hold next time
+            return ModelLimits.from_show(load_show())
+        return context_budget().limits(digest, load_show)
+    except (OllamaError, requests.exceptions.RequestException) as e:
+        logger.warning("Could not read the model's context limits: %s", e, extra={"model": model})
+        return None
+
+def request_flag(value, default=None):
+    """A boolean request field: `default` when unset, else a bool (JSON true/false, "true"/"false", "1"/"0")."""
+    if value is None:
+        return default
+    return str(value).lower() in ('true', '1')
+
+def fit_context(request_data, truncate=None):
+    """Size num_ctx for an Ollama request and make its input fit; returns the plan as a dict, or None."""
+    budget = context_budget()
+    if budget is None:
+        return None
+    limits = model_limits(request_data['model'])
+    if limits is None:
+        return None
+    return budget.fit(request_data, limits, truncate).to_dict()
+
+def context_overflow_response(error):
+    return jsonify({"error": error.message, **(error.details or {})}), error.status_code
+
+def cached_json_response(entry):
+    """Serve a CacheEntry, answering 304 when the client's ETag still matches."""
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@bp.route('/list_models')
+def list_models():
+    try:
+        client = ollama_client()
+        entry = model_cache().get(MODELS_CACHE_KEY, lambda: fetch_models(client))
+        return cached_json_response(entry)
         
+    except OllamaError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         error_msg = f"Exception in list_models: {str(e)}"
-        print(f"Error: {error_msg}")
+        logger.exception("Error in list_models")
         return jsonify({"error": error_msg}), 500
 
+def image_store():
+    return current_app.extensions['images']
+
+def resolve_image(data):
+    """The base64 image for a request, from an uploaded `image_id` or an inline `image`."""
+    image_id = data.get('image_id')
+    if image_id:
+        image = image_store().get(image_id)
+        if image is None:
+            raise ImageRejected("Unknown image_id; upload the image to /images again", 404)
+        return image.data
+    return strip_data_url(data.get('image'))
+
+def store_uploaded_image():
+    """Store the image sent as a multipart `image`/`file` field or as the raw request body."""
+    store = image_store()
+    # Reject declared oversize bodies before anything is parsed
+    if request.content_length and request.content_length > store.max_upload_bytes + 64 * 1024:
+        raise ImageRejected(f"Image is larger than {store.max_upload_bytes} bytes", 413)
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image') or request.files.get('file')
+        if upload is None:
+            raise ImageRejected("No image file provided")
+        return store.add(upload.stream)
+    return store.add(request.stream)
+
+@bp.route('/images', methods=['POST'])
+def upload_image():
+    try:
+        image, created = store_uploaded_image()
+        logger.info("Stored image upload", extra={"image_id": image.id, "image_bytes": image.size, "resized": image.resized, "image_created": created})
+        return jsonify({**image.to_dict(), "cached": not created}), 201 if created else 200
+    except ImageRejected as e:
+        return jsonify({"error": e.message}), e.status_code
+
 @bp.route('/generate', methods=['POST'])
 def generate():
     try:
@@ -136,8 +511,12 @@ def generate():
 
         model = data.get('model')
         prompt = data.get('prompt', '')
-        image_data = data.get('image')
+        image_data = resolve_image(data)
         request_type = data.get('type', 'chat')  # 'chat' or 'code'
+        stream = request_flag(data.get('stream'), False)
+        options = data.get('options')
+        # Code requests come back split into fenced blocks unless asked not to
+        split_blocks = bool(data.get('blocks', request_type == 'code'))
 
         if not model:
             return jsonify({"error": "No model specified"}), 400
@@ -145,13 +524,15 @@ def generate():
         # Prepare the request data
         request_data = {
             "model": model,
-            "stream": False
+            "stream": stream
         }
+        if options:
+            request_data["options"] = options
 
         # Handle different types of requests
         if request_type == 'code':
             # Add code generation specific prompt
-            request_data["prompt"] = f"Generate code for the following request: {prompt}\nPlease provide only the code without explanations."
+            request_data["prompt"] = CODE_PROMPT_TEMPLATE.format(prompt=prompt)
         else:
             # Handle chat with optional image
             if image_data:
@@ -161,26 +542,550 @@ def generate():
             else:
                 request_data["prompt"] = prompt
 
-        print(f"Sending request to Ollama: {request_data}")
-        
-        response = requests.post(f"{OLLAMA_API}/api/generate", json=request_data)
+        plan = fit_context(request_data, request_flag(data.get('truncate')))
+
+        # Deterministic requests can be answered from the completion cache
+        cache = completion_cache()
+        cache_key = None
+        if cache is not None and data.get('cache', True) and is_deterministic(options):
+            cache_key = completion_key(
+                model_digest(model),
+                request_data["prompt"],
+                request_data.get("images"),
+                options
+            )
+            cached = cache.get(cache_key)
+            if cached is not None:
+                if stream:
+                    return cached_generation_stream(cached, CodeBlockParser() if split_blocks else None)
+                result = {"response": cached['response'], "cached": True}
+                if split_blocks:
+                    result["blocks"] = [block.to_dict() for block in split_code_blocks(cached['response'])]
+                return jsonify(result)
+
+        def store(text, stats):
+            if cache_key is not None:
+                cache.put(cache_key, {"response": text, "stats": stats})
+
+        residency().apply(request_data)
+        client = ollama_client()
+        try:
+            ticket = scheduler().submit(model)
+        except QueueFull as e:
+            return queue_full_response(e)
+
+        try:
+            token = track_generation(model)
+        except Exception:
+            scheduler().release(ticket)
+            raise
+        if stream:
+            send = lambda: client.post("/api/generate", json=request_data, stream=True, cancel=token)
+            return scheduled_generation(
+                ticket, send, on_done=store, cancel=token, blocks=CodeBlockParser() if split_blocks else None,
+                budget=plan
+            )
+
+        try:
+            if not wait_for_slot(ticket, token):
+                return jsonify({"error": "Timed out waiting in the generation queue"}), 503
+
+            logger.debug("Sending generation to Ollama", extra={"model": model, "prompt_chars": len(request_data['prompt'])})
+            
+            response = client.post("/api/generate", json=request_data, cancel=token)
+        finally:
+            scheduler().release(ticket)
+            cancellation().finish(token)
         
         if response.status_code != 200:
             error_msg = f"Ollama API error: {response.text}"
-            print(f"Error: {error_msg}")
+            logger.error("Ollama generation failed", extra={"status": response.status_code, "body": response.text})
             return jsonify({"error": error_msg}), response.status_code
 
         response_data = response.json()
         if 'error' in response_data:
             return jsonify({"error": response_data['error']}), 400
 
-        return jsonify({"response": response_data.get('response', '')})
+        observe_generation(model, generation_stats(response_data))
+        store(response_data.get('response', ''), generation_stats(response_data))
+        result = {"response": response_data.get('response', ''), "budget": plan}
+        if split_blocks:
+            result["blocks"] = [block.to_dict() for block in split_code_blocks(result["response"])]
+        return jsonify(result)
 
+    except ImageRejected as e:
+        return jsonify({"error": e.message}), e.status_code
+    except ContextOverflow as e:
+        return context_overflow_response(e)
+    except Cancelled as e:
+        return cancelled_response(e)
     except Exception as e:
         error_msg = f"Error in generate: {str(e)}"
-        print(f"Error: {error_msg}")
+        logger.exception("Error in generate")
+        return jsonify({"error": error_msg}), 500
+
+@bp.route('/batch_generate', methods=['POST'])
+def batch_generate():
+    try:
+        # Prompts come as a JSONL file upload or as a raw JSONL request body
+        if 'file' in request.files:
+            source = request.files['file'].stream
+            params = request.form
+        else:
+            source = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+            shutil.copyfileobj(request.stream, source)
+            source.seek(0)
+            params = request.args
+
+        default_model = params.get('model')
+        default_type = params.get('type', 'code')
+        try:
+            concurrency = int(params.get('concurrency', current_app.config['BATCH_CONCURRENCY']))
+        except ValueError:
+            return jsonify({"error": "concurrency must be an integer"}), 400
+        concurrency = max(1, min(concurrency, current_app.config['BATCH_MAX_CONCURRENCY']))
+
+        batch_id = params.get('batch_id') or new_batch_id()
+        try:
+            journal = BatchJournal(current_app.config['BATCH_DIR'], batch_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        completed_ids = journal.completed_ids()
+
+        client = ollama_client()
+        sched = scheduler()
+        models = residency()
+        queue_timeout = current_app.config['SCHEDULER_QUEUE_TIMEOUT']
+        stats = BatchStats()
+        # Items run on worker threads, which need the app to look up model limits
+        app = current_app._get_current_object()
+
+        def pending_items():
+            for item in parse_batch_items(source):
+                if item['id'] in completed_ids:
+                    stats.skipped += 1
+                    continue
+                yield item
+
+        def run_item(item):
+            if 'error' in item:
+                return item
+            model = item.get('model') or default_model
+            if not model:
+                return {"id": item['id'], "error": "No model specified"}
+
+            prompt = item['prompt']
+            if item.get('type', default_type) == 'code':
+                prompt = CODE_PROMPT_TEMPLATE.format(prompt=prompt)
+            request_data = {"model": model, "prompt": prompt, "stream": False}
+            if item.get('options'):
+                request_data["options"] = item['options']
+            try:
+                with app.app_context():
+                    plan = fit_context(request_data, request_flag(item.get('truncate')))
+            except ContextOverflow as e:
+                return {"id": item['id'], "model": model, "error": e.message, **(e.details or {})}
+            models.apply(request_data)
+
+            deadline = time.monotonic() + queue_timeout
+            while True:
+                try:
+                    ticket = sched.submit(model)
+                    break
+                except QueueFull as e:
+                    if time.monotonic() > deadline:
+                        return {"id": item['id'], "error": "Timed out waiting in the generation queue"}
+                    time.sleep(min(e.retry_after, 5))
+
+            try:
+                if not sched.wait(ticket, timeout=queue_timeout):
+                    return {"id": item['id'], "error": "Timed out waiting in the generation queue"}
+                response = client.post("/api/generate", json=request_data)
+            except requests.exceptions.RequestException as e:
+                return {"id": item['id'], "error": f"Could not reach Ollama: {str(e)}"}
+            finally:
+                sched.release(ticket)
+
+            if response.status_code != 200:
+                return {"id": item['id'], "error": f"Ollama API error: {response.text}"}
+            response_data = response.json()
+            if 'error' in response_data:
+                return {"id": item['id'], "error": response_data['error']}
+            observe_generation(model, generation_stats(response_data))
+            return {
+                "id": item['id'],
+                "model": model,
+                "response": response_data.get('response', ''),
+                "stats": generation_stats(response_data),
+                "budget": plan
+            }
+
+        def frames():
+            yield json.dumps({"batch_id": batch_id, "resumed": bool(completed_ids)}) + "\n"
+            for result in run_batch(pending_items(), run_item, concurrency):
+                journal.record(result)
+                stats.add(result)
+                yield json.dumps(result) + "\n"
+            yield json.dumps({"done": True, "batch_id": batch_id, "summary": stats.to_dict()}) + "\n"
+
+        return ndjson_response(frames())
+
+    except Exception as e:
+        error_msg = f"Error in batch_generate: {str(e)}"
+        logger.exception("Error in batch_generate")
+        return jsonify({"error": error_msg}), 500
+
+@bp.route('/batches/<batch_id>')
+def get_batch_results(batch_id):
+    try:
+        journal = BatchJournal(current_app.config['BATCH_DIR'], batch_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not os.path.exists(journal.path):
+        return jsonify({"error": "Batch not found"}), 404
+    return send_file(journal.path, mimetype='application/x-ndjson')
+
+def installed_models():
+    """Names of the models Ollama has installed, or None if it could not be asked."""
+    client = ollama_client()
+    try:
+        entry = model_cache().get(MODELS_CACHE_KEY, lambda: fetch_models(client))
+    except OllamaError:
+        return None
+    return {info.get('name') for info in entry.value.get('models', [])}
+
+@bp.route('/compare', methods=['POST'])
+def compare_models():
+    try:
+        data = request.get_json() or {}
+        models = data.get('models')
+        prompt = data.get('prompt', '')
+        request_type = data.get('type', 'code')
+        stream = request_flag(data.get('stream'), False)
+        options = data.get('options')
+        split_blocks = bool(data.get('blocks', request_type == 'code'))
+
+        if not isinstance(models, list) or not models or not all(isinstance(m, str) and m for m in models):
+            return jsonify({"error": "models must be a non-empty list of model names"}), 400
+        models = list(dict.fromkeys(models))
+        max_models = current_app.config['COMPARE_MAX_MODELS']
+        if len(models) > max_models:
+            return jsonify({"error": f"At most {max_models} models can be compared at once"}), 400
+        if not prompt:
+            return jsonify({"error": "No prompt provided"}), 400
+        installed = installed_models()
+        unknown = [m for m in models if installed is not None and m not in installed]
+        if unknown:
+            return jsonify({"error": "Models not installed", "models": unknown}), 400
+
+        if request_type == 'code':
+            prompt = CODE_PROMPT_TEMPLATE.format(prompt=prompt)
+        client = ollama_client()
+        sched = scheduler()
+        keep_alive = residency()
+        registry = cancellation()
+        queue_timeout = current_app.config['SCHEDULER_QUEUE_TIMEOUT']
+        # One token covers every model, so a cancel or disconnect stops them all
+        token = track_generation(','.join(models))
+        runs = {model: ModelRun(model) for model in models}
+
+        # Sized here, in the request's context; each model gets its own num_ctx, and trimming if needed
+        payloads = {}
+        plans = {}
+        overflows = {}
+        for model in models:
+            request_data = {"model": model, "prompt": prompt, "stream": True}
+            if options:
+                request_data["options"] = options
+            try:
+                plans[model] = fit_context(request_data, request_flag(data.get('truncate')))
+            except ContextOverflow as e:
+                runs[model].error = e.message
+                overflows[model] = e.details or {}
+                continue
+            payloads[model] = keep_alive.apply(request_data)
+
+        def channel(model):
+            """Frames for one model's answer, each tagged with the model."""
+            run = runs[model]
+            if model in overflows:
+                yield {"model": model, "error": run.error, **overflows[model]}
+                return
+            request_data = payloads[model]
+            try:
+                ticket = sched.submit(model)
+            except QueueFull:
+                run.error = "Too many generations queued, please retry later"
+                yield {"model": model, "error": run.error}
+                return
+
+            def first_token():
+                run.first_token = time.monotonic()
+                UPSTREAM_LATENCY.observe(run.first_token - run.sent, endpoint='/api/generate', phase='ttft')
+
+            def done(text, stats):
+                run.done(text, stats)
+                UPSTREAM_LATENCY.observe(run.finished - run.sent, endpoint='/api/generate', phase='total')
+                observe_generation(model, stats)
+
+            try:
+                deadline = time.monotonic() + queue_timeout
+                position = None
+                while not sched.wait(ticket, timeout=CANCEL_CHECK_INTERVAL):
+                    token.raise_if_cancelled()
+                    if time.monotonic() > deadline:
+                        run.error = "Timed out waiting in the generation queue"
+                        yield {"model": model, "error": run.error}
+                        return
+                    if sched.position(ticket) != position:
+                        position = sched.position(ticket)
+                        yield {"model": model, "queued": position}
+                run.admitted = run.sent = time.monotonic()
+                response = client.post("/api/generate", json=request_data, stream=True, cancel=token)
+                if response.status_code != 200:
+                    run.error = f"Ollama API error: {response.text}"
+                    response.close()
+                    yield {"model": model, "error": run.error}
+                    return
+                blocks = CodeBlockParser() if split_blocks else None
+                for frame in generation_frames(response, done, first_token, blocks, token):
+                    if 'error' in frame:
+                        run.error = frame['error']
+                    elif 'block' in frame:
+                        run.blocks.append(frame['block'])
+                    elif frame.get('done'):
+                        frame["metrics"] = run.metrics()
+                        frame["budget"] = plans[model]
+                    yield {"model": model, **frame}
+            except Cancelled as e:
+                run.error = e.message
+                yield {"model": model, "error": e.message, "cancelled": True}
+            except requests.exceptions.RequestException as e:
+                run.error = f"Could not reach Ollama: {str(e)}"
+                yield {"model": model, "error": run.error}
+            finally:
+                sched.release(ticket)
+
+        sources = {model: (lambda model=model: channel(model)) for model in models}
+
+        def summary():
+            return {"models": [runs[m].metrics() for m in models], "best": rank(runs.values())}
+
+        if stream:
+            def frames():
+                try:
+                    for frame in multiplex(sources):
+                        yield json.dumps(frame) + "\n"
+                    yield json.dumps({"done": True, **summary()}) + "\n"
+                except GeneratorExit:
+                    # The client went away; stop every model still generating
+                    token.cancel('disconnect')
+                    raise
+                finally:
+                    registry.finish(token)
+            return ndjson_response(frames())
+
+        try:
+            for _ in multiplex(sources):
+                pass
+        finally:
+            registry.finish(token)
+        if token.cancelled:
+            return cancelled_response(Cancelled(token.reason))
+        results = []
+        for model in models:
+            result = {**runs[model].to_dict(), "budget": plans.get(model)}
+            if split_blocks:
+                result["blocks"] = runs[model].blocks
+            results.append(result)
+        return jsonify({"results": results, "best": summary()["best"]})
+
+    except Exception as e:
+        error_msg = f"Error in compare_models: {str(e)}"
+        logger.exception("Error in compare_models")
         return jsonify({"error": error_msg}), 500
 
+def session_store():
+    return current_app.extensions['sessions']
+
+def summarize_messages(client, model, previous_summary, messages):
+    """Ask the session's model to fold trimmed turns into the running summary."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    prompt = "Summarize this conversation in a few sentences, keeping any facts, decisions and names later turns may need.\n\n"
+    if previous_summary:
+        prompt += f"Summary so far: {previous_summary}\n\n"
+    prompt += transcript
+    try:
+        response = client.post("/api/generate", json={"model": model, "prompt": prompt, "stream": False})
+        if response.status_code == 200:
+            return response.json().get('response', previous_summary)
+    except requests.exceptions.RequestException as e:
+        logger.warning("Could not summarize chat history: %s", e)
+    return previous_summary
+
+@bp.route('/chat_sessions', methods=['POST'])
+def create_chat_session():
+    data = request.get_json() or {}
+    model = data.get('model')
+    if not model:
+        return jsonify({"error": "No model specified"}), 400
+
+    session = session_store().create(model, system=data.get('system'))
+    return jsonify(session.to_dict()), 201
+
+@bp.route('/chat_sessions/<session_id>', methods=['GET'])
+def get_chat_session(session_id):
+    session = session_store().get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(session.to_dict())
+
+@bp.route('/chat_sessions/<session_id>', methods=['DELETE'])
+def delete_chat_session(session_id):
+    if not session_store().delete(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"status": "deleted"})
+
+@bp.route('/chat_sessions/<session_id>/messages', methods=['POST'])
+def send_chat_message(session_id):
+    try:
+        session = session_store().get(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+
+        data = request.get_json() or {}
+        content = data.get('content', '')
+        try:
+            image_data = resolve_image(data)
+        except ImageRejected as e:
+            return jsonify({"error": e.message}), e.status_code
+        stream = request_flag(data.get('stream'), False)
+        options = data.get('options')
+
+        if not content and not image_data:
+            return jsonify({"error": "No message content provided"}), 400
+
+        with session.lock:
+            if session.busy:
+                return jsonify({"error": "A reply is already being generated for this session"}), 409
+            session.busy = True
+
+        # Images are sent with this turn only, not kept in the stored history
+        session.messages.append({"role": "user", "content": content})
+        session.updated = time.time()
+        completed = []
+
+        def record_reply(text, stats):
+            session.messages.append({"role": "assistant", "content": text})
+            session.updated = time.time()
+            completed.append(True)
+
+        def finish():
+            if not completed:
+                # Drop the unanswered turn so the history stays consistent
+                session.messages.pop()
+                session.window_start = min(session.window_start, len(session.messages))
+            session.busy = False
+
+        try:
+            client = ollama_client()
+            dropped = session.trim(current_app.config['SESSION_TOKEN_BUDGET'])
+            if dropped and current_app.config['SESSION_SUMMARIZE']:
+                session.summary = summarize_messages(client, session.model, session.summary, dropped)
+
+            messages = session.prompt_messages()
+            if image_data:
+                messages[-1] = {**messages[-1], "images": [image_data]}
+            request_data = {"model": session.model, "messages": messages, "stream": stream}
+            if options:
+                request_data["options"] = options
+            residency().apply(request_data)
+            # The session already trims history to SESSION_TOKEN_BUDGET; this sizes num_ctx and catches what still overflows
+            plan = fit_context(request_data)
+
+            # Keep the conversation on the backend that holds its KV cache
+            backend = client.backend_for(session.backend_url) if session.backend_url else None
+
+            ticket = scheduler().submit(session.model)
+        except QueueFull as e:
+            finish()
+            return queue_full_response(e)
+        except Exception:
+            finish()
+            raise
+
+        try:
+            token = track_generation(session.model)
+        except Exception:
+            scheduler().release(ticket)
+            finish()
+            raise
+
+        def send(stream):
+            response = client.post("/api/chat", json=request_data, stream=stream, backend=backend, cancel=token)
+            session.backend_url = response.backend.url
+            return response
+
+        if stream:
+            return scheduled_generation(
+                ticket,
+                lambda: send(True),
+                on_done=record_reply,
+                on_finish=finish,
+                cancel=token,
+                session_id=session.id,
+                budget=plan
+            )
+
+        try:
+            if not wait_for_slot(ticket, token):
+                return jsonify({"error": "Timed out waiting in the generation queue"}), 503
+            response = send(False)
+            if response.status_code != 200:
+                return jsonify({"error": f"Ollama API error: {response.text}"}), response.status_code
+
+            response_data = response.json()
+            if 'error' in response_data:
+                return jsonify({"error": response_data['error']}), 400
+
+            reply = response_data.get('message', {}).get('content', '')
+            stats = generation_stats(response_data)
+            observe_generation(session.model, stats)
+            record_reply(reply, stats)
+            return jsonify({"response": reply, "stats": stats, "session_id": session.id, "budget": plan})
+        finally:
+            scheduler().release(ticket)
+            cancellation().finish(token)
+            finish()
+
+    except ContextOverflow as e:
+        return context_overflow_response(e)
+    except Cancelled as e:
+        return cancelled_response(e)
+    except Exception as e:
+        error_msg = f"Error in send_chat_message: {str(e)}"
+        logger.exception("Error in send_chat_message")
+        return jsonify({"error": error_msg}), 500
+
+def code_store():
+    return current_app.extensions['code_store']
+
+def file_name_for(file_name, content, language):
+    """Give `file_name` the extension of its code's language; returns (name, detection).
+
+    The fenced-code info string, when it names a language, decides the
+    extension; otherwise keep the user's extension, which then names the
+    language, or detect from content.
+    """
+    detection = detect_language(content, hint=language)
+    base_name, extension = os.path.splitext(file_name)
+    named = language_for_filename(file_name)
+    if not extension or (detection.source == 'fence' and named != detection.language):
+        file_name = base_name + detection.extension
+    elif named and detection.source != 'fence':
+        detection = Detection(named, 1.0, 'extension')
+    return file_name, detection
+
 @bp.route('/save_code', methods=['POST'])
 def save_code():
     try:
@@ -189,51 +1094,110 @@ def save_code():
             return jsonify({'error': 'Missing required data'}), 400
 
         content = data['content']
-        file_name = data['fileName']
-        language = data.get('language', 'plaintext')
-
-        # Ensure the file has the correct extension based on language
-        extension_map = {
-            'python': '.py',
-            'javascript': '.js',
-            'html': '.html',
-            'css': '.css',
-            'json': '.json',
-            'markdown': '.md'
-        }
-
-        # Get the base name without extension
-        base_name = os.path.splitext(file_name)[0]
-        
-        # Add the correct extension based on language
-        if language in extension_map:
-            file_name = base_name + extension_map[language]
-        elif not os.path.splitext(file_name)[1]:
-            # If no extension and language not recognized, try to detect from content
-            if 'def ' in content or 'import ' in content:
-                file_name = base_name + '.py'
-            elif 'function ' in content or 'const ' in content:
-                file_name = base_name + '.js'
-            elif '<html' in content.lower():
-                file_name = base_name + '.html'
-            elif '{' in content and '}' in content:
-                file_name = base_name + '.json'
-            else:
-                file_name = base_name + '.txt'
+        relative = safe_relative_path(data['fileName'])
+        if relative is None:
+            return jsonify({'error': f"Invalid file name: {data['fileName']}"}), 400
+        relative, detection = file_name_for(relative, content, data.get('language', 'plaintext'))
 
-        # Ensure the generated_code directory exists
-        if not os.path.exists('generated_code'):
-            os.makedirs('generated_code')
+        store = code_store()
+        entry = store.save([(relative, content)])[0]
+        search_index().update(store.path(relative))
 
-        # Save the file
-        file_path = os.path.join('generated_code', file_name)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-
-        return jsonify({'message': 'File saved successfully', 'path': file_path})
+        return jsonify({
+            'message': 'File saved successfully',
+            'path': os.path.join('generated_code', relative),
+            'hash': entry['hash'],
+            **detection.to_dict()
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/save_files', methods=['POST'])
+def save_files():
+    """Save several files in one request, all or none.
+
+    Takes {"files": [{"fileName", "content", "language"}, ...]}, or
+    {"text": ...} with raw model output to split into its code blocks.
+    """
+    data = request.get_json(silent=True) or {}
+    if 'text' in data:
+        files = [{"fileName": block.filename, "content": block.content, "language": block.language}
+                 for block in split_code_blocks(data['text'] or '')]
+        if not files:
+            return jsonify({"error": "No code blocks found in text"}), 400
+    else:
+        files = data.get('files')
+        if not isinstance(files, list) or not files:
+            return jsonify({"error": "files must be a non-empty list"}), 400
+
+    planned = []
+    seen = set()
+    for item in files:
+        if not isinstance(item, dict) or not isinstance(item.get('content'), str) or not item.get('fileName'):
+            return jsonify({"error": "Each file needs fileName and content"}), 400
+        relative = safe_relative_path(item['fileName'])
+        if relative is None:
+            return jsonify({"error": f"Invalid file name: {item['fileName']}"}), 400
+        relative, detection = file_name_for(relative, item['content'], item.get('language'))
+        if relative in seen:
+            return jsonify({"error": f"Duplicate file name: {relative}"}), 400
+        seen.add(relative)
+        planned.append((relative, item['content'], detection))
+
+    store = code_store()
+    try:
+        entries = store.save([(relative, content) for relative, content, _ in planned])
+    except OSError as e:
+        logger.error("Could not save files: %s", e)
+        return jsonify({"error": f"Could not save files: {str(e)}"}), 500
+    search_index().update(*(store.path(relative) for relative, _, _ in planned))
+
+    return jsonify({
+        "message": f"Saved {len(planned)} files",
+        "files": [{"path": os.path.join('generated_code', relative), "hash": entry['hash'], **detection.to_dict()}
+                  for (relative, _, detection), entry in zip(planned, entries)]
+    })
+
+@bp.route('/history/<path:file_name>', methods=['GET'])
+def file_history(file_name):
+    """List a saved file's versions, or with ?version=N send that version's content."""
+    relative = safe_relative_path(file_name)
+    if relative is None:
+        return jsonify({"error": "Invalid file name"}), 400
+    store = code_store()
+    version = request.args.get('version', type=int)
+    if version is None:
+        versions = store.history(relative)
+        if not versions:
+            return jsonify({"error": "No history for this file"}), 404
+        return jsonify({"path": os.path.join('generated_code', relative), "versions": versions})
+
+    blob = store.version_path(relative, version)
+    if blob is None:
+        return jsonify({"error": "Version not found"}), 404
+    # Blobs never change, so a version can be cached for good
+    response = send_file(blob, mimetype=guess_mimetype(relative), conditional=True, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@bp.route('/history/<path:file_name>', methods=['POST'])
+def restore_version(file_name):
+    """Make an earlier version of a file current again: {"version": N}."""
+    relative = safe_relative_path(file_name)
+    version = (request.get_json(silent=True) or {}).get('version')
+    if relative is None or not isinstance(version, int):
+        return jsonify({"error": "A file name and an integer version are required"}), 400
+    store = code_store()
+    try:
+        entry = store.restore(relative, version)
+    except OSError as e:
+        logger.error("Could not restore %s: %s", relative, e)
+        return jsonify({"error": f"Could not restore file: {str(e)}"}), 500
+    if entry is None:
+        return jsonify({"error": "Version not found"}), 404
+    search_index().update(store.path(relative))
+    return jsonify({"message": f"Restored version {version}", **entry})
+
 @bp.route('/model_status', methods=['GET'])
 def model_status():
     model = request.args.get('name')
@@ -241,11 +1205,33 @@ def model_status():
         return jsonify({"error": "Model name is required"}), 400
         
     try:
-        response = requests.get(f"{OLLAMA_API}/api/show", params={"name": model})
-        return jsonify(response.json())
+        client = ollama_client()
+        entry = model_cache().get(('show', model), lambda: fetch_model_info(client, model))
+        # Model details are cached; whether the model is loaded is not
+        response = jsonify({**entry.value, "residency": residency().status(model)})
+        response.add_etag()
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    except OllamaError as e:
+        return jsonify(e.to_dict()), e.status_code
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/warm_model', methods=['POST'])
+def warm_model():
+    """Load a model in the background, e.g. as soon as it is selected, so the first prompt does not wait."""
+    model = (request.get_json(silent=True) or {}).get('model')
+    if not model:
+        return jsonify({"error": "Model name is required"}), 400
+    return jsonify(residency().warm(model)), 202
+
+@bp.route('/model_residency')
+def model_residency():
+    return jsonify(residency().stats())
+
+def pull_manager():
+    return current_app.extensions['pulls']
+
 @bp.route('/pull_model', methods=['POST'])
 def pull_model():
     model = request.json.get('model')
@@ -253,169 +1239,180 @@ def pull_model():
         return jsonify({"error": "Model name is required"}), 400
         
     try:
-        print(f"Starting model pull: {model}")
-        
         # First check if model exists
-        show_response = requests.get(f"{OLLAMA_API}/api/show", params={"name": model}, timeout=5)
+        show_response = ollama_client().get("/api/show", params={"name": model}, timeout=5)
         if show_response.status_code == 200:
-            print(f"Model {model} is already loaded")
+            logger.info("Model already installed, skipping pull", extra={"model": model})
             return jsonify({"message": "Model is already loaded"})
             
-        print(f"Pulling model {model} from Ollama API")
-        
-        # Stream the response to handle large models
-        with requests.post(
-            f"{OLLAMA_API}/api/pull",
-            json={"name": model},
-            stream=True,
-            timeout=None  # No timeout for large models
-        ) as response:
-            
-            if response.status_code != 200:
-                error_msg = "Failed to pull model"
-                try:
-                    error_data = response.json()
-                    if 'error' in error_data:
-                        error_msg = error_data['error']
-                except:
-                    error_msg = response.text
-                print(f"Error pulling model: {error_msg}")
-                return jsonify({"error": error_msg}), response.status_code
-            
-            total_downloaded = 0
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        progress = json.loads(line)
-                        if 'completed' in progress:
-                            total_downloaded = progress['completed']
-                            update_download_progress(total_downloaded)
-                            print(f"Download progress: {total_downloaded}%")
-                    except json.JSONDecodeError:
-                        print(f"Could not parse progress line: {line}")
-                        continue
-            
-            print(f"Successfully pulled model: {model}")
-            return jsonify({
-                "message": "Model pulled successfully",
-                "model": model,
-                "total_downloaded": total_downloaded
-            })
+        job = pull_manager().submit(model)
+        logger.info("Model pull submitted", extra={"model": model, "job_id": job.id})
+        return jsonify({
+            "message": "Model pull started",
+            "model": model,
+            "job_id": job.id,
+            "events_url": f"/pull_jobs/{job.id}/events"
+        }), 202
         
     except requests.exceptions.ConnectionError:
         error_msg = "Could not connect to Ollama. Is it running?"
-        print(f"Error: {error_msg}")
+        logger.error(error_msg)
         return jsonify({"error": error_msg}), 503
     except requests.exceptions.Timeout:
         error_msg = "Connection to Ollama timed out"
-        print(f"Error: {error_msg}")
+        logger.error(error_msg)
         return jsonify({"error": error_msg}), 504
     except Exception as e:
         error_msg = f"Error pulling model: {str(e)}"
-        print(f"Error: {error_msg}")
+        logger.exception("Error pulling model")
         return jsonify({"error": error_msg}), 500
 
 @bp.route('/download_model', methods=['POST'])
 def download_model():
-    global download_progress
     data = request.json
     model = data.get('model')
     
     if not model:
         return jsonify({"error": "No model specified"}), 400
     
-    def download_thread():
-        try:
-            response = requests.post(
-                f"{OLLAMA_API}/api/pull",
-                json={"name": model},
-                stream=True
-            )
-            
-            total_size = 0
-            downloaded = 0
-            
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        data = json.loads(line.decode())
-                        if 'total' in data:
-                            total_size = data['total']
-                        if 'completed' in data:
-                            downloaded = data['completed']
-                            if total_size > 0:
-                                progress = int((downloaded / total_size) * 100)
-                                update_download_progress(progress)
-                    except json.JSONDecodeError:
-                        continue
-            
-            update_download_progress(100)
-            
-        except Exception as e:
-            with download_lock:
-                download_progress["error"] = str(e)
-    
-    with download_lock:
-        download_progress = {"progress": 0, "error": None}
-    
-    thread = threading.Thread(target=download_thread)
-    thread.daemon = True
-    thread.start()
-    
-    return jsonify({"status": "Download started"})
+    job = pull_manager().submit(model)
+    return jsonify({"status": "Download started", "job_id": job.id})
 
 @bp.route('/download_progress')
 def get_download_progress():
-    with download_lock:
-        return jsonify(download_progress)
+    # Legacy polling endpoint; /pull_jobs/<id>/events streams the same information
+    job_id = request.args.get('job_id')
+    job = pull_manager().get(job_id) if job_id else pull_manager().latest()
+    if job is None:
+        return jsonify({"progress": 0, "error": None})
+    status = pull_manager().describe(job)
+    return jsonify({"progress": status["progress"]["percent"], "error": status["error"], "state": status["state"]})
+
+@bp.route('/pull_jobs', methods=['POST'])
+def create_pull_job():
+    data = request.get_json() or {}
+    model = data.get('model')
+    if not model:
+        return jsonify({"error": "Model name is required"}), 400
+    job = pull_manager().submit(model)
+    return jsonify(pull_manager().describe(job)), 202
+
+@bp.route('/pull_jobs', methods=['GET'])
+def list_pull_jobs():
+    manager = pull_manager()
+    return jsonify({"jobs": [manager.describe(job) for job in manager.jobs()]})
+
+@bp.route('/pull_jobs/<job_id>', methods=['GET'])
+def get_pull_job(job_id):
+    job = pull_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Pull job not found"}), 404
+    return jsonify(pull_manager().describe(job))
+
+@bp.route('/pull_jobs/<job_id>/cancel', methods=['POST'])
+def cancel_pull_job(job_id):
+    job = pull_manager().cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Pull job not found"}), 404
+    return jsonify(pull_manager().describe(job))
+
+@bp.route('/pull_jobs/<job_id>/events')
+def pull_job_events(job_id):
+    """Server-Sent Events stream of a pull job's progress until it finishes."""
+    manager = pull_manager()
+    job = manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Pull job not found"}), 404
+
+    def events():
+        version = None
+        while True:
+            if job.version != version:
+                version = job.version
+                yield f"event: progress\ndata: {json.dumps(manager.describe(job))}\n\n"
+            else:
+                # No change within the wait; keep the connection alive
+                yield ": keep-alive\n\n"
+            if not job.active:
+                return
+            manager.wait_for_update(job, version, timeout=15)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @bp.route('/process_image', methods=['POST'])
 def process_image():
     try:
-        data = request.json
+        # Multipart uploads stream the file to disk; JSON bodies carry base64 or an image_id
+        if request.mimetype == 'multipart/form-data':
+            data = request.form
+            image_data = store_uploaded_image()[0].data
+        else:
+            data = request.json
+            image_data = resolve_image(data)
         model = data.get('model')
-        image_data = data.get('image')  
         prompt = data.get('prompt', 'What do you see in this image?')
         
         if not model or not image_data:
             return jsonify({"error": "Model and image are required"}), 400
             
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-            
-        print(f"Processing image with model: {model}")  
-        print(f"Prompt: {prompt}")  
-        print(f"Image data length: {len(image_data)}")  
+        logger.info("Processing image", extra={"model": model, "prompt_chars": len(prompt), "image_bytes": len(image_data)})
         
-        payload = {
+        stream = request_flag(data.get('stream'), False)
+        payload = residency().apply({
             "model": model,
             "prompt": prompt,
             "images": [image_data],
-            "stream": False
-        }
-        
-        print("Sending request to Ollama...")  
-        
-        response = requests.post(
-            f"{OLLAMA_API}/api/generate",
-            json=payload,
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        print(f"Response status: {response.status_code}")  
+            "stream": stream
+        })
+        plan = fit_context(payload, request_flag(data.get('truncate')))
         
+        client = ollama_client()
+        try:
+            ticket = scheduler().submit(model)
+        except QueueFull as e:
+            return queue_full_response(e)
+
+        try:
+            token = track_generation(model)
+        except Exception:
+            scheduler().release(ticket)
+            raise
+        if stream:
+            send = lambda: client.post("/api/generate", json=payload, stream=True, cancel=token)
+            return scheduled_generation(ticket, send, cancel=token, model=model, budget=plan)
+
+        try:
+            if not wait_for_slot(ticket, token):
+                return jsonify({"error": "Timed out waiting in the generation queue"}), 503
+
+            response = client.post(
+                "/api/generate",
+                json=payload,
+                headers={'Content-Type': 'application/json'},
+                cancel=token
+            )
+        finally:
+            scheduler().release(ticket)
+            cancellation().finish(token)
+
         if response.status_code == 200:
             result = response.json()
-            print(f"Response from Ollama: {result}")  
             
             if 'error' in result:
                 error_msg = result['error']
-                print(f"Error from Ollama: {error_msg}")  
+                logger.error("Ollama could not process image: %s", error_msg, extra={"model": model})
                 return jsonify({"error": error_msg}), 500
+            
+            observe_generation(model, generation_stats(result))
                 
             return jsonify({
                 "response": result.get('response', ''),
-                "model": model
+                "model": model,
+                "budget": plan
             })
         else:
             try:
@@ -424,13 +1421,49 @@ def process_image():
             except Exception as e:
                 error_msg = f"Failed to process image (Status: {response.status_code})"
             
-            print(f"Error response: {error_msg}")  
+            logger.error("Ollama could not process image: %s", error_msg, extra={"model": model, "status": response.status_code})
             return jsonify({"error": error_msg}), 500
             
+    except ImageRejected as e:
+        return jsonify({"error": e.message}), e.status_code
+    except ContextOverflow as e:
+        return context_overflow_response(e)
+    except Cancelled as e:
+        return cancelled_response(e)
     except Exception as e:
-        print(f"Exception in process_image: {str(e)}")  
+        logger.exception("Error in process_image")
         return jsonify({"error": str(e)}), 500
 
+@bp.route('/cache_stats')
+def cache_stats():
+    cache = completion_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
+
+@bp.route('/generations')
+def list_generations():
+    """The caller's generations in flight, identified by their X-Cancel-Key."""
+    owner = request.headers.get(CANCEL_KEY_HEADER)
+    return jsonify({"generations": cancellation().active(owner) if owner else []})
+
+@bp.route('/generations/<request_id>/cancel', methods=['POST'])
+def cancel_generation(request_id):
+    # Someone else's generation gets the same 404 as a missing one
+    token = cancellation().cancel(request_id, request.headers.get(CANCEL_KEY_HEADER))
+    if token is None:
+        return jsonify({"error": "No generation running with that request id"}), 404
+    return jsonify(token.to_dict())
+
+@bp.route('/queue_status')
+def queue_status():
+    sched = scheduler()
+    status = sched.stats()
+    ticket_id = request.args.get('ticket')
+    if ticket_id:
+        status["position"] = sched.position(ticket_id)
+    return jsonify(status)
+
 @bp.route('/get_cwd')
 def get_cwd():
     try:
@@ -438,16 +1471,98 @@ def get_cwd():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def parse_timestamp(value):
+    """Accept epoch seconds or an ISO 8601 date/time."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def query_file_index(index):
+    """Run a paginated, filtered listing of `index` from the request's query string.
+
+    Supports `type` (comma-separated extensions), `name` (substring),
+    `min_size`/`max_size`, `modified_after`/`modified_before`, `sort`
+    (`path`, `name`, `type`, `size` or `modified`), `order` (`asc`/`desc`), `offset`, `limit` and
+    `refresh=1` to re-list every directory first. Without `limit` every match
+    is returned, as before the listing was paginated, unless
+    FILE_LIST_DEFAULT_LIMIT is set.
+    """
+    args = request.args
+    if args.get('refresh') == '1':
+        index.refresh(force=True)
+    offset = max(args.get('offset', 0, type=int), 0)
+    limit = args.get('limit', current_app.config['FILE_LIST_DEFAULT_LIMIT'] or None, type=int)
+    if limit is not None:
+        limit = min(max(limit, 1), current_app.config['FILE_LIST_MAX_LIMIT'])
+    entries, total = index.query(
+        file_type=args.get('type'),
+        name=args.get('name'),
+        min_size=args.get('min_size', type=int),
+        max_size=args.get('max_size', type=int),
+        modified_after=parse_timestamp(args['modified_after']) if args.get('modified_after') else None,
+        modified_before=parse_timestamp(args['modified_before']) if args.get('modified_before') else None,
+        sort=args.get('sort', 'path'),
+        descending=args.get('order', 'asc') == 'desc',
+        offset=offset,
+        limit=limit
+    )
+    page = {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if limit is not None and offset + limit < total else None
+    }
+    return entries, page
+
+def generated_code_dir():
+    return current_app.config['GENERATED_CODE_DIR']
+
+def file_index():
+    return current_app.extensions['file_index']
+
+def search_index():
+    return current_app.extensions['search']
+
+@bp.route('/search')
+def search_files():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "No search query provided"}), 400
+    mode = request.args.get('mode', 'text')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    file_type = request.args.get('type')
+    index = search_index()
+    try:
+        if mode == 'semantic':
+            if not index.semantic:
+                return jsonify({"error": "Semantic search is not enabled; set SEARCH_EMBED_MODEL"}), 400
+            matches = index.similar(query, limit, file_type)
+        elif mode == 'text':
+            matches = index.search(query, limit, file_type)
+        else:
+            return jsonify({"error": "mode must be 'text' or 'semantic'"}), 400
+
+        results = [
+            {"path": path, "score": score, "snippet": index.snippet(path, query)}
+            for path, score in matches
+        ]
+        return jsonify({"query": query, "mode": mode, "results": results, "index": index.stats()})
+    except OllamaError as e:
+        return jsonify(e.to_dict()), e.status_code
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": f"Could not reach Ollama: {str(e)}"}), 503
+    except Exception as e:
+        logger.exception("Error in search_files")
+        return jsonify({"error": str(e)}), 500
+
 @bp.route('/list_files')
 def list_files():
     try:
-        files = []
-        for root, dirs, filenames in os.walk(GENERATED_CODE_DIR):
-            for filename in filenames:
-                full_path = os.path.join(root, filename)
-                rel_path = os.path.relpath(full_path, GENERATED_CODE_DIR)
-                files.append(rel_path)
-        return jsonify({"files": files})
+        entries, page = query_file_index(file_index())
+        return jsonify({"files": [entry.path for entry in entries], **page})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -476,6 +1591,67 @@ def get_file_content():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def serve_file(path):
+    """Send a file with ETag, Last-Modified and Range support, compressing text when the client accepts it."""
+    stat = os.stat(path)
+    mimetype = guess_mimetype(path)
+    encoding = None
+    # Ranges always refer to the uncompressed bytes
+    if is_text(mimetype) and 'Range' not in request.headers and stat.st_size >= MIN_COMPRESS_BYTES:
+        encoding = negotiate_encoding(request.accept_encodings)
+
+    # Saved files are links to shared blobs, so the inode tells versions apart where mtime cannot
+    version = f"{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}-{encoding or 'identity'}"
+    response = send_file(
+        current_app.extensions['compressed_files'].get(path, encoding, version) if encoding else path,
+        mimetype=mimetype,
+        as_attachment=request.args.get('download') == '1',
+        download_name=os.path.basename(path),
+        conditional=True,
+        etag=hashlib.sha1(f"{path}\0{version}".encode('utf-8')).hexdigest(),
+        last_modified=stat.st_mtime,
+        max_age=0
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+@bp.route('/files/<path:file_name>')
+def download_file(file_name):
+    file_path = safe_join(generated_code_dir(), file_name)
+    if file_path is None:
+        return jsonify({"error": "Invalid file path"}), 403
+    if not os.path.isfile(file_path):
+        return jsonify({"error": "File not found"}), 404
+    return serve_file(file_path)
+
+@bp.route('/zip_files', methods=['GET', 'POST'])
+def zip_files():
+    """Stream a zip of the named files, or of everything in generated_code when none are named."""
+    if request.method == 'POST':
+        names = (request.get_json(silent=True) or {}).get('files') or []
+    else:
+        names = request.args.getlist('files')
+    if not names:
+        entries, _ = file_index().query()
+        names = [entry.path for entry in entries]
+
+    files = []
+    for name in names:
+        file_path = safe_join(generated_code_dir(), name)
+        if file_path is None:
+            return jsonify({"error": f"Invalid file path: {name}"}), 403
+        if not os.path.isfile(file_path):
+            return jsonify({"error": f"File not found: {name}"}), 404
+        files.append((name, file_path))
+
+    return Response(
+        stream_with_context(stream_zip(files)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename="generated_code.zip"'}
+    )
+
 @bp.route('/check_files', methods=['POST'])
 def check_files():
     try:
@@ -485,43 +1661,28 @@ def check_files():
         if not files:
             return jsonify({"error": "No files to check"}), 400
             
+        files = [
+            (file['filename'], file['content'])
+            for file in files
+            if file.get('filename') and file.get('content')
+        ]
+        results = current_app.extensions['validation'].validate(files)
+
         errors = []
-        
-        for file in files:
-            filename = file.get('filename')
-            content = file.get('content')
-            
-            if not filename or not content:
-                continue
-                
-            if filename.endswith('.py'):
-                try:
-                    compile(content, filename, 'exec')
-                except Exception as e:
-                    errors.append(f"Error in {filename}: {str(e)}")
-            elif filename.endswith('.js'):
-                try:
-                    process = subprocess.run(
-                        ['node', '--check'],
-                        input=content,
-                        text=True,
-                        capture_output=True
-                    )
-                    if process.returncode != 0:
-                        errors.append(f"Error in {filename}: {process.stderr}")
-                except Exception as e:
-                    errors.append(f"Error in {filename}: {str(e)}")
-            elif filename.endswith(('.html', '.htm')):
-                if not content.strip().startswith('<!DOCTYPE') and not content.strip().startswith('<html'):
-                    errors.append(f"Warning in {filename}: Missing DOCTYPE or html tag")
+        for result in results:
+            for found in result['issues']:
+                label = "Error" if found['severity'] == 'error' else "Warning"
+                location = f" (line {found['line']})" if found['line'] else ""
+                errors.append(f"{label} in {result['filename']}{location}: {found['message']}")
                     
         if errors:
             return jsonify({
                 "message": "Found some issues:",
-                "errors": errors
+                "errors": errors,
+                "results": results
             })
             
-        return jsonify({"message": "All files passed validation!"})
+        return jsonify({"message": "All files passed validation!", "results": results})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -529,18 +1690,17 @@ def check_files():
 @bp.route('/debug_ollama')
 def debug_ollama():
     try:
-        print("Testing Ollama connection...")
-        response = requests.get(f"{OLLAMA_API}/api/tags")
-        print(f"Response status: {response.status_code}")
-        print(f"Response headers: {response.headers}")
-        print(f"Response text: {response.text}")
+        response = ollama_client().get("/api/tags")
+        logger.debug("Ollama debug probe", extra={"backend": response.backend.url, "status": response.status_code})
         return jsonify({
             "status": response.status_code,
             "headers": dict(response.headers),
-            "text": response.text
+            "text": response.text,
+            "backend": response.backend.url,
+            "backends": ollama_client().status()
         })
     except Exception as e:
-        print(f"Exception testing Ollama: {str(e)}")
+        logger.exception("Error testing Ollama connection")
         return jsonify({"error": str(e)}), 500
 
 @bp.route('/check_file', methods=['POST'])
@@ -564,34 +1724,37 @@ def check_file():
         exists = any(os.path.exists(loc) for loc in possible_locations)
         return jsonify({'exists': exists})
     except Exception as e:
-        print(f"Error in check_file: {str(e)}")
+        logger.exception("Error in check_file")
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/list_generated_files')
 def list_generated_files():
     try:
-        # Get all files from generated_code directory
-        upload_folder = ensure_upload_folder()
-        files = []
-        
-        for root, _, filenames in os.walk(upload_folder):
-            for filename in filenames:
-                full_path = os.path.join(root, filename)
-                rel_path = os.path.relpath(full_path, upload_folder)
-                file_type = os.path.splitext(filename)[1][1:] or 'txt'
-                
-                files.append({
-                    'name': filename,
-                    'path': rel_path,
-                    'type': file_type,
-                    'size': os.path.getsize(full_path)
-                })
-        
-        return jsonify({'files': files})
+        # Served from the index of the generated_code directory instead of walking it
+        ensure_upload_folder()
+        entries, page = query_file_index(current_app.extensions['upload_index'])
+        return jsonify({'files': [entry.to_dict() for entry in entries], **page})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        print(f"Error in list_files: {str(e)}")
+        logger.exception("Error in list_generated_files")
         return jsonify({'error': str(e)}), 500
 
+def find_generated_file(file_name):
+    """Look for a file in the same places as get_generated_file_content."""
+    for folder in ('generated_code', 'templates', 'static'):
+        file_path = safe_join(os.path.join(current_app.root_path, folder), file_name)
+        if file_path is not None and os.path.isfile(file_path):
+            return file_path
+    return None
+
+@bp.route('/generated_files/<path:file_name>')
+def download_generated_file(file_name):
+    file_path = find_generated_file(file_name)
+    if file_path is None:
+        return jsonify({'error': 'File not found'}), 404
+    return serve_file(file_path)
+
 @bp.route('/get_generated_file_content', methods=['POST'])
 def get_generated_file_content():
     try:
@@ -627,7 +1790,7 @@ def get_generated_file_content():
         })
         
     except Exception as e:
-        print(f"Error in get_file_content: {str(e)}")
+        logger.exception("Error in get_generated_file_content")
         return jsonify({'error': str(e)}), 500
 
 def ensure_upload_folder():
@@ -652,20 +1815,49 @@ def create_directories():
 @bp.route('/check_ollama')
 def check_ollama():
     try:
-        response = requests.get(f"{OLLAMA_API}/api/tags", timeout=5)
-        if response.status_code == 200:
-            return jsonify({"status": "running"})
-        else:
-            return jsonify({"error": "Ollama is not responding correctly"}), 503
-    except requests.exceptions.ConnectionError:
-        return jsonify({"error": "Could not connect to Ollama. Please ensure Ollama is running (ollama serve)"}), 503
-    except requests.exceptions.Timeout:
-        return jsonify({"error": "Connection to Ollama timed out"}), 504
+        pool = ollama_client()
+        pool.check_all()
+        backends = pool.status()
+        healthy = [backend for backend in backends if backend['healthy']]
+        if healthy:
+            return jsonify({"status": "running", "backends": backends})
+
+        errors = [backend['last_error'] or '' for backend in backends]
+        if any('timed out' in error.lower() for error in errors):
+            return jsonify({"error": "Connection to Ollama timed out", "backends": backends}), 504
+        if any(error == "Ollama is not responding correctly" for error in errors):
+            return jsonify({"error": "Ollama is not responding correctly", "backends": backends}), 503
+        return jsonify({
+            "error": "Could not connect to Ollama. Please ensure Ollama is running (ollama serve)",
+            "backends": backends
+        }), 503
     except Exception as e:
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
+@bp.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+    assign_request_id()
+
 @bp.after_request
 def after_request(response):
+    # Route templates rather than raw paths keep metric label cardinality bounded
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    if 'request_started' in g:
+        elapsed = time.perf_counter() - g.request_started
+        HTTP_LATENCY.observe(elapsed, route=route)
+        logger.info("%s %s %s", request.method, request.path, response.status_code, extra={
+            "route": route, "status": response.status_code, "duration_ms": round(elapsed * 1000, 1)})
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    if 'cancel_key' in g:
+        response.headers[CANCEL_KEY_HEADER] = g.cancel_key
+
     # Add security headers with font support
     response.headers['Content-Security-Policy'] = (
         "default-src 'self' 'unsafe-inline' 'unsafe-eval' https:; "
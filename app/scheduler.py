@@ -0,0 +1,143 @@
+import itertools
+import threading
+import time
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its length limit."""
+
+    def __init__(self, retry_after):
+        super().__init__("Generation queue is full")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A generation job's place in the scheduler queue."""
+
+    def __init__(self, job_id, model):
+        self.id = job_id
+        self.model = model
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.admitted = False
+        self.released = False
+
+
+class Scheduler:
+    """Admission control for generation requests sent to Ollama.
+
+    Caps how many generations run at once, both globally and per model. When
+    a slot frees up, queued jobs for a model that is already running (or ran
+    most recently) go first, so Ollama is not made to swap models back and
+    forth under mixed load. A job that has waited longer than
+    `max_skip_seconds` is admitted next regardless, so no model starves.
+    """
+
+    def __init__(self, max_concurrent=2, max_per_model=2, max_queue=64, max_skip_seconds=30):
+        self.max_concurrent = max_concurrent
+        self.max_per_model = max_per_model
+        self.max_queue = max_queue
+        self.max_skip_seconds = max_skip_seconds
+        self._cond = threading.Condition()
+        self._ids = itertools.count(1)
+        self._waiting = []
+        self._tickets = {}
+        self._running = {}
+        self._last_model = None
+        self._avg_job_seconds = 10.0
+
+    def _running_total(self):
+        return sum(self._running.values())
+
+    def _can_run(self, model):
+        return (self._running_total() < self.max_concurrent
+                and self._running.get(model, 0) < self.max_per_model)
+
+    def _next_ticket(self):
+        runnable = [t for t in self._waiting if self._can_run(t.model)]
+        if not runnable:
+            return None
+
+        oldest = runnable[0]
+        if time.monotonic() - oldest.enqueued > self.max_skip_seconds:
+            return oldest
+        for ticket in runnable:
+            if self._running.get(ticket.model):
+                return ticket
+        for ticket in runnable:
+            if ticket.model == self._last_model:
+                return ticket
+        return oldest
+
+    def _dispatch(self):
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            self._waiting.remove(ticket)
+            ticket.admitted = True
+            ticket.started = time.monotonic()
+            self._running[ticket.model] = self._running.get(ticket.model, 0) + 1
+            self._last_model = ticket.model
+        self._cond.notify_all()
+
+    def retry_after(self):
+        """Rough seconds until the queue has room again."""
+        with self._cond:
+            slots = max(self.max_concurrent, 1)
+            return max(1, int(self._avg_job_seconds * (len(self._waiting) + 1) / slots))
+
+    def submit(self, model):
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                raise QueueFull(self.retry_after())
+            ticket = Ticket(str(next(self._ids)), model)
+            self._waiting.append(ticket)
+            self._tickets[ticket.id] = ticket
+            self._dispatch()
+            return ticket
+
+    def wait(self, ticket, timeout=None):
+        """Block until `ticket` is admitted; returns False if `timeout` expires first."""
+        with self._cond:
+            return self._cond.wait_for(lambda: ticket.admitted, timeout=timeout)
+
+    def release(self, ticket):
+        """Free the ticket's slot, or drop it from the queue if it never ran."""
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._tickets.pop(ticket.id, None)
+            if ticket.admitted:
+                self._running[ticket.model] -= 1
+                if not self._running[ticket.model]:
+                    del self._running[ticket.model]
+                elapsed = time.monotonic() - ticket.started
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+            self._dispatch()
+
+    def position(self, ticket_or_id):
+        """1-based queue position, 0 once running, or None for unknown tickets."""
+        with self._cond:
+            ticket = ticket_or_id
+            if not isinstance(ticket, Ticket):
+                ticket = self._tickets.get(ticket_or_id)
+            if ticket is None or ticket.released:
+                return None
+            if ticket.admitted:
+                return 0
+            return self._waiting.index(ticket) + 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queued": len(self._waiting),
+                "running": self._running_total(),
+                "running_by_model": dict(self._running),
+                "max_concurrent": self.max_concurrent,
+                "max_per_model": self.max_per_model,
+                "max_queue": self.max_queue
+            }
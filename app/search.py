@@ -0,0 +1,320 @@
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # Semantic search is disabled without NumPy
+    np = None
+
+from .ollama_client import OllamaError
+
+WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+# Splits identifiers like parseHTTPResponse into parse, http, response
+CAMEL_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+# Only this much of a file is sent to the embedding model
+EMBED_MAX_CHARS = 8000
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text):
+    """Yield lowercased search terms, splitting snake_case and camelCase identifiers."""
+    for word in WORD_PATTERN.findall(text):
+        lower = word.lower()
+        if len(lower) > 1:
+            yield lower
+        parts = [part.lower() for chunk in word.split('_') for part in CAMEL_PATTERN.findall(chunk)]
+        if len(parts) > 1:
+            for part in parts:
+                if len(part) > 1:
+                    yield part
+
+
+class InvertedIndex:
+    """Term -> document postings, ranked with BM25."""
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            self._doc_terms[doc_id] = terms
+            length = sum(terms.values())
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[doc_id] = count
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+
+    def search(self, query, accept=None):
+        """Return (doc_id, score) pairs for `query`, best first."""
+        terms = set(tokenize(query))
+        scores = {}
+        with self._lock:
+            count = len(self._doc_terms)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = 1 - self.b + self.b * self._doc_lengths[doc_id] / average_length
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+        results = [(doc_id, score) for doc_id, score in scores.items() if accept is None or accept(doc_id)]
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results
+
+
+class VectorIndex:
+    """Unit-normalised embeddings in one NumPy matrix for top-k cosine queries."""
+
+    def __init__(self):
+        self._keys = []
+        self._positions = {}
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _normalise(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, key, vector):
+        vector = self._normalise(vector)
+        with self._lock:
+            if self._matrix is not None and self._matrix.shape[1] != vector.shape[0]:
+                # The embedding model changed; old vectors are not comparable
+                self._keys, self._positions, self._matrix = [], {}, None
+            if self._matrix is None:
+                self._matrix = np.zeros((16, vector.shape[0]), dtype=np.float32)
+            position = self._positions.get(key)
+            if position is None:
+                position = len(self._keys)
+                if position == self._matrix.shape[0]:
+                    self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+                self._keys.append(key)
+                self._positions[key] = position
+            self._matrix[position] = vector
+
+    def remove(self, key):
+        with self._lock:
+            position = self._positions.pop(key, None)
+            if position is None:
+                return
+            # Move the last row into the gap so the matrix stays dense
+            last = len(self._keys) - 1
+            if position != last:
+                moved = self._keys[last]
+                self._matrix[position] = self._matrix[last]
+                self._keys[position] = moved
+                self._positions[moved] = position
+            self._keys.pop()
+
+    def search(self, vector, limit, accept=None):
+        """Return up to `limit` (key, cosine similarity) pairs, best first."""
+        query = self._normalise(vector)
+        with self._lock:
+            count = len(self._keys)
+            if not count or self._matrix.shape[1] != query.shape[0]:
+                return []
+            scores = self._matrix[:count] @ query
+            keys = list(self._keys)
+        if accept is None and limit < count:
+            order = np.argpartition(-scores, limit)[:limit]
+            order = order[np.argsort(-scores[order])]
+        else:
+            order = np.argsort(-scores)
+        results = []
+        for position in order:
+            key = keys[position]
+            if accept is None or accept(key):
+                results.append((key, float(scores[position])))
+                if len(results) == limit:
+                    break
+        return results
+
+
+def ollama_embedder(client, model):
+    """Return a function that embeds text with `model` through Ollama's /api/embeddings."""
+    def embed(text):
+        response = client.post("/api/embeddings", json={"model": model, "prompt": text})
+        if response.status_code != 200:
+            raise OllamaError(f"Embedding failed: {response.text}", response.status_code)
+        return response.json()['embedding']
+    return embed
+
+
+class SearchIndex:
+    """Keyword and semantic search over the files of a FileIndex.
+
+    Files the app writes are passed to `update()` and indexed on their own.
+    Other changes to the FileIndex (on startup, or made outside the app)
+    are found by comparing every file's size and mtime, and only files that
+    differ are re-read.
+    When `embed` is given (and NumPy is installed), changed files are also
+    embedded on a background worker, so saving never waits on the model.
+    """
+
+    def __init__(self, file_index, embed=None, max_file_bytes=1024 * 1024):
+        self.file_index = file_index
+        self.embed = embed if np is not None else None
+        self.max_file_bytes = max_file_bytes
+        self.text = InvertedIndex()
+        self.vectors = VectorIndex() if self.embed else None
+        self.pending_embeddings = 0
+        self.embedding_errors = 0
+        self._signatures = {}
+        self._types = {}
+        self._synced_version = None
+        self._sync_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if self.embed else None
+
+    @property
+    def semantic(self):
+        return self.embed is not None
+
+    def _read(self, path):
+        full_path = os.path.join(self.file_index.root, path)
+        try:
+            with open(full_path, 'rb') as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            return None
+        if len(data) > self.max_file_bytes or b'\0' in data:
+            return None  # Too large or binary
+        return data.decode('utf-8', errors='replace')
+
+    def _index(self, entry):
+        signature = (entry.size, entry.modified)
+        self._signatures[entry.path] = signature
+        self._types[entry.path] = entry.type.lower()
+        text = self._read(entry.path)
+        if text is None:
+            self._drop(entry.path)
+            return
+        self.text.add(entry.path, text)
+        if self.embed:
+            self.pending_embeddings += 1
+            self._executor.submit(self._embed, entry.path, signature, text)
+
+    def _embed(self, path, signature, text):
+        try:
+            vector = self.embed(text[:EMBED_MAX_CHARS])
+            # Skip the result if the file changed again while we were waiting
+            if self._signatures.get(path) == signature:
+                self.vectors.add(path, vector)
+        except Exception as e:
+            self.embedding_errors += 1
+            logger.warning("Could not embed %s: %s", path, e)
+        finally:
+            self.pending_embeddings -= 1
+
+    def _drop(self, path):
+        self.text.remove(path)
+        if self.vectors is not None:
+            self.vectors.remove(path)
+
+    def sync(self):
+        """Re-index files that were added, changed or removed since the last sync."""
+        self.file_index.refresh()
+        with self._sync_lock:
+            if self.file_index.version == self._synced_version:
+                return
+            version = self.file_index.version
+            entries, _ = self.file_index.query()
+            current = set()
+            for entry in entries:
+                current.add(entry.path)
+                if self._signatures.get(entry.path) != (entry.size, entry.modified):
+                    self._index(entry)
+            for path in set(self._signatures) - current:
+                del self._signatures[path]
+                self._types.pop(path, None)
+                self._drop(path)
+            self._synced_version = version
+
+    def update(self, *paths):
+        """Index files right after the app wrote them, without comparing every file."""
+        before, after = self.file_index.touch(*paths)
+        with self._sync_lock:
+            for path in paths:
+                entry = self.file_index.get(os.path.relpath(os.path.abspath(path), self.file_index.root))
+                if entry is not None and self._signatures.get(entry.path) != (entry.size, entry.modified):
+                    self._index(entry)
+            # If nothing else changed since the last sync, these files were the whole difference
+            if self._synced_version == before:
+                self._synced_version = after
+
+    def _type_filter(self, file_type):
+        if not file_type:
+            return None
+        types = {t.strip().lstrip('.').lower() for t in file_type.split(',')}
+        return lambda path: self._types.get(path) in types
+
+    def search(self, query, limit=10, file_type=None):
+        self.sync()
+        return self.text.search(query, self._type_filter(file_type))[:limit]
+
+    def similar(self, query, limit=10, file_type=None):
+        if not self.semantic:
+            raise ValueError("Semantic search is not enabled")
+        self.sync()
+        return self.vectors.search(self.embed(query), limit, self._type_filter(file_type))
+
+    def snippet(self, path, query, width=200):
+        """The first line of `path` that mentions a query term, with its line number."""
+        text = self._read(path)
+        if not text:
+            return None
+        terms = set(tokenize(query))
+        for number, line in enumerate(text.splitlines(), 1):
+            if terms & set(tokenize(line)):
+                return {"line": number, "text": line.strip()[:width]}
+        first = text.lstrip().splitlines()
+        return {"line": 1, "text": first[0].strip()[:width]} if first else None
+
+    def stats(self):
+        return {
+            "documents": len(self.text),
+            "semantic": self.semantic,
+            "vectors": len(self.vectors) if self.vectors is not None else 0,
+            "pending_embeddings": self.pending_embeddings,
+            "embedding_errors": self.embedding_errors
+        }
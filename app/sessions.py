@@ -0,0 +1,124 @@
+import threading
+import time
+import uuid
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English and code)."""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    """Server-side state for one multi-turn conversation.
+
+    `messages` holds the full transcript; only `messages[window_start:]` is
+    sent to Ollama. Older turns are folded into `summary`.
+    """
+
+    def __init__(self, model, system=None):
+        self.id = uuid.uuid4().hex
+        self.model = model
+        self.system = system
+        self.messages = []
+        self.window_start = 0
+        self.summary = None
+        self.backend_url = None
+        self.created = time.time()
+        self.updated = self.created
+        self.busy = False
+        self.lock = threading.Lock()
+
+    def window(self):
+        return self.messages[self.window_start:]
+
+    def prompt_messages(self):
+        """Messages to send to /api/chat: system prompt, summary, then the window."""
+        messages = []
+        if self.system:
+            messages.append({"role": "system", "content": self.system})
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        return messages + self.window()
+
+    def window_tokens(self):
+        return sum(estimate_tokens(m['content']) for m in self.prompt_messages())
+
+    def trim(self, budget, low_water=0.5):
+        """Drop the oldest turns once the window exceeds `budget` tokens.
+
+        Trimming goes down to `low_water * budget` in one step rather than a
+        turn at a time. The prompt prefix then stays identical across the
+        following turns, so Ollama can keep reusing its KV cache instead of
+        re-evaluating the whole history every time. Returns the dropped
+        messages so the caller can summarise them.
+        """
+        if self.window_tokens() <= budget:
+            return []
+
+        target = budget * low_water
+        window = self.window()
+        tokens = self.window_tokens()
+        dropped = 0
+        # Always keep the latest message, which is the user turn being answered
+        while dropped < len(window) - 1 and tokens > target:
+            tokens -= estimate_tokens(window[dropped]['content'])
+            dropped += 1
+        # Never start the window on an assistant reply
+        while dropped < len(window) - 1 and window[dropped]['role'] == 'assistant':
+            dropped += 1
+
+        self.window_start += dropped
+        return window[:dropped]
+
+    def to_dict(self, include_messages=True):
+        data = {
+            "session_id": self.id,
+            "model": self.model,
+            "system": self.system,
+            "summary": self.summary,
+            "turns": len(self.messages),
+            "window_start": self.window_start,
+            "window_tokens": self.window_tokens(),
+            "created": self.created,
+            "updated": self.updated
+        }
+        if include_messages:
+            data["messages"] = self.messages
+        return data
+
+
+class SessionStore:
+    """In-memory chat sessions, evicting the idlest once `max_sessions` is reached."""
+
+    def __init__(self, max_sessions=1000, idle_ttl=3600):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.time() - self.idle_ttl
+        for session_id in [sid for sid, s in self._sessions.items() if s.updated < cutoff]:
+            del self._sessions[session_id]
+        while len(self._sessions) >= self.max_sessions:
+            idlest = min(self._sessions.values(), key=lambda s: s.updated)
+            del self._sessions[idlest.id]
+
+    def create(self, model, system=None):
+        session = ChatSession(model, system)
+        with self._lock:
+            self._expire()
+            self._sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.updated < time.time() - self.idle_ttl:
+                del self._sessions[session_id]
+                return None
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
@@ -0,0 +1,344 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: history appends are serialised within the process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# How long the fsync thread waits for more writes to join a round
+FSYNC_WINDOW = 0.002
+# Bytes read from the end of a history log to find its latest entry; entries are ~100 bytes
+LOG_TAIL_BYTES = 4096
+
+
+def last_hash(tail):
+    """The hash in the last complete entry of a history log's tail, or None."""
+    # The first line may be cut short and the last torn by a crash; neither parses
+    for line in reversed(tail.splitlines()):
+        try:
+            return json.loads(line)["hash"]
+        except (ValueError, KeyError):
+            continue
+    return None
+
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FsyncBatcher:
+    """Group commit for fsync.
+
+    Writers hand over the files and directories that must reach disk and
+    wait. A single thread gathers everything submitted within a short window
+    and syncs each path once, so concurrent saves share one round of
+    flushes, and a directory holding many new files is synced only once.
+    """
+
+    def __init__(self, window=FSYNC_WINDOW):
+        self.window = window
+        self.rounds = 0
+        self.synced = 0
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def sync(self, paths):
+        """Block until every path in `paths` has been fsynced."""
+        paths = list(dict.fromkeys(paths))
+        if not paths:
+            return
+        request = {"paths": paths, "done": threading.Event(), "error": None}
+        with self._cond:
+            self._pending.append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='fsync')
+                self._thread.start()
+            self._cond.notify()
+        request["done"].wait()
+        if request["error"] is not None:
+            raise request["error"]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(self.window)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            errors = {}
+            # Files before directories, so a synced directory entry never points at unsynced data
+            paths = dict.fromkeys(path for request in batch for path in request["paths"])
+            for path in sorted(paths, key=os.path.isdir):
+                try:
+                    fsync_path(path)
+                except OSError as e:
+                    errors[path] = e
+            self.rounds += 1
+            self.synced += len(paths)
+            for request in batch:
+                request["error"] = next((errors[p] for p in request["paths"] if p in errors), None)
+                request["done"].set()
+
+
+class CodeStore:
+    """Content-addressed storage behind the files in `root`.
+
+    Every saved version is kept once, as an immutable blob named by the
+    SHA-256 of its content under `store_dir/objects`. A file in `root` is a
+    named reference to a blob: by default a separate, writable copy with
+    its own mtime. With `link` it is a hard link to the blob itself, so
+    saving the same code again costs no disk, but every file with that
+    content shares one read-only inode and its mtime. Each file's versions
+    are listed in an append-only log under `store_dir/history`. A save
+    holds an exclusive flock on each of its files' logs, so worker
+    processes sharing the store keep every log whole and in step with its
+    file.
+
+    Saves are atomic: a file is staged beside its target and renamed into
+    place, so readers see the old or the new content, never a mix. Blobs,
+    files, history and their directories are fsynced through a shared
+    FsyncBatcher before a save returns.
+    """
+
+    def __init__(self, root, store_dir, link=False, batcher=None):
+        self.root = os.path.abspath(root)
+        self.store_dir = os.path.abspath(store_dir)
+        self.objects_dir = os.path.join(self.store_dir, 'objects')
+        self.history_dir = os.path.join(self.store_dir, 'history')
+        self.link = link
+        self.batcher = batcher or FsyncBatcher()
+        self.blobs_written = 0
+        self.blobs_reused = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.history_dir, exist_ok=True)
+        # Saves to the same file are serialised so its history stays in order
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def path(self, relative):
+        return os.path.join(self.root, relative)
+
+    def blob_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def history_path(self, relative):
+        return os.path.join(self.history_dir, relative + '.jsonl')
+
+    def _lock_for(self, relative):
+        with self._locks_lock:
+            return self._locks.setdefault(relative, threading.Lock())
+
+    def _store_blob(self, data, digest, to_sync):
+        """Write a blob unless it exists; returns its path and whether it had to be staged."""
+        blob = self.blob_path(digest)
+        if os.path.exists(blob):
+            self.blobs_reused += 1
+            return blob, None
+        directory = os.path.dirname(blob)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # Blobs never change; a read-only mode keeps linked files from being edited in place
+        os.chmod(tmp_path, 0o444)
+        to_sync.append(tmp_path)
+        return blob, tmp_path
+
+    def _stage_file(self, blob, path, to_sync):
+        """Put the blob's content in a temporary file beside `path`."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+        if self.link:
+            try:
+                # Touching the link would change the mtime of every file sharing the blob
+                os.link(blob, tmp_path)
+                return tmp_path
+            except OSError as e:
+                logger.debug("Could not link blob, copying instead: %s", e)
+        shutil.copyfile(blob, tmp_path)
+        os.chmod(tmp_path, 0o644)
+        to_sync.append(tmp_path)
+        return tmp_path
+
+    def save(self, files):
+        """Save (relative path, text) pairs all-or-nothing; returns each file's new version entry.
+
+        If any step fails before the files are in place, files already
+        replaced get their previous content back and new ones are removed.
+        """
+        files = [(relative, content.encode('utf-8')) for relative, content in files]
+        relatives = sorted({relative for relative, _ in files})
+        locks = [self._lock_for(relative) for relative in relatives]
+        for lock in locks:
+            lock.acquire()
+        logs = {}
+        try:
+            for relative in relatives:
+                logs[relative] = self._open_log(relative)
+            return self._save(files, logs)
+        finally:
+            for log in logs.values():
+                log.close()
+            for lock in reversed(locks):
+                lock.release()
+
+    def _open_log(self, relative):
+        """Open a file's history log for appending, holding its lock until it is closed.
+
+        Other processes may save the same file, so the lock covers the whole
+        save, keeping the file and its history in the same order.
+        """
+        log = self.history_path(relative)
+        os.makedirs(os.path.dirname(log), exist_ok=True)
+        f = open(log, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def _save(self, files, logs):
+        to_sync = []
+        blobs = []
+        staged_blobs = []
+        staged = []
+        replaced = []
+        backups = {}
+        try:
+            for relative, data in files:
+                digest = hashlib.sha256(data).hexdigest()
+                blob, tmp_blob = self._store_blob(data, digest, to_sync)
+                if tmp_blob is not None:
+                    staged_blobs.append((tmp_blob, blob))
+                blobs.append((relative, digest, len(data), blob))
+            # Blob content must be durable before the renames that publish it
+            self.batcher.sync(to_sync)
+            to_sync = []
+            for tmp_blob, blob in staged_blobs:
+                if os.path.exists(blob):
+                    os.unlink(tmp_blob)  # Another save wrote the same content first
+                else:
+                    os.replace(tmp_blob, blob)
+                    self.blobs_written += 1
+                to_sync.append(os.path.dirname(blob))
+            staged_blobs = []
+
+            for relative, _, _, blob in blobs:
+                path = self.path(relative)
+                staged.append((self._stage_file(blob, path, to_sync), path))
+            self.batcher.sync(to_sync)
+            to_sync = []
+
+            for tmp_path, path in staged:
+                if os.path.exists(path) and os.path.samefile(tmp_path, path):
+                    # Already linked to this blob; renaming a link onto itself would do nothing
+                    os.unlink(tmp_path)
+                    continue
+                if os.path.exists(path):
+                    backup = f"{tmp_path}.bak"
+                    os.link(path, backup)
+                    backups[path] = backup
+                os.replace(tmp_path, path)
+                replaced.append(path)
+                to_sync.append(os.path.dirname(path))
+        except BaseException:
+            for path in reversed(replaced):
+                if path in backups:
+                    os.replace(backups.pop(path), path)
+                else:
+                    os.unlink(path)
+            for tmp_path, path in staged:
+                if path not in replaced and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+            for tmp_blob, _ in staged_blobs:
+                if os.path.exists(tmp_blob):
+                    os.unlink(tmp_blob)
+            raise
+        finally:
+            for backup in backups.values():
+                if os.path.exists(backup):
+                    os.unlink(backup)
+
+        # The files are in place; history only has to follow them
+        saved_at = time.time()
+        entries = []
+        for relative, digest, size, _ in blobs:
+            entry = {"hash": digest, "size": size, "saved_at": saved_at}
+            try:
+                if self._append_history(logs[relative], entry):
+                    log = self.history_path(relative)
+                    to_sync.extend((log, os.path.dirname(log)))
+            except OSError as e:
+                logger.error("Could not record history for %s: %s", relative, e)
+            entries.append({"path": relative, **entry})
+        self.batcher.sync(to_sync)
+        return entries
+
+    def _append_history(self, f, entry):
+        """Append `entry` to an open, locked log unless its hash is already the latest; returns whether it was added."""
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - LOG_TAIL_BYTES, 0))
+        tail = f.read()
+        if last_hash(tail) == entry["hash"]:
+            return False
+        # Start a fresh line after one torn by a crash mid-append
+        torn = bool(tail) and not tail.endswith(b"\n")
+        f.write((b"\n" if torn else b"") + json.dumps(entry).encode('utf-8') + b"\n")
+        f.flush()
+        return True
+
+    def history(self, relative):
+        """Every saved version of a file, oldest first, numbered from 1."""
+        log = self.history_path(relative)
+        if not os.path.exists(log):
+            return []
+        versions = []
+        with open(log, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A torn last line from a crash mid-append
+                versions.append({"version": len(versions) + 1, **entry})
+        return versions
+
+    def version_path(self, relative, version):
+        """The blob holding `version` of a file, or None."""
+        versions = self.history(relative)
+        if not 1 <= version <= len(versions):
+            return None
+        blob = self.blob_path(versions[version - 1]["hash"])
+        return blob if os.path.exists(blob) else None
+
+    def restore(self, relative, version):
+        """Make an earlier version current again; returns the new entry, or None if there is no such version."""
+        blob = self.version_path(relative, version)
+        if blob is None:
+            return None
+        with open(blob, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return self.save([(relative, content)])[0]
+
+    def stats(self):
+        return {
+            "blobs_written": self.blobs_written,
+            "blobs_reused": self.blobs_reused,
+            "fsync_rounds": self.batcher.rounds,
+            "fsynced_paths": self.batcher.synced,
+            "link": self.link
+        }
@@ -0,0 +1,424 @@
+import ast
+import hashlib
+import json
+import os
+import select
+import shutil
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; workers run without limits
+    resource = None
+
+# Memory cap for each validation worker process
+WORKER_MEMORY_BYTES = 512 * 1024 * 1024
+
+# Runs this file, and nothing else from the app, as a validation worker; -I keeps
+# the app's directory and environment off sys.path
+PYTHON_WORKER = "import runpy, sys; runpy.run_path(sys.argv[1])['serve']()"
+
+# Long-lived node process: reads one JSON request per line and compiles the
+# source without running it, like `node --check`. .mjs is an ES module and .cjs
+# is CommonJS, wrapped in a function as node's loader does, so top-level return
+# is allowed. A .js file is tried as CommonJS, then as a module when it fails on
+# module syntax, as node 20.19+ does when package.json sets no "type". Errors
+# from vm.SourceTextModule carry no position, so a failing module is rechecked
+# by `node --check` for its line.
+NODE_CHECKER = r"""
+const vm = require('vm');
+const readline = require('readline');
+const { spawnSync } = require('child_process');
+const MODULE_SYNTAX = /Cannot use import statement outside a module|Unexpected token 'export'|Cannot use 'import\.meta' outside a module|await is only valid in async functions and the top level bodies of modules/;
+
+function compileCommonJS(filename, content) {
+  vm.compileFunction(content, ['exports', 'require', 'module', '__filename', '__dirname'], { filename });
+}
+
+function compileModule(filename, content) {
+  try {
+    new vm.SourceTextModule(content, { identifier: filename });
+  } catch (e) {
+    const check = spawnSync(process.execPath, ['--check', '--input-type=module'], { input: content, encoding: 'utf8' });
+    const match = /^\[stdin\]:(\d+)/.exec(check.stderr || '');
+    e.line = match ? Number(match[1]) : null;
+    throw e;
+  }
+}
+
+function check(filename, content) {
+  if (filename.endsWith('.mjs')) return compileModule(filename, content);
+  if (filename.endsWith('.cjs')) return compileCommonJS(filename, content);
+  try {
+    compileCommonJS(filename, content);
+  } catch (e) {
+    if (!MODULE_SYNTAX.test(e.message)) throw e;
+    compileModule(filename, content);
+  }
+}
+
+const rl = readline.createInterface({ input: process.stdin });
+rl.on('line', (line) => {
+  const { filename, content } = JSON.parse(line);
+  let result = { ok: true };
+  try {
+    check(filename.toLowerCase(), content);
+  } catch (e) {
+    const match = /:(\d+)\n/.exec(e.stack || '');
+    const lineNumber = e.line !== undefined ? e.line : (match ? Number(match[1]) : null);
+    result = { ok: false, message: `${e.name}: ${e.message}`, line: lineNumber };
+  }
+  process.stdout.write(JSON.stringify(result) + '\n');
+});
+"""
+
+VALIDATORS = {}
+# Checked by the long-lived NodeChecker process rather than the worker pool
+JAVASCRIPT_EXTENSIONS = ('.js', '.mjs', '.cjs')
+
+
+def validator(name, *extensions):
+    """Register a function as the validator for files with `extensions`.
+
+    The function takes (filename, content) and returns a list of issues
+    (see `issue()`). It runs in a worker process that loads only this file,
+    so it must be defined here and must not depend on app state.
+    """
+    def register(func):
+        for extension in extensions:
+            VALIDATORS[extension] = (name, func)
+        return func
+    return register
+
+
+def issue(message, line=None, severity='error'):
+    return {"message": message, "line": line, "severity": severity}
+
+
+def find_validator(filename):
+    """The (name, function) validating `filename`; JavaScript has no function."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in JAVASCRIPT_EXTENSIONS:
+        return 'javascript', None
+    return VALIDATORS.get(extension)
+
+
+@validator('python', '.py')
+def validate_python(filename, content):
+    try:
+        tree = ast.parse(content, filename)
+    except SyntaxError as e:
+        return [issue(f"SyntaxError: {e.msg}", e.lineno)]
+
+    issues = []
+    defined = {}
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if node.name in defined:
+                issues.append(issue(
+                    f"'{node.name}' redefines the definition on line {defined[node.name]}", node.lineno, 'warning'))
+            defined[node.name] = node.lineno
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ExceptHandler) and node.type is None:
+            issues.append(issue("Bare 'except:' also catches KeyboardInterrupt and SystemExit", node.lineno, 'warning'))
+        elif isinstance(node, ast.ImportFrom) and any(alias.name == '*' for alias in node.names):
+            issues.append(issue(f"Wildcard import from {node.module}", node.lineno, 'warning'))
+    return issues
+
+
+@validator('json', '.json')
+def validate_json(filename, content):
+    try:
+        json.loads(content)
+    except json.JSONDecodeError as e:
+        return [issue(f"Invalid JSON: {e.msg} (column {e.colno})", e.lineno)]
+    return []
+
+
+class TagBalanceParser(HTMLParser):
+    VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                 'param', 'source', 'track', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self.stack = []
+        self.issues = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.VOID_TAGS:
+            self.stack.append((tag, self.getpos()[0]))
+
+    def handle_endtag(self, tag):
+        if tag in self.VOID_TAGS:
+            return
+        open_tags = [name for name, _ in self.stack]
+        if tag not in open_tags:
+            self.issues.append(issue(f"Closing </{tag}> has no matching opening tag", self.getpos()[0], 'warning'))
+            return
+        # Anything opened after the matching tag was left unclosed
+        while self.stack:
+            name, line = self.stack.pop()
+            if name == tag:
+                break
+            self.issues.append(issue(f"<{name}> is not closed before </{tag}>", line, 'warning'))
+
+
+@validator('html', '.html', '.htm')
+def validate_html(filename, content):
+    issues = []
+    stripped = content.strip()
+    if not stripped.lower().startswith(('<!doctype', '<html')):
+        issues.append(issue("Missing DOCTYPE or html tag", 1, 'warning'))
+    parser = TagBalanceParser()
+    parser.feed(content)
+    parser.close()
+    issues.extend(parser.issues)
+    # Browsers close these implicitly, so only report other unclosed tags
+    for name, line in parser.stack:
+        if name not in ('html', 'body', 'head', 'p', 'li', 'td', 'tr', 'option'):
+            issues.append(issue(f"<{name}> is never closed", line, 'warning'))
+    return issues
+
+
+def limit_worker():
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (WORKER_MEMORY_BYTES, WORKER_MEMORY_BYTES))
+
+
+def run_validator(filename, content):
+    name, func = find_validator(filename)
+    return func(filename, content)
+
+
+def serve():
+    """Worker loop: validate one JSON request per line of stdin, answering on stdout."""
+    limit_worker()
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            result = {"issues": run_validator(request['filename'], request['content'])}
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+class CheckerProcess:
+    """A long-lived child process that answers each JSON request line with one JSON line.
+
+    Only subprocess pipes and select() are used, both of which gevent
+    patches, so a check blocks just the calling greenlet. A process that
+    overruns its timeout or dies is killed, and the next request starts a
+    fresh one.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self._process = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self._process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def request(self, payload, timeout):
+        """Send `payload` and return the reply; None on timeout, {"error": ...} if the process died."""
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            try:
+                self._process.stdin.write(json.dumps(payload) + "\n")
+                self._process.stdin.flush()
+            except OSError:
+                self._kill()
+                return {"error": "Validator process exited"}
+            ready, _, _ = select.select([self._process.stdout], [], [], timeout)
+            if not ready:
+                self._kill()
+                return None
+            line = self._process.stdout.readline()
+            if not line:
+                self._kill()
+                return {"error": "Validator process exited"}
+            return json.loads(line)
+
+    def close(self):
+        with self._lock:
+            self._kill()
+
+
+class NodeChecker:
+    """One long-lived node process that syntax-checks JavaScript sources in turn."""
+
+    def __init__(self, node='node'):
+        self.node = shutil.which(node)
+        self._process = CheckerProcess([
+            self.node, '--max-old-space-size=256', '--experimental-vm-modules', '--no-warnings', '-e', NODE_CHECKER
+        ])
+
+    @property
+    def available(self):
+        return self.node is not None
+
+    def _check(self, filename, content, timeout):
+        result = self._process.request({"filename": filename, "content": content}, timeout)
+        if result is None or 'error' in result:
+            # Hung or crashed; the next file gets a fresh process
+            return None
+        if result['ok']:
+            return []
+        return [issue(result['message'], result.get('line'))]
+
+    def check_batch(self, files, timeout):
+        """Check (filename, content) pairs, returning a list of issues (or None on timeout) for each."""
+        return [self._check(filename, content, timeout) for filename, content in files]
+
+    def close(self):
+        self._process.close()
+
+
+class ValidationEngine:
+    """Validates files in parallel on a few worker processes, caching results by content.
+
+    Validators only parse or compile their input; nothing is executed.
+    Each of the `workers` processes is a long-lived Python child running
+    this module under a memory limit, talked to over pipes, which keeps the
+    server's gevent workers responsive. Each file gets `timeout` seconds of
+    a worker; a worker that overruns is killed and replaced. JavaScript goes
+    to a single long-lived node process instead.
+    """
+
+    def __init__(self, workers=2, timeout=5.0, cache_size=4096, node='node'):
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.node = NodeChecker(node)
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._processes = [
+            CheckerProcess([sys.executable, '-I', '-c', PYTHON_WORKER, os.path.abspath(__file__)])
+            for _ in range(max(workers, 1))
+        ]
+        self._lock = threading.Lock()
+
+    def _run_workers(self, files, indices):
+        """Check the files at `indices`, one per worker at a time; returns {index: reply or None}."""
+        replies = {}
+        remaining = iter(indices)
+        lock = threading.Lock()
+
+        def drain(process):
+            while True:
+                with lock:
+                    index = next(remaining, None)
+                if index is None:
+                    return
+                filename, content = files[index]
+                replies[index] = process.request({"filename": filename, "content": content}, self.timeout)
+
+        threads = [threading.Thread(target=drain, args=(process,), daemon=True)
+                   for process in self._processes[:len(indices)]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return replies
+
+    def _cache_key(self, name, content):
+        return hashlib.sha256(f"{name}\0{content}".encode('utf-8')).hexdigest()
+
+    def _cached(self, key):
+        with self._lock:
+            issues = self._cache.get(key)
+            if issues is not None:
+                self._cache.move_to_end(key)
+            return issues
+
+    def _store(self, key, issues):
+        with self._lock:
+            self._cache[key] = issues
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def validate(self, files):
+        """Validate (filename, content) pairs; returns one result dict per file, in order."""
+        results = [None] * len(files)
+        keys = {}
+        pending = []
+        scripts = []
+        for index, (filename, content) in enumerate(files):
+            found = find_validator(filename)
+            if found is None:
+                results[index] = {"filename": filename, "validator": None, "issues": [], "cached": False}
+                continue
+            name = found[0]
+            keys[index] = self._cache_key(name, content)
+            issues = self._cached(keys[index])
+            if issues is not None:
+                self.hits += 1
+                results[index] = {"filename": filename, "validator": name, "issues": issues, "cached": True}
+                continue
+            self.misses += 1
+            results[index] = {"filename": filename, "validator": name, "issues": None, "cached": False}
+            if name == 'javascript':
+                scripts.append(index)
+            else:
+                pending.append(index)
+
+        if pending:
+            for index, reply in self._run_workers(files, pending).items():
+                if reply is None:
+                    results[index]["issues"] = [issue(f"Validation timed out after {self.timeout} seconds")]
+                    keys.pop(index)
+                elif 'error' in reply:
+                    results[index]["issues"] = [issue(f"Validator failed: {reply['error']}")]
+                    keys.pop(index)
+                else:
+                    results[index]["issues"] = reply["issues"]
+
+        if scripts:
+            if self.node.available:
+                checked = self.node.check_batch([files[index] for index in scripts], self.timeout)
+                for index, issues in zip(scripts, checked):
+                    if issues is None:
+                        issues = [issue(f"Validation timed out after {self.timeout} seconds")]
+                        keys.pop(index)
+                    results[index]["issues"] = issues
+            else:
+                for index in scripts:
+                    results[index]["issues"] = [issue("node is not installed; JavaScript was not checked", severity='warning')]
+                    keys.pop(index)
+
+        for index, key in keys.items():
+            if not results[index]["cached"]:
+                self._store(key, results[index]["issues"])
+        for result in results:
+            result["ok"] = not any(i["severity"] == 'error' for i in result["issues"])
+        return results
+
+    def stats(self):
+        with self._lock:
+            size = len(self._cache)
+        return {"cached_results": size, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.node.close()
+        for process in self._processes:
+            process.close()
@@ -0,0 +1,384 @@
+"""Labelled code samples, in the shape models return them, for bench/language_detection.py.
+
+Each entry is (language, content). Fences are stripped as the UI does before
+saving, so detection has to go on the content alone.
+"""
+
+SAMPLES = [
+    ('python', '''import os
+import sys
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [line.rstrip() for line in f]
+
+
+if __name__ == "__main__":
+    for line in read_lines(sys.argv[1]):
+        print(line)
+'''),
+    ('python', '''from dataclasses import dataclass
+
+
+@dataclass
+class Point:
+    x: float
+    y: float
+
+    def distance(self, other):
+        return ((self.x - other.x) ** 2 + (self.y - other.y) ** 2) ** 0.5
+'''),
+    ('python', '''def fibonacci(n):
+    """Return the first n Fibonacci numbers."""
+    result = []
+    a, b = 0, 1
+    for _ in range(n):
+        result.append(a)
+        a, b = b, a + b
+    return result
+
+print(fibonacci(10))
+'''),
+    ('python', '''class Stack:
+    def __init__(self):
+        self.items = []
+
+    def push(self, item):
+        self.items.append(item)
+
+    def pop(self):
+        try:
+            return self.items.pop()
+        except IndexError:
+            return None
+'''),
+    ('javascript', '''const express = require('express');
+const app = express();
+
+app.get('/', (req, res) => {
+  res.send('Hello World!');
+});
+
+app.listen(3000, () => console.log('Listening on port 3000'));
+'''),
+    ('javascript', '''import React, { useState } from 'react';
+
+export default function Counter() {
+  const [count, setCount] = useState(0);
+  return <button onClick={() => setCount(count + 1)}>{count}</button>;
+}
+'''),
+    ('javascript', '''function debounce(fn, wait) {
+  let timeout;
+  return function (...args) {
+    clearTimeout(timeout);
+    timeout = setTimeout(() => fn.apply(this, args), wait);
+  };
+}
+
+document.getElementById('search').addEventListener('input', debounce(search, 300));
+'''),
+    ('javascript', '''async function fetchUsers() {
+  const response = await fetch('/api/users');
+  if (response.status !== 200) {
+    throw new Error('Request failed');
+  }
+  const users = await response.json();
+  users.forEach(user => console.log(user.name));
+}
+'''),
+    ('typescript', '''interface User {
+  id: number;
+  name: string;
+  email?: string;
+}
+
+export function greet(user: User): string {
+  return `Hello, ${user.name}`;
+}
+'''),
+    ('typescript', '''type Result<T> = { ok: true; value: T } | { ok: false; error: string };
+
+export const parse = (input: string): Result<number> => {
+  const value = Number(input);
+  return isNaN(value) ? { ok: false, error: 'not a number' } : { ok: true, value };
+};
+'''),
+    ('typescript', '''import { Injectable } from '@angular/core';
+
+@Injectable({ providedIn: 'root' })
+export class CounterService {
+  private count: number = 0;
+
+  increment(): void {
+    this.count++;
+  }
+}
+'''),
+    ('html', '''<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="UTF-8">
+  <title>Todo List</title>
+</head>
+<body>
+  <ul id="todos"></ul>
+  <script src="app.js"></script>
+</body>
+</html>
+'''),
+    ('html', '''<div class="card">
+  <h2>Sign in</h2>
+  <form action="/login" method="post">
+    <input type="text" name="username">
+    <button type="submit">Log in</button>
+  </form>
+</div>
+'''),
+    ('html', '''<html>
+<body>
+<p>Hello, world!</p>
+</body>
+</html>
+'''),
+    ('css', '''body {
+  margin: 0;
+  font-family: sans-serif;
+  background: #f5f5f5;
+}
+
+.container {
+  max-width: 960px;
+  margin: 0 auto;
+}
+'''),
+    ('css', '''@media (max-width: 600px) {
+  .sidebar {
+    display: none;
+  }
+}
+
+.button:hover {
+  color: #fff;
+  padding: 8px 16px;
+}
+'''),
+    ('css', '''@keyframes spin {
+  from { transform: rotate(0deg); }
+  to { transform: rotate(360deg); }
+}
+
+.spinner {
+  animation: spin 1s linear infinite;
+  width: 32px;
+}
+'''),
+    ('json', '''{
+  "name": "my-app",
+  "version": "1.0.0",
+  "scripts": {
+    "start": "node index.js"
+  },
+  "dependencies": {
+    "express": "^4.18.2"
+  }
+}
+'''),
+    ('json', '''[
+  {"id": 1, "title": "Buy milk", "done": false},
+  {"id": 2, "title": "Write code", "done": true}
+]
+'''),
+    ('markdown', '''# Project Title
+
+A short description of the project.
+
+## Installation
+
+Run **npm install** and then see the [docs](https://example.com/docs).
+
+- Fast
+- Simple
+'''),
+    ('markdown', '''## Usage
+
+Call the function with a list:
+
+```python
+sort_items([3, 1, 2])
+```
+
+See [the guide](guide.md) for more.
+'''),
+    ('bash', '''#!/bin/bash
+set -e
+
+for file in *.log; do
+  echo "Compressing $file"
+  gzip "$file"
+done
+'''),
+    ('bash', '''sudo apt-get update
+sudo apt-get install -y nginx
+mkdir -p /var/www/app
+cd /var/www/app
+git clone https://github.com/example/app.git .
+'''),
+    ('bash', '''if [ -z "${NAME}" ]; then
+  echo "NAME is not set"
+  exit 1
+fi
+export GREETING="Hello, ${NAME}"
+echo $(date) "$GREETING"
+'''),
+    ('java', '''public class HelloWorld {
+    public static void main(String[] args) {
+        System.out.println("Hello, World!");
+    }
+}
+'''),
+    ('java', '''package com.example.demo;
+
+import java.util.ArrayList;
+import java.util.List;
+
+public class Inventory {
+    private final List<String> items = new ArrayList<>();
+
+    @Override
+    public String toString() {
+        return items.toString();
+    }
+}
+'''),
+    ('c', '''#include <stdio.h>
+#include <stdlib.h>
+
+int main(void) {
+    int *values = malloc(10 * sizeof(int));
+    for (int i = 0; i < 10; i++) {
+        values[i] = i * i;
+        printf("%d\\n", values[i]);
+    }
+    free(values);
+    return 0;
+}
+'''),
+    ('cpp', '''#include <iostream>
+#include <vector>
+
+using namespace std;
+
+int main() {
+    vector<int> numbers = {1, 2, 3};
+    for (int n : numbers) {
+        cout << n << endl;
+    }
+    return 0;
+}
+'''),
+    ('cpp', '''#include <string>
+
+template <typename T>
+T maximum(T a, T b) {
+    return a > b ? a : b;
+}
+
+std::string greet(const std::string& name) {
+    return "Hello, " + name;
+}
+'''),
+    ('go', '''package main
+
+import (
+	"fmt"
+	"net/http"
+)
+
+func handler(w http.ResponseWriter, r *http.Request) {
+	fmt.Fprintf(w, "Hello, %s!", r.URL.Path[1:])
+}
+
+func main() {
+	http.HandleFunc("/", handler)
+	http.ListenAndServe(":8080", nil)
+}
+'''),
+    ('go', '''package stack
+
+type Stack struct {
+	items []int
+}
+
+func (s *Stack) Push(v int) {
+	s.items = append(s.items, v)
+}
+
+func (s *Stack) Pop() int {
+	last := s.items[len(s.items)-1]
+	s.items = s.items[:len(s.items)-1]
+	return last
+}
+'''),
+    ('rust', '''use std::collections::HashMap;
+
+fn main() {
+    let mut counts = HashMap::new();
+    for word in "the quick the lazy".split_whitespace() {
+        *counts.entry(word).or_insert(0) += 1;
+    }
+    println!("{:?}", counts);
+}
+'''),
+    ('rust', '''struct Rectangle {
+    width: u32,
+    height: u32,
+}
+
+impl Rectangle {
+    fn area(&self) -> u32 {
+        self.width * self.height
+    }
+}
+'''),
+    ('sql', '''CREATE TABLE users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE
+);
+
+INSERT INTO users (name, email) VALUES ('Ada', 'ada@example.com');
+'''),
+    ('sql', '''SELECT c.name, COUNT(o.id) AS orders
+FROM customers c
+LEFT JOIN orders o ON o.customer_id = c.id
+WHERE c.active = 1
+GROUP BY c.name
+ORDER BY orders DESC;
+'''),
+    ('yaml', '''version: "3.8"
+services:
+  web:
+    image: nginx:latest
+    ports:
+      - "80:80"
+  db:
+    image: postgres:15
+'''),
+    ('yaml', '''name: CI
+on:
+  push:
+    branches: [main]
+jobs:
+  test:
+    runs-on: ubuntu-latest
+    steps:
+      - uses: actions/checkout@v4
+      - name: Run tests
+        run: make test
+'''),
+    ('plaintext', '''Here is a list of things to remember before the trip:
+pack warm clothes, charge the camera and book the taxi.
+'''),
+]
@@ -0,0 +1,71 @@
+"""Measure language detection accuracy and speed.
+
+Compares app.languages.detect_language with the substring checks it replaced,
+on the tuning samples in bench/language_corpus.py and, separately, on the
+held-out samples in bench/language_heldout.py. Only the held-out score says
+how well detection generalises; the tuning score is expected to be near 100%.
+
+    python bench/language_detection.py
+    python bench/language_detection.py --repeat 2000 --verbose
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.languages import detect_language  # noqa: E402
+from bench.language_corpus import SAMPLES  # noqa: E402
+from bench.language_heldout import HELD_OUT  # noqa: E402
+
+CORPORA = (('tuning', SAMPLES), ('held-out', HELD_OUT))
+
+
+def legacy_detect(content):
+    """The ordered substring checks detection used before app.languages."""
+    indicators = {
+        'import ': 'python', 'def ': 'python', 'class ': 'python',
+        'function ': 'javascript', 'var ': 'javascript', 'let ': 'javascript', 'const ': 'javascript',
+        '<html': 'html', '<!DOCTYPE': 'html', '<style': 'css', '{': 'json'
+    }
+    content_lower = content.lower()
+    for indicator, lang in indicators.items():
+        if indicator in content_lower:
+            return lang
+    return 'plaintext'
+
+
+def evaluate(name, detect, samples, repeat, verbose):
+    correct = 0
+    for expected, content in samples:
+        found = detect(content)
+        if found == expected:
+            correct += 1
+        elif verbose:
+            print(f"  {name}: expected {expected}, got {found}: {content.splitlines()[0][:60]!r}")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, content in samples:
+            detect(content)
+    elapsed = time.perf_counter() - started
+    return correct / len(samples), elapsed / (repeat * len(samples)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=500, help="timing passes over the corpus")
+    parser.add_argument('--verbose', action='store_true', help="list misclassified samples")
+    args = parser.parse_args()
+
+    for corpus, samples in CORPORA:
+        print(f"{corpus}: {len(samples)} samples, {len(set(language for language, _ in samples))} languages")
+        print(f"{'detector':<12}{'accuracy':>10}{'us/call':>10}")
+        for name, detect in (('legacy', legacy_detect), ('classifier', lambda c: detect_language(c).language)):
+            accuracy, micros = evaluate(name, detect, samples, args.repeat, args.verbose)
+            print(f"{name:<12}{accuracy:10.1%}{micros:10.1f}")
+
+
+if __name__ == '__main__':
+    main()
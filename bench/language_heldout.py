@@ -0,0 +1,385 @@
+"""Held-out code samples for bench/language_detection.py.
+
+Each entry is (language, content), in the same shape as
+bench/language_corpus.py. They were written after the classifier was
+tuned and have never been used to adjust it, so their score is the one
+that says how detection does on code it has not seen. Keep it that way:
+once a sample has been used to change a weight or a pattern, move it to
+bench/language_corpus.py.
+"""
+
+HELD_OUT = [
+    ('python', '''with open("scores.csv") as handle:
+    rows = [line.strip().split(",") for line in handle if line.strip()]
+
+totals = {}
+for name, score in rows[1:]:
+    totals[name] = totals.get(name, 0) + int(score)
+
+best = max(totals, key=totals.get)
+print(f"{best} wins with {totals[best]} points")
+'''),
+    ('python', '''import asyncio
+import aiohttp
+
+
+async def fetch_all(urls):
+    async with aiohttp.ClientSession() as session:
+        tasks = [session.get(url) for url in urls]
+        responses = await asyncio.gather(*tasks)
+        return [r.status for r in responses]
+
+asyncio.run(fetch_all(["https://example.com"]))
+'''),
+    ('python', '''@app.route("/items/<int:item_id>")
+def get_item(item_id):
+    item = Item.query.get_or_404(item_id)
+    return jsonify(item.to_dict())
+'''),
+    ('javascript', '''const items = document.querySelectorAll('.todo-item');
+items.forEach((item) => {
+  item.addEventListener('click', () => {
+    item.classList.toggle('done');
+  });
+});
+'''),
+    ('javascript', '''module.exports = {
+  mode: 'production',
+  entry: './src/index.js',
+  output: {
+    filename: 'bundle.js',
+    path: __dirname + '/dist',
+  },
+};
+'''),
+    ('javascript', '''export function groupBy(list, key) {
+  return list.reduce((groups, entry) => {
+    (groups[entry[key]] ||= []).push(entry);
+    return groups;
+  }, {});
+}
+'''),
+    ('typescript', '''enum Direction {
+  Up,
+  Down,
+}
+
+function move(steps: number, direction: Direction): number {
+  return direction === Direction.Up ? steps : -steps;
+}
+'''),
+    ('typescript', '''export class TodoStore {
+  private todos: Todo[] = [];
+
+  add(title: string): Todo {
+    const todo = { id: Date.now(), title, done: false };
+    this.todos.push(todo);
+    return todo;
+  }
+}
+'''),
+    ('typescript', '''const cache = new Map<string, Promise<Response>>();
+
+export async function cachedFetch(url: string): Promise<Response> {
+  if (!cache.has(url)) {
+    cache.set(url, fetch(url));
+  }
+  return cache.get(url)!;
+}
+'''),
+    ('html', '''<form action="/login" method="post">
+  <label for="user">Username</label>
+  <input id="user" name="user" type="text">
+  <label for="pass">Password</label>
+  <input id="pass" name="pass" type="password">
+  <button type="submit">Sign in</button>
+</form>
+'''),
+    ('html', '''<nav class="navbar">
+  <ul>
+    <li><a href="/">Home</a></li>
+    <li><a href="/about">About</a></li>
+    <li><a href="/contact">Contact</a></li>
+  </ul>
+</nav>
+'''),
+    ('html', '''<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>Gallery</title>
+</head>
+<body>
+  <img src="cat.jpg" alt="A cat">
+</body>
+</html>
+'''),
+    ('css', '''.grid {
+  display: grid;
+  grid-template-columns: repeat(3, 1fr);
+  gap: 16px;
+}
+
+.grid > .card {
+  border: 1px solid #ddd;
+  border-radius: 8px;
+}
+'''),
+    ('css', ''':root {
+  --primary: #3b82f6;
+  --radius: 0.5rem;
+}
+
+button {
+  background: var(--primary);
+  border-radius: var(--radius);
+  color: white;
+}
+'''),
+    ('css', '''a {
+  color: inherit;
+  text-decoration: none;
+}
+
+a:hover,
+a:focus {
+  text-decoration: underline;
+}
+'''),
+    ('json', '''{
+  "compilerOptions": {
+    "target": "es2020",
+    "strict": true,
+    "outDir": "dist"
+  },
+  "include": ["src"]
+}
+'''),
+    ('json', '''[
+  {"id": 1, "title": "Buy milk", "done": false},
+  {"id": 2, "title": "Walk dog", "done": true}
+]
+'''),
+    ('json', '''{"name": "weather-app", "version": "0.1.0", "private": true, "scripts": {"start": "node server.js"}}
+'''),
+    ('markdown', '''## Installation
+
+Install the package with pip:
+
+    pip install weather-cli
+
+Then run `weather --city Paris` to see the forecast.
+'''),
+    ('markdown', '''| Option | Default | Meaning |
+|--------|---------|---------|
+| `--port` | 8080 | Port to listen on |
+| `--debug` | off | Print every request |
+
+See [the docs](https://example.com/docs) for more.
+'''),
+    ('markdown', '''# Changelog
+
+- Fixed a crash when the config file was empty
+- Added a `--quiet` flag
+- **Breaking:** dropped support for Python 3.7
+'''),
+    ('bash', '''for file in *.png; do
+  convert "$file" -resize 50% "small_$file"
+done
+echo "Resized $(ls small_*.png | wc -l) images"
+'''),
+    ('bash', '''python -m venv .venv
+source .venv/bin/activate
+pip install -r requirements.txt
+flask run --port 8000
+'''),
+    ('bash', '''#!/bin/sh
+set -e
+BACKUP_DIR=/var/backups/db
+mkdir -p "$BACKUP_DIR"
+pg_dump mydb | gzip > "$BACKUP_DIR/mydb-$(date +%F).sql.gz"
+'''),
+    ('java', '''import java.util.ArrayList;
+import java.util.List;
+
+public class Inventory {
+    private final List<String> items = new ArrayList<>();
+
+    public void add(String item) {
+        items.add(item);
+    }
+}
+'''),
+    ('java', '''@RestController
+public class GreetingController {
+    @GetMapping("/greeting")
+    public String greeting(@RequestParam String name) {
+        return "Hello, " + name;
+    }
+}
+'''),
+    ('java', '''try (BufferedReader reader = Files.newBufferedReader(path)) {
+    String line;
+    while ((line = reader.readLine()) != null) {
+        System.out.println(line.toUpperCase());
+    }
+} catch (IOException e) {
+    e.printStackTrace();
+}
+'''),
+    ('c', '''#include <stdlib.h>
+#include <string.h>
+
+char *duplicate(const char *source) {
+    size_t length = strlen(source) + 1;
+    char *copy = malloc(length);
+    if (copy != NULL) {
+        memcpy(copy, source, length);
+    }
+    return copy;
+}
+'''),
+    ('c', '''struct node {
+    int value;
+    struct node *next;
+};
+
+void push(struct node **head, int value) {
+    struct node *n = malloc(sizeof *n);
+    n->value = value;
+    n->next = *head;
+    *head = n;
+}
+'''),
+    ('c', '''int main(int argc, char **argv) {
+    FILE *f = fopen(argv[1], "r");
+    int c, lines = 0;
+    while ((c = fgetc(f)) != EOF)
+        if (c == 10) lines++;
+    printf("%d lines", lines);
+    fclose(f);
+    return 0;
+}
+'''),
+    ('cpp', '''#include <algorithm>
+#include <vector>
+
+int main() {
+    std::vector<int> numbers{5, 3, 8, 1};
+    std::sort(numbers.begin(), numbers.end());
+    for (int n : numbers) std::cout << n << ' ';
+}
+'''),
+    ('cpp', '''class Shape {
+public:
+    virtual ~Shape() = default;
+    virtual double area() const = 0;
+};
+
+class Circle : public Shape {
+    double r;
+public:
+    explicit Circle(double r) : r(r) {}
+    double area() const override { return 3.14159 * r * r; }
+};
+'''),
+    ('cpp', '''auto counts = std::map<std::string, int>{};
+for (const auto& word : words) {
+    ++counts[word];
+}
+auto ptr = std::make_unique<Report>(counts);
+'''),
+    ('go', '''type Server struct {
+	addr string
+	mux  *http.ServeMux
+}
+
+func (s *Server) Start() error {
+	return http.ListenAndServe(s.addr, s.mux)
+}
+'''),
+    ('go', '''results := make(chan int)
+for _, n := range numbers {
+	go func(n int) {
+		results <- n * n
+	}(n)
+}
+'''),
+    ('go', '''if err := json.NewDecoder(r.Body).Decode(&req); err != nil {
+	http.Error(w, err.Error(), http.StatusBadRequest)
+	return
+}
+'''),
+    ('rust', '''#[derive(Debug, Clone)]
+struct Config {
+    name: String,
+    retries: u8,
+}
+
+impl Default for Config {
+    fn default() -> Self {
+        Config { name: "app".into(), retries: 3 }
+    }
+}
+'''),
+    ('rust', '''let contents = fs::read_to_string("input.txt")?;
+let total: i64 = contents
+    .lines()
+    .filter_map(|line| line.parse::<i64>().ok())
+    .sum();
+'''),
+    ('rust', '''match command.as_str() {
+    "start" => server.start(),
+    "stop" => server.stop(),
+    other => eprintln!("unknown command: {}", other),
+}
+'''),
+    ('sql', '''SELECT department, AVG(salary) AS average_salary
+FROM employees
+GROUP BY department
+HAVING AVG(salary) > 50000;
+'''),
+    ('sql', '''update accounts
+set balance = balance - 100
+where id = 42;
+'''),
+    ('sql', '''ALTER TABLE orders ADD COLUMN shipped_at TIMESTAMP;
+CREATE INDEX idx_orders_customer ON orders (customer_id);
+'''),
+    ('yaml', '''apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: web
+spec:
+  replicas: 3
+  template:
+    spec:
+      containers:
+        - name: web
+          image: nginx:1.25
+'''),
+    ('yaml', '''services:
+  db:
+    image: postgres:16
+    environment:
+      POSTGRES_PASSWORD: example
+    ports:
+      - "5432:5432"
+'''),
+    ('yaml', '''- hosts: webservers
+  become: true
+  tasks:
+    - name: Install nginx
+      apt:
+        name: nginx
+        state: present
+'''),
+    ('plaintext', '''The function returns the list sorted in place. If you need to keep the
+original order, copy the list first and sort the copy instead.
+'''),
+    ('plaintext', '''Expected output:
+
+3 passed, 0 failed
+Done in 1.2 seconds
+'''),
+]
@@ -0,0 +1,143 @@
+"""A stand-in for the Ollama API, for benchmarking without a GPU.
+
+Emulates /api/tags, /api/ps, /api/show, /api/generate, /api/chat,
+/api/pull and /api/embeddings with configurable latency and token rate:
+
+    python bench/mock_ollama.py --port 11500 --token-rate 50 --latency 0.2
+"""
+import argparse
+import hashlib
+import json
+import time
+
+from flask import Flask, Response, jsonify, request
+
+WORDS = "the quick brown fox jumps over the lazy dog while the model keeps generating tokens".split()
+
+
+def create_mock(models=('llama2:7b', 'codellama:7b', 'llava:7b'), token_rate=50.0, latency=0.1,
+                tokens=64, pull_bytes=50 * 1024 * 1024, pull_seconds=2.0):
+    """Build the mock app.
+
+    `latency` is the delay before the first token (prompt processing),
+    `token_rate` the decode speed in tokens per second, and `tokens` the
+    length of every completion unless `options.num_predict` says otherwise.
+    """
+    app = Flask(__name__)
+    installed = {name: hashlib.sha256(name.encode('utf-8')).hexdigest() for name in models}
+
+    def model_entry(name):
+        return {
+            "name": name,
+            "model": name,
+            "digest": installed[name],
+            "size": 3825819519,
+            "modified_at": "2024-01-01T00:00:00Z",
+            "details": {"family": "llama", "families": ["llama"], "format": "gguf",
+                        "parameter_size": "7B", "quantization_level": "Q4_0"}
+        }
+
+    def missing(name):
+        return jsonify({"error": f"model '{name}' not found, try pulling it first"}), 404
+
+    def completion(body):
+        count = (body.get('options') or {}).get('num_predict') or tokens
+        return [WORDS[i % len(WORDS)] + ' ' for i in range(count)]
+
+    def stats(started, count):
+        eval_duration = int(count / token_rate * 1e9)
+        return {
+            "total_duration": int((time.monotonic() - started) * 1e9),
+            "load_duration": 0,
+            "prompt_eval_count": 10,
+            "prompt_eval_duration": int(latency * 1e9),
+            "eval_count": count,
+            "eval_duration": eval_duration
+        }
+
+    def generation(body, frame):
+        model = body.get('model')
+        if model not in installed:
+            return missing(model)
+        started = time.monotonic()
+        pieces = completion(body)
+
+        if not body.get('stream', True):
+            time.sleep(latency + len(pieces) / token_rate)
+            return jsonify({**frame(''.join(pieces)), "model": model, "done": True, **stats(started, len(pieces))})
+
+        def stream():
+            time.sleep(latency)
+            for piece in pieces:
+                time.sleep(1 / token_rate)
+                yield json.dumps({**frame(piece), "model": model, "done": False}) + "\n"
+            yield json.dumps({**frame(''), "model": model, "done": True, **stats(started, len(pieces))}) + "\n"
+        return Response(stream(), mimetype='application/x-ndjson')
+
+    @app.route('/api/tags')
+    def tags():
+        return jsonify({"models": [model_entry(name) for name in installed]})
+
+    @app.route('/api/ps')
+    def ps():
+        return jsonify({"models": []})
+
+    @app.route('/api/show', methods=['GET', 'POST'])
+    def show():
+        name = request.args.get('name') or (request.get_json(silent=True) or {}).get('name')
+        if name not in installed:
+            return missing(name)
+        return jsonify({"modelfile": f"FROM {name}", "parameters": "", "template": "{{ .Prompt }}",
+                        "details": model_entry(name)["details"],
+                        "model_info": {"general.architecture": "llama", "llama.context_length": 4096}})
+
+    @app.route('/api/generate', methods=['POST'])
+    def generate():
+        return generation(request.get_json(), lambda text: {"response": text})
+
+    @app.route('/api/chat', methods=['POST'])
+    def chat():
+        return generation(request.get_json(), lambda text: {"message": {"role": "assistant", "content": text}})
+
+    @app.route('/api/embeddings', methods=['POST'])
+    def embeddings():
+        body = request.get_json()
+        digest = hashlib.sha256(body.get('prompt', '').encode('utf-8')).digest()
+        return jsonify({"embedding": [b / 255 for b in digest]})
+
+    @app.route('/api/pull', methods=['POST'])
+    def pull():
+        name = request.get_json().get('name')
+        digest = 'sha256:' + hashlib.sha256(name.encode('utf-8')).hexdigest()
+
+        def progress():
+            yield json.dumps({"status": "pulling manifest"}) + "\n"
+            steps = 20
+            for step in range(1, steps + 1):
+                time.sleep(pull_seconds / steps)
+                yield json.dumps({"status": f"pulling {digest[7:19]}", "digest": digest,
+                                  "total": pull_bytes, "completed": pull_bytes * step // steps}) + "\n"
+            installed[name] = digest[7:]
+            yield json.dumps({"status": "success"}) + "\n"
+        return Response(progress(), mimetype='application/x-ndjson')
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11500)
+    parser.add_argument('--token-rate', type=float, default=50.0, help="tokens per second per generation")
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument('--tokens', type=int, default=64, help="tokens per completion")
+    parser.add_argument('--pull-seconds', type=float, default=2.0, help="duration of a model pull")
+    args = parser.parse_args()
+
+    mock = create_mock(token_rate=args.token_rate, latency=args.latency, tokens=args.tokens,
+                       pull_seconds=args.pull_seconds)
+    mock.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
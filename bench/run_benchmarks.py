@@ -0,0 +1,330 @@
+"""Load-test the app against the mock Ollama server.
+
+Starts bench/mock_ollama.py and the app as separate processes, drives each
+scenario at the requested concurrency and reports latency percentiles,
+time to first token, throughput and the app's memory use. Results are saved
+to bench/results/ so runs can be compared:
+
+    python bench/run_benchmarks.py --concurrency 16 --requests 400
+    python bench/run_benchmarks.py --scenarios generate_stream --compare bench/results/<earlier>.json
+
+Use --target to benchmark a server that is already running instead.
+"""
+import argparse
+import contextlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'bench', 'results')
+MODEL = 'llama2:7b'
+
+_sessions = threading.local()
+
+
+def session():
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout} seconds")
+
+
+def start_process(args, env=None):
+    return subprocess.Popen(
+        [sys.executable] + args,
+        cwd=ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+class MemorySampler:
+    """Samples a process's resident set size from /proc while a scenario runs."""
+
+    def __init__(self, pid, interval=0.1):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            value = self.rss()
+            if value is not None:
+                self.samples.append(value)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self):
+        if not self.samples:
+            return None
+        return {"rss_start_bytes": self.samples[0], "rss_peak_bytes": max(self.samples),
+                "rss_end_bytes": self.samples[-1]}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    rank = max(int(round(pct / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+# Each scenario makes one request against `base` and returns a dict with
+# optional "ttft" (seconds) and "tokens"; it raises on failure.
+
+def scenario_list_models(base, index):
+    response = session().get(f"{base}/list_models")
+    response.raise_for_status()
+    return {}
+
+
+def scenario_generate(base, index):
+    response = session().post(f"{base}/generate", json={"model": MODEL, "prompt": f"Prompt {index}", "cache": False})
+    response.raise_for_status()
+    body = response.json()
+    if 'error' in body:
+        raise RuntimeError(body['error'])
+    return {}
+
+
+def scenario_generate_stream(base, index):
+    started = time.perf_counter()
+    ttft = None
+    tokens = 0
+    with session().post(f"{base}/generate", json={"model": MODEL, "prompt": f"Prompt {index}", "stream": True,
+                                                  "cache": False}, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            frame = json.loads(line)
+            if 'error' in frame:
+                raise RuntimeError(frame['error'])
+            if 'token' in frame:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                tokens += 1
+    return {"ttft": ttft, "tokens": tokens}
+
+
+def scenario_pull(base, index):
+    response = session().post(f"{base}/pull_jobs", json={"model": f"bench-model-{index}"})
+    response.raise_for_status()
+    job_id = response.json()['job_id']
+    while True:
+        job = session().get(f"{base}/pull_jobs/{job_id}").json()
+        if job['state'] not in ('queued', 'running'):
+            if job['state'] != 'success':
+                raise RuntimeError(job.get('error') or job['state'])
+            return {}
+        time.sleep(0.05)
+
+
+SCENARIOS = {
+    'list_models': scenario_list_models,
+    'generate': scenario_generate,
+    'generate_stream': scenario_generate_stream,
+    'pull': scenario_pull,
+}
+
+
+def run_scenario(base, name, total, concurrency, pid=None):
+    func = SCENARIOS[name]
+    latencies = []
+    ttfts = []
+    tokens = 0
+    errors = []
+
+    def one(index):
+        started = time.perf_counter()
+        try:
+            result = func(base, index)
+        except Exception as e:
+            return None, str(e)
+        return (time.perf_counter() - started, result), None
+
+    sampler = MemorySampler(pid) if pid else None
+    started = time.perf_counter()
+    with sampler or contextlib.nullcontext(), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for outcome, error in executor.map(one, range(total)):
+            if error:
+                errors.append(error)
+                continue
+            latency, result = outcome
+            latencies.append(latency)
+            if result.get('ttft') is not None:
+                ttfts.append(result['ttft'])
+            tokens += result.get('tokens', 0)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ttfts.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+        "latency_seconds": {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+        "ttft_seconds": {f"p{p}": percentile(ttfts, p) for p in (50, 95, 99)} if ttfts else None,
+        "memory": sampler.summary() if sampler else None
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_ms(value):
+    return f"{value * 1000:8.1f}" if value is not None else "       -"
+
+
+def print_report(results, baseline=None):
+    print(f"{'scenario':<16}{'req/s':>9}{'tok/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'ttft50':>9}{'errors':>8}{'peak MB':>9}")
+    for name, result in results.items():
+        latency = result['latency_seconds']
+        ttft = result['ttft_seconds'] or {}
+        memory = result['memory'] or {}
+        peak = memory.get('rss_peak_bytes')
+        print(f"{name:<16}{result['requests_per_second']:9.1f}{result['tokens_per_second']:9.1f}"
+              f" {format_ms(latency['p50'])} {format_ms(latency['p95'])} {format_ms(latency['p99'])}"
+              f" {format_ms(ttft.get('p50'))}{result['errors']:8d}"
+              f"{peak / 2**20 if peak else 0:9.1f}")
+
+        previous = (baseline or {}).get(name)
+        if previous and previous['latency_seconds']['p50'] and latency['p50']:
+            change = (latency['p50'] / previous['latency_seconds']['p50'] - 1) * 100
+            throughput = previous['requests_per_second']
+            print(f"{'':<16}vs baseline: p50 {change:+.1f}%, req/s {result['requests_per_second'] - throughput:+.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default='list_models,generate,generate_stream,pull',
+                        help=f"comma-separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument('--requests', type=int, default=100, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--token-rate', type=float, default=50.0, help="mock decode speed, tokens per second")
+    parser.add_argument('--latency', type=float, default=0.1, help="mock delay before the first token")
+    parser.add_argument('--tokens', type=int, default=64, help="mock tokens per completion")
+    parser.add_argument('--app-env', action='append', default=[], metavar='KEY=VALUE',
+                        help="extra environment for the app, e.g. SCHEDULER_MAX_CONCURRENT=8")
+    parser.add_argument('--target', help="benchmark this running server instead of starting one")
+    parser.add_argument('--pid', type=int, help="process to sample memory from when using --target")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--output', help="where to save results (default: bench/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    processes = []
+    try:
+        if args.target:
+            base, pid = args.target.rstrip('/'), args.pid
+        else:
+            mock_port, app_port = free_port(), free_port()
+            processes.append(start_process([
+                os.path.join('bench', 'mock_ollama.py'), '--port', str(mock_port),
+                '--token-rate', str(args.token_rate), '--latency', str(args.latency),
+                '--tokens', str(args.tokens), '--pull-seconds', '0.5'
+            ]))
+            wait_until_up(f"http://127.0.0.1:{mock_port}/api/tags")
+
+            env = {"OLLAMA_API": f"http://127.0.0.1:{mock_port}", "LOG_LEVEL": "WARNING"}
+            env.update(item.split('=', 1) for item in args.app_env)
+            app = start_process([
+                '-c',
+                "from app import create_app; "
+                f"create_app().run(host='127.0.0.1', port={app_port}, threaded=True)"
+            ], env)
+            processes.append(app)
+            base, pid = f"http://127.0.0.1:{app_port}", app.pid
+            wait_until_up(f"{base}/queue_status")
+
+        results = {}
+        for name in scenarios:
+            # Pulls are slow by design; keep their count proportionate
+            total = min(args.requests, args.concurrency * 2) if name == 'pull' else args.requests
+            print(f"Running {name} ({total} requests, concurrency {args.concurrency})...", file=sys.stderr)
+            results[name] = run_scenario(base, name, total, args.concurrency, pid)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scenarios']
+    print_report(results, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '.json')
+    with open(output, 'w') as f:
+        json.dump({
+            "created": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ('compare', 'output')},
+            "scenarios": results
+        }, f, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
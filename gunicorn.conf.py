@@ -0,0 +1,31 @@
+import os
+
+# Gunicorn settings for serving the interface in production.
+#
+# gevent workers run each request in a greenlet and patch the socket module,
+# so the blocking requests calls to Ollama yield while waiting for tokens.
+# A single worker process can therefore hold hundreds of open generations
+# and streams instead of one per thread.
+#
+# Chat sessions, uploaded images, pull jobs, cancellation, the scheduler's
+# concurrency caps and model residency all live in the worker's memory, so
+# they only hold together with one worker. Concurrency comes from greenlets,
+# not processes; raise WEB_CONCURRENCY only for a deployment that uses none
+# of those features.
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+# Generations can stay silent for a long time while a model loads
+timeout = int(os.environ.get('WORKER_TIMEOUT', 600))
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker can have up to worker_connections requests in flight against
+# Ollama, so size the shared client's connection pool to match.
+os.environ.setdefault('OLLAMA_POOL_SIZE', str(worker_connections))
+
+accesslog = '-'
+errorlog = '-'